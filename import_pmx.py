@@ -3,12 +3,15 @@ import mathutils
 from mathutils import Vector
 import os
 import math
+import numpy as np
 import re
 
 from . import add_function, global_variable
 from bpy_extras.node_shader_utils import PrincipledBSDFWrapper
 
 from .pmx import pmx
+from .pmx import columns
+from .pmx import transform as pmx_transform
 from .pmx.pmx import PMMorph
 from .pmx.pmx import PMMaterial
 from .pmx.pmx import PMTexture
@@ -23,6 +26,9 @@ from typing import Tuple
 # global_variable
 GV = global_variable.Init()
 
+# convert_translate / convert_normal for whole columns
+TO_BLENDER = pmx_transform.Transform(pmx_transform.BLENDER_MATRIX, pmx_transform.BLENDER_SCALE)
+
 
 def convert_translate(vec):  # GlobalTransformation
     w = vec * 0.08
@@ -238,8 +244,8 @@ def read_pmx_data(context, filepath="",
         return arm_obj, obj_mesh
 
     textures_dic = add_textures(pmx_data, mesh, base_path)
-    mat_status = add_material(pmx_data, mesh, use_japanese_name, textures_dic)
-    set_material_and_uv(pmx_data, mesh, mat_status)
+    add_material(pmx_data, mesh, use_japanese_name, textures_dic)
+    set_material_and_uv(pmx_data, mesh)
     add_shape_key(pmx_data, mesh, obj_mesh, use_japanese_name)
 
     bpy.context.view_layer.update()
@@ -406,40 +412,29 @@ def add_vertex_group(pmx_data, mesh, obj_mesh, arm_dat, blender_bone_list, bone_
 def add_vertex(pmx_data, mesh, vert_group, vert_group_index):
     mesh.vertices.add(len(pmx_data.Vertices))
 
-    for vert_index, vert_data in enumerate(pmx_data.Vertices):
-        mesh.vertices[vert_index].co = convert_translate(vert_data.Position)
-        mesh.vertices[vert_index].normal = convert_normal(vert_data.Normal)
-        # mesh.vertices[vert_index].uv = pmx_data.Vertices[vert_index].UV
-
-        # BDEF1
-        if vert_data.Type == 0:
-            vert_group[vert_group_index[vert_data.Bones[0]]].add([vert_index], 1.0, 'REPLACE')
-
-        # BDEF2
-        elif vert_data.Type == 1:
-            vert_group[vert_group_index[vert_data.Bones[0]]].add([vert_index], vert_data.Weights[0], 'ADD')
-            vert_group[vert_group_index[vert_data.Bones[1]]].add([vert_index], 1.0 - vert_data.Weights[0], 'ADD')
-
-        # BDEF4
-        elif vert_data.Type == 2:
-            vert_group[vert_group_index[vert_data.Bones[0]]].add([vert_index], vert_data.Weights[0], 'ADD')
-            vert_group[vert_group_index[vert_data.Bones[1]]].add([vert_index], vert_data.Weights[1], 'ADD')
-            vert_group[vert_group_index[vert_data.Bones[2]]].add([vert_index], vert_data.Weights[2], 'ADD')
-            vert_group[vert_group_index[vert_data.Bones[3]]].add([vert_index], vert_data.Weights[3], 'ADD')
-
-        # SDEF
-        elif vert_data.Type == 3:
-            vert_group[vert_group_index[vert_data.Bones[0]]].add([vert_index], vert_data.Weights[0], 'ADD')
-            vert_group[vert_group_index[vert_data.Bones[1]]].add([vert_index], 1.0 - vert_data.Weights[0], 'ADD')
-            # Todo? SDEF
-
-        # QDEF
-        elif vert_data.Type == 4:
-            vert_group[vert_group_index[vert_data.Bones[0]]].add([vert_index], vert_data.Weights[0], 'ADD')
-            vert_group[vert_group_index[vert_data.Bones[1]]].add([vert_index], vert_data.Weights[1], 'ADD')
-            vert_group[vert_group_index[vert_data.Bones[2]]].add([vert_index], vert_data.Weights[2], 'ADD')
-            vert_group[vert_group_index[vert_data.Bones[3]]].add([vert_index], vert_data.Weights[3], 'ADD')
-            # Todo? QDEF
+    co = TO_BLENDER.points(columns.position_columns(pmx_data.Vertices))
+    normal = TO_BLENDER.normals(columns.normal_columns(pmx_data.Vertices))
+    mesh.vertices.foreach_set("co", co.ravel())
+    mesh.vertices.foreach_set("normal", normal.ravel())
+
+    # BDEF1/BDEF2/BDEF4/SDEF/QDEF weights, one add() per (bone, weight) run
+    # Todo? SDEF, QDEF
+    bone_vertex = pmx_data.bone_vertex_index()
+    for bone_index in range(len(bone_vertex)):
+        verts, weights = bone_vertex.lookup(bone_index)
+        if len(verts) == 0:
+            continue
+
+        group = vert_group[vert_group_index[bone_index]]
+        uniq_weights, inverse = np.unique(weights, return_inverse=True)
+        if len(uniq_weights) == 1:
+            group.add(verts.tolist(), float(uniq_weights[0]), 'ADD')
+            continue
+
+        order = np.argsort(inverse, kind='stable')
+        runs = np.split(verts[order], np.cumsum(np.bincount(inverse))[:-1])
+        for weight, run in zip(uniq_weights.tolist(), runs):
+            group.add(run.tolist(), weight, 'ADD')
 
     mesh.update()
 
@@ -525,7 +520,7 @@ def add_material(pmx_data, mesh, use_japanese_name, textures_dic):
     mesh.update()
     return mat_status
 
-def set_material_and_uv(pmx_data, mesh, mat_status):
+def set_material_and_uv(pmx_data, mesh):
     # Set Material & UV
     # Set UV Layer
     if mesh.uv_layers.active_index < 0:
@@ -533,33 +528,26 @@ def set_material_and_uv(pmx_data, mesh, mat_status):
 
     mesh.uv_layers.active_index = 0
 
-    uv_data = mesh.uv_layers.active.data[:]
-
     # uvtex = mesh.uv_textures.new("UV_Data")
     # uv_data = uvtex.data
 
-    index = 0
-    for dat in mat_status:
-        for i in range(dat[1] // 3):
-            # Set Material
-            mesh.polygons[index].material_index = dat[0]
-
-            # Set UV
-            poly_vert_index = mesh.polygons[index].loop_start
-            uv_data[poly_vert_index + 0].uv = pmx_data.Vertices[mesh.polygons[index].vertices[0]].UV
-            uv_data[poly_vert_index + 1].uv = pmx_data.Vertices[mesh.polygons[index].vertices[1]].UV
-            uv_data[poly_vert_index + 2].uv = pmx_data.Vertices[mesh.polygons[index].vertices[2]].UV
+    # Set Material
+    poly_count = len(mesh.polygons)
+    tri_material = pmx_data.material_ranges().triangle_materials()[:poly_count]
+    material_index = np.zeros(poly_count, dtype=np.int32)
+    material_index[:len(tri_material)] = tri_material
+    mesh.polygons.foreach_set("material_index", material_index)
 
-            # Inv UV V
-            uv_data[poly_vert_index + 0].uv[1] = 1 - uv_data[poly_vert_index + 0].uv[1]
-            uv_data[poly_vert_index + 1].uv[1] = 1 - uv_data[poly_vert_index + 1].uv[1]
-            uv_data[poly_vert_index + 2].uv[1] = 1 - uv_data[poly_vert_index + 2].uv[1]
+    # Set UV (Inv UV V)
+    vert_uv = columns.uv_columns(pmx_data.Vertices)
+    vert_uv[:, 1] = 1.0 - vert_uv[:, 1]
+    loop_vertex = np.zeros(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loop_vertex)
+    mesh.uv_layers.active.data.foreach_set("uv", vert_uv[loop_vertex].ravel())
 
-            # TwoSide 2.6 not use?
-            # todo set parameter
-            # uv_data[index].use_twoside = True
-
-            index = index + 1
+    # TwoSide 2.6 not use?
+    # todo set parameter
+    # uv_data[index].use_twoside = True
 
     mesh.update()
 
@@ -571,14 +559,19 @@ def add_shape_key(pmx_data, mesh, obj_mesh, use_japanese_name):
             obj_mesh.shape_key_add(name="Basis", from_mix=False)
             mesh.update()
 
+        basis_co = TO_BLENDER.points(columns.position_columns(pmx_data.Vertices))
+
         for data in pmx_data.Morphs:
             # Vertex Morph
             if data.Type == 1:
                 blender_morph_name = Get_JP_or_EN_Name(data.Name, data.Name_E, use_japanese_name)
                 temp_key = obj_mesh.shape_key_add(name=blender_morph_name, from_mix=False)
 
-                for v in data.Offsets:
-                    temp_key.data[v.Index].co += convert_translate(v.Move)
+                key_co = basis_co.copy()
+                index = np.fromiter((v.Index for v in data.Offsets), dtype=np.int64, count=len(data.Offsets))
+                move = np.array([v.Move.to_tuple() for v in data.Offsets], dtype=np.float64).reshape(-1, 3)
+                np.add.at(key_co, index, TO_BLENDER.vectors(move))
+                temp_key.data.foreach_set("co", key_co.ravel())
 
                 mesh.update()
 
@@ -0,0 +1,154 @@
+#
+# bounds.py : axis aligned boxes and bounding spheres of vertex groups
+#
+# Groups are the vertices drawn by each material, the vertices whose
+# strongest influence is each bone, and the whole model. Every group keeps
+# its members as CSR over a copy of the positions, plus the transposed CSR
+# (vertex -> groups). After editing the vertices of a range the boxes of
+# the groups holding them grow to take in the new positions; only groups
+# where a moved vertex lay on a face of the box, which may shrink, are
+# reduced again. Spheres are centred on the box and reach the farthest
+# member after a reduce; growing moves the centre and widens the radius
+# by the shift, so they still hold every member but may be loose.
+#
+
+import numpy as np
+
+from . import columns
+from .index import csr_offsets
+
+
+class GroupBounds(object):
+    # CSR membership and bounds of each group
+    #    offsets[g]:offsets[g + 1] slices members (vertex ids, ascending)
+    #    owner    | (entries,) group of each member entry
+    #    by_vertex[vertex_offsets[v]:vertex_offsets[v + 1]] | entries of vertex v
+    #    lo, hi   | (groups, 3) box corners, +inf / -inf for empty groups
+    #    center   | (groups, 3); radius (groups,), 0 for empty groups
+
+    def __init__(self, offsets, members, vertex_count):
+        self.offsets = offsets
+        self.members = members
+        self.owner = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+        self.by_vertex = np.argsort(members, kind='stable')
+        self.vertex_offsets = csr_offsets(members, vertex_count)
+        count = len(offsets) - 1
+        self.lo = np.full((count, 3), np.inf)
+        self.hi = np.full((count, 3), -np.inf)
+        self.center = np.zeros((count, 3))
+        self.radius = np.zeros(count)
+
+    @classmethod
+    def build(cls, groups, vertices, group_count, positions):
+        '''Groups from (group, vertex) pairs; repeated pairs count once.'''
+        span = len(positions) + 1
+        keys = np.unique(np.asarray(groups, dtype=np.int64) * span + vertices)
+        bounds = cls(csr_offsets(keys // span, group_count), keys % span, len(positions))
+        bounds.refresh(positions, np.arange(group_count))
+        return bounds
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def counts(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def groups_of(self, mask) -> np.ndarray:
+        '''Groups holding any vertex set in the (vertices,) boolean mask.'''
+        return np.unique(self.owner[mask[self.members]])
+
+    def range_entries(self, start, end) -> np.ndarray:
+        '''Member entries of the vertices start:end.'''
+        return self.by_vertex[self.vertex_offsets[start]:self.vertex_offsets[end]]
+
+    def grow(self, positions, old, start, end):
+        '''Take in vertices start:end moved from old (end - start, 3) to positions[start:end].'''
+        entries = self.range_entries(start, end)
+        if len(entries) == 0:
+            return
+        groups = self.owner[entries]
+        rows = self.members[entries] - start
+        before = old[rows]
+        face = np.any((before == self.lo[groups]) | (before == self.hi[groups]), axis=1)
+        shrink = np.unique(groups[face])
+        keep = ~np.isin(groups, shrink)
+        groups, points = groups[keep], positions[start:end][rows[keep]]
+
+        touched = np.unique(groups)
+        center = self.center[touched]
+        np.minimum.at(self.lo, groups, points)
+        np.maximum.at(self.hi, groups, points)
+        self.center[touched] = (self.lo[touched] + self.hi[touched]) / 2
+        self.radius[touched] += np.linalg.norm(self.center[touched] - center, axis=1)
+        np.maximum.at(self.radius, groups, np.linalg.norm(points - self.center[groups], axis=1))
+        self.refresh(positions, shrink)
+
+    def refresh(self, positions, groups):
+        groups = np.asarray(groups, dtype=np.int64)
+        groups = groups[self.offsets[groups + 1] > self.offsets[groups]]
+        if len(groups) == 0:
+            return
+        lengths = self.offsets[groups + 1] - self.offsets[groups]
+        run_start = np.cumsum(lengths) - lengths
+        pos = np.repeat(self.offsets[groups] - run_start, lengths) + np.arange(int(lengths.sum()))
+        points = positions[self.members[pos]]
+
+        self.lo[groups] = np.minimum.reduceat(points, run_start, axis=0)
+        self.hi[groups] = np.maximum.reduceat(points, run_start, axis=0)
+        self.center[groups] = (self.lo[groups] + self.hi[groups]) / 2
+        dist = np.linalg.norm(points - np.repeat(self.center[groups], lengths, axis=0), axis=1)
+        self.radius[groups] = np.maximum.reduceat(dist, run_start)
+
+
+def dominant_bones(vertices) -> np.ndarray:
+    _, bones, weights = columns.weight_columns(vertices)
+    if len(bones) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return bones[np.arange(len(bones)), np.argmax(weights, axis=1)].astype(np.int64)
+
+
+class ModelBounds(object):
+    # positions     | (vertices, 3) copy the groups were reduced from
+    # dominant      | (vertices,) strongest bone of each vertex
+    # materials     | GroupBounds per material (vertices of its triangles)
+    # bones         | GroupBounds per bone (vertices it dominates)
+    # model         | GroupBounds with a single group of every vertex
+
+    def __init__(self, model):
+        self.positions = columns.position_columns(model.Vertices)
+        count = len(self.positions)
+        ranges = model.material_ranges()
+        faces = model.face_array()[:int(ranges.ends[-1]) if len(ranges) else 0]
+        self.materials = GroupBounds.build(np.repeat(ranges.triangle_materials(), 3), faces.ravel(),
+                                           len(ranges), self.positions)
+        self.bone_count = len(model.Bones)
+        self.dominant = dominant_bones(model.Vertices)
+        self._build_bones()
+        self.model = GroupBounds.build(np.zeros(count, dtype=np.int64), np.arange(count), 1, self.positions)
+
+    def _build_bones(self):
+        valid = (self.dominant >= 0) & (self.dominant < self.bone_count)
+        self.bones = GroupBounds.build(self.dominant[valid], np.flatnonzero(valid), self.bone_count, self.positions)
+
+    def update(self, vertices, start, end):
+        '''Re-read vertices[start:end] (positions and weights) and refresh the groups they touch.'''
+        start, end = max(start, 0), min(end, len(self.positions))
+        if start >= end:
+            return
+        changed = vertices[start:end]
+        old = self.positions[start:end].copy()
+        self.positions[start:end] = columns.position_columns(changed)
+
+        dominant = dominant_bones(changed)
+        if np.any(dominant != self.dominant[start:end]):
+            # membership changed: rebuild the bone groups
+            self.dominant[start:end] = dominant
+            self._build_bones()
+        else:
+            self.bones.grow(self.positions, old, start, end)
+        self.materials.grow(self.positions, old, start, end)
+        self.model.grow(self.positions, old, start, end)
+
+
+def build_bounds(model) -> ModelBounds:
+    return ModelBounds(model)
@@ -0,0 +1,121 @@
+#
+# collision.py : which rigid bodies collide, as a bitset and a pair list
+#
+# A rigid belongs to one of 16 groups (PMRigid.Group) and, despite its
+# name, its NoCollision mask has bit g set when it collides with group g
+# (0xFFFF or -1: everything). Two rigids collide when each accepts the
+# other's group. The N x N relation is kept packed, one bit per pair.
+# Candidate pairs are colliding rigids whose axis aligned bounds (from the
+# sphere, box or capsule at its pose) overlap; they are found by sweeping
+# the bounds sorted along x.
+#
+
+import numpy as np
+
+from typing import Tuple
+
+from . import columns
+from . import rotation
+
+GROUPS = 16
+
+SPHERE = 0
+BOX = 1
+CAPSULE = 2
+
+
+def _vector_array(records, attr) -> np.ndarray:
+    return np.array([tuple(getattr(r, attr)) for r in records], dtype=np.float64).reshape(-1, 3)
+
+
+def rigid_extents(rigids) -> Tuple[np.ndarray, np.ndarray]:
+    '''(lo, hi) world axis aligned bounds of each rigid's shape.'''
+    center = columns.position_columns(rigids)
+    size = _vector_array(rigids, 'Size')
+    frames = rotation.euler_to_matrix(_vector_array(rigids, 'Rotate'))
+    kind = np.array([r.BoundType for r in rigids], dtype=np.int64)
+
+    half = np.zeros_like(size)
+    box = kind == BOX
+    half[box] = np.einsum('nij,nj->ni', np.abs(frames[box]), size[box])
+    # sphere: radius; capsule: radius around a segment of the height along local y
+    rounded = ~box
+    half[rounded] = size[rounded, :1]
+    capsule = kind == CAPSULE
+    half[capsule] += np.abs(frames[capsule, :, 1]) * size[capsule, 1:2] / 2
+    half = np.abs(half)
+    return center - half, center + half
+
+
+def overlapping_pairs(lo, hi) -> np.ndarray:
+    '''(pairs, 2) i < j whose boxes overlap (touching counts), by a sweep along x.'''
+    count = len(lo)
+    order = np.argsort(lo[:, 0], kind='stable')
+    lo_x = lo[order, 0]
+    # each box pairs with the later boxes starting before its end along x
+    ends = np.searchsorted(lo_x, hi[order, 0], side='right')
+    starts = np.arange(1, count + 1)
+    lengths = np.maximum(ends - starts, 0)
+    first = np.repeat(np.arange(count), lengths)
+    run_start = np.cumsum(lengths) - lengths
+    second = np.repeat(starts - run_start, lengths) + np.arange(int(lengths.sum()))
+
+    a, b = order[first], order[second]
+    hit = np.all((lo[a] <= hi[b]) & (lo[b] <= hi[a]), axis=1)
+    pairs = np.sort(np.stack((a[hit], b[hit]), axis=1), axis=1)
+    return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))] if len(pairs) else pairs.reshape(0, 2)
+
+
+class CollisionTable(object):
+    # groups   | (rigids,) PMRigid.Group
+    # accepts  | (rigids, 16) rigid collides with bodies of the group
+    # bits     | (rigids, ceil(rigids / 8)) packed collision relation, row major
+    # lo, hi   | (rigids, 3) world bounds of every shape
+    # pairs    | (pairs, 2) i < j colliding with overlapping bounds
+
+    def __init__(self, rigids):
+        count = len(rigids)
+        self.groups = np.array([r.Group for r in rigids], dtype=np.int64).clip(0, GROUPS - 1)
+        masks = np.array([r.NoCollision for r in rigids], dtype=np.int64)
+        self.accepts = (masks[:, None] >> np.arange(GROUPS) & 1) == 1
+
+        relation = self.accepts[:, self.groups]
+        relation &= relation.T
+        np.fill_diagonal(relation, False)
+        self.bits = np.packbits(relation, axis=1)
+        self.count = count
+
+        self.lo, self.hi = rigid_extents(rigids) if count else (np.zeros((0, 3)), np.zeros((0, 3)))
+        candidates = overlapping_pairs(self.lo, self.hi)
+        self.pairs = candidates[self.collides(candidates[:, 0], candidates[:, 1])]
+
+    def __len__(self):
+        return self.count
+
+    def collides(self, a, b) -> np.ndarray:
+        '''Whether rigids a and b (broadcast arrays) collide.'''
+        a, b = np.asarray(a, dtype=np.int64), np.asarray(b, dtype=np.int64)
+        return (self.bits[a, b >> 3] >> (7 - (b & 7)) & 1).astype(bool)
+
+    def matrix(self) -> np.ndarray:
+        '''Dense (rigids, rigids) boolean relation.'''
+        return np.unpackbits(self.bits, axis=1, count=self.count).astype(bool)
+
+    def group_matrix(self) -> np.ndarray:
+        '''(16, 16) True where some rigid of group g collides with some rigid of group h.'''
+        out = np.zeros((GROUPS, GROUPS), dtype=bool)
+        a, b = np.nonzero(self.matrix())
+        out[self.groups[a], self.groups[b]] = True
+        return out
+
+    def jointed_pairs(self, joints) -> np.ndarray:
+        '''Candidate pairs that a joint also connects; they fight their joint in the solver.'''
+        linked = np.array([(j.Parent, j.Child) for j in joints], dtype=np.int64).reshape(-1, 2)
+        linked = linked[np.all((linked >= 0) & (linked < self.count), axis=1)]
+        span = self.count + 1
+        keys = np.unique(np.sort(linked, axis=1) @ np.array([span, 1]))
+        return self.pairs[np.isin(self.pairs @ np.array([span, 1]), keys)]
+
+
+def build_collision_table(model) -> CollisionTable:
+    return CollisionTable(model.Rigids)
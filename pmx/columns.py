@@ -0,0 +1,119 @@
+#
+# columns.py : NumPy column views of pmx.Model data
+#
+
+import mathutils
+import numpy as np
+
+from typing import List
+from typing import Tuple
+
+# WeightType |[0:BDEF1 1:BDEF2 2:BDEF4 3:SDEF 4:QDEF]
+BDEF1 = 0
+BDEF2 = 1
+BDEF4 = 2
+SDEF = 3
+QDEF = 4
+
+MAX_INFLUENCES = 4
+
+
+def _weight_row(vert):
+    bones = vert.Bones
+    weights = vert.Weights
+
+    if vert.Type == BDEF1:
+        return (bones[0], -1, -1, -1, 1.0, 0.0, 0.0, 0.0)
+
+    elif vert.Type == BDEF2 or vert.Type == SDEF:
+        return (bones[0], bones[1], -1, -1, weights[0], 1.0 - weights[0], 0.0, 0.0)
+
+    # BDEF4, QDEF
+    return (bones[0], bones[1], bones[2], bones[3],
+            weights[0], weights[1], weights[2], weights[3])
+
+
+def weight_columns(vertices: List) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''Return (types, bones, weights) with bones/weights padded to 4 columns.
+
+    BDEF2 and SDEF store only the first weight in the file; the second
+    column is expanded to 1 - w so every row is an explicit influence list.
+    Unused slots hold bone -1 and weight 0.
+    '''
+    count = len(vertices)
+    types = np.fromiter((v.Type for v in vertices), dtype=np.int8, count=count)
+    rows = np.array([_weight_row(v) for v in vertices], dtype=np.float64).reshape(count, 8)
+    bones = rows[:, :MAX_INFLUENCES].astype(np.int32)
+    weights = rows[:, MAX_INFLUENCES:]
+    return types, bones, weights
+
+
+# Morph Type |[0:Group 1:Vertex 2:Bone 3:UV 4:ExUV1 5:ExUV2 6:ExUV3 7:ExUV4 8:Material 9:Flip 10:Impulse]
+VERTEX_MORPH_TYPES = (1, 3, 4, 5, 6, 7)
+
+
+def morph_offset_columns(morphs: List, types) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''Return (morph, row, index) for every offset of the morphs whose Type is in types.
+
+    row is the position of the offset inside PMMorph.Offsets.
+    '''
+    morph_ids = []
+    rows = []
+    indices = []
+    for (morph_index, morph) in enumerate(morphs):
+        if morph.Type not in types:
+            continue
+        count = len(morph.Offsets)
+        morph_ids.append(np.full(count, morph_index, dtype=np.int32))
+        rows.append(np.arange(count, dtype=np.int32))
+        indices.append(np.fromiter((o.Index for o in morph.Offsets), dtype=np.int32, count=count))
+
+    if not morph_ids:
+        empty = np.zeros(0, dtype=np.int32)
+        return empty, empty.copy(), empty.copy()
+    return np.concatenate(morph_ids), np.concatenate(rows), np.concatenate(indices)
+
+
+def face_columns(faces: List) -> np.ndarray:
+    # Model.Faces is a flat index list; one row per triangle
+    return np.array(faces, dtype=np.int64).reshape(-1, 3)
+
+
+def position_columns(vertices: List) -> np.ndarray:
+    count = len(vertices)
+    flat = np.fromiter((c for v in vertices for c in v.Position), dtype=np.float64, count=count * 3)
+    return flat.reshape(count, 3)
+
+
+def normal_columns(vertices: List) -> np.ndarray:
+    count = len(vertices)
+    flat = np.fromiter((c for v in vertices for c in v.Normal), dtype=np.float64, count=count * 3)
+    return flat.reshape(count, 3)
+
+
+def uv_columns(vertices: List) -> np.ndarray:
+    count = len(vertices)
+    flat = np.fromiter((c for v in vertices for c in v.UV), dtype=np.float64, count=count * 2)
+    return flat.reshape(count, 2)
+
+
+def sdef_columns(vertices: List) -> Tuple[np.ndarray, np.ndarray]:
+    # (vertex ids, params) with params[:, 0:3] = C, R0, R1 of every SDEF vertex
+    ids = np.array([i for (i, v) in enumerate(vertices) if v.Type == SDEF], dtype=np.int64)
+    params = np.array([[tuple(vertices[i].Weights[j]) for j in (1, 2, 3)] for i in ids.tolist()],
+                      dtype=np.float64).reshape(-1, 3, 3)
+    return ids, params
+
+
+def store_vectors(records: List, attr: str, values: np.ndarray):
+    # write an (n, k) array back as mathutils.Vector attributes
+    for (rec, value) in zip(records, values.tolist()):
+        setattr(rec, attr, mathutils.Vector(value))
+
+
+def store_sdef(vertices: List, ids: np.ndarray, params: np.ndarray):
+    for (i, param) in zip(ids.tolist(), params.tolist()):
+        weights = vertices[i].Weights
+        weights[1] = mathutils.Vector(param[0])
+        weights[2] = mathutils.Vector(param[1])
+        weights[3] = mathutils.Vector(param[2])
@@ -0,0 +1,181 @@
+#
+# compact.py : morph offset compaction
+#
+# Sculpted shape keys carry many offsets that move nothing, and merged or
+# hand edited morphs may list one vertex twice. Both cost an index plus the
+# payload in the morph section. Offsets of additive kinds (vertex, UV and
+# group) are summed per index; those and bone offsets within epsilon of
+# "no effect" are dropped. Morphs that end up empty or identical to an
+# earlier one are reported; they are kept, as other morphs, display frames
+# and animations refer to morphs by index.
+#
+
+import numpy as np
+
+from dataclasses import dataclass
+from dataclasses import field
+
+from typing import List
+from typing import Tuple
+
+from . import columns
+from . import morphs as pmx_morphs
+from . import saveplan
+
+EPSILON = 1e-5
+
+# payload bytes per offset after the index, by morph type
+PAYLOAD_BYTES = {0: 4, 1: 12, 2: 28, 3: 16, 4: 16, 5: 16, 6: 16, 7: 16, 8: 113, 9: 4, 10: 25}
+
+UV_TYPES = (3, 4, 5, 6, 7)
+
+
+@dataclass
+class CompactReport:
+    removed_offsets: List[int] = field(default_factory=list)  # per morph, near zero
+    merged_offsets: List[int] = field(default_factory=list)   # per morph, folded duplicates
+    bytes_before: List[int] = field(default_factory=list)     # per morph offset block
+    bytes_after: List[int] = field(default_factory=list)
+    empty: List[int] = field(default_factory=list)            # morphs without offsets
+    identical: List[Tuple[int, int]] = field(default_factory=list)  # (morph, first equal morph)
+
+    @property
+    def bytes_saved(self) -> int:
+        return sum(self.bytes_before) - sum(self.bytes_after)
+
+
+def offset_bytes(model) -> np.ndarray:
+    '''Bytes of every morph's offset list as Model.Save writes it.'''
+    widths = {kind: saveplan.width_of(len(getattr(model, attr)), is_vert)[1]
+              for (kind, (attr, is_vert)) in saveplan.SECTIONS.items()}
+    per_offset = {t: widths[kind] + PAYLOAD_BYTES[t] for (t, kind) in saveplan.MORPH_OFFSET_KIND.items()}
+    return np.array([per_offset.get(m.Type, 0) * len(m.Offsets) for m in model.Morphs], dtype=np.int64)
+
+
+def offset_values(morph) -> np.ndarray:
+    '''(offsets, k) payload of a morph's offsets, the layout depends on Type.'''
+    count = len(morph.Offsets)
+    if morph.Type in (0, 9):
+        rows = [(o.Power,) for o in morph.Offsets]
+    elif morph.Type == 1:
+        rows = [tuple(o.Move) for o in morph.Offsets]
+    elif morph.Type == 2:
+        rows = [tuple(o.Move) + tuple(o.Rotate) for o in morph.Offsets]
+    elif morph.Type in UV_TYPES:
+        rows = [tuple(o.UV) for o in morph.Offsets]
+    elif morph.Type == 8:
+        rows = [(o.MatEffectType,) + pmx_morphs.material_offset(o) for o in morph.Offsets]
+    else:
+        rows = [(o.IsLocal,) + tuple(o.Move) + tuple(o.Torque) for o in morph.Offsets]
+    return np.array(rows, dtype=np.float64).reshape(count, -1)
+
+
+def _idle_bones(values, epsilon):
+    # no move and a rotation of (near) zero angle; q and -q are the same
+    return np.all(np.abs(values[:, :6]) <= epsilon, axis=1) & (np.abs(np.abs(values[:, 6]) - 1.0) <= epsilon)
+
+
+def compact_offsets(morph_ids, index, values, epsilon) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''Fold (morph, index) duplicates into their first entry and drop negligible rows.
+
+    Returns (keep, merged, summed): keep masks the surviving entries, merged
+    the entries folded into an earlier one, summed holds the (entries, k)
+    values with duplicates added into the kept ones.
+    '''
+    keys = morph_ids.astype(np.int64) * (int(index.max()) + 2 if len(index) else 1) + index + 1
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    summed = values.copy()
+    merged = np.ones(len(keys), dtype=bool)
+    merged[first] = False
+    if merged.any():
+        for c in range(values.shape[1]):
+            summed[first, c] = np.bincount(inverse, weights=values[:, c], minlength=len(first))
+    keep = ~merged & ~np.all(np.abs(summed) <= epsilon, axis=1)
+    return keep, merged, summed
+
+
+def _vertex_morphs(model, epsilon, report):
+    # vertex and UV morphs in one pass over the columns
+    morph_ids, rows, index = columns.morph_offset_columns(model.Morphs, (1,) + UV_TYPES)
+    if len(morph_ids) == 0:
+        return
+    values = np.zeros((len(morph_ids), 4))
+    starts = np.flatnonzero(np.diff(morph_ids, prepend=-1))
+    for (start, end) in zip(starts.tolist(), np.append(starts[1:], len(morph_ids)).tolist()):
+        block = offset_values(model.Morphs[morph_ids[start]])
+        values[start:end, :block.shape[1]] = block
+
+    keep, merged, summed = compact_offsets(morph_ids, index, values, epsilon)
+    count = len(model.Morphs)
+    removed = np.bincount(morph_ids[~keep & ~merged], minlength=count)
+    folded = np.bincount(morph_ids[merged], minlength=count)
+
+    for m in np.flatnonzero(removed + folded).tolist():
+        morph = model.Morphs[m]
+        span = np.flatnonzero(morph_ids == m)
+        kept = span[keep[span]]
+        offsets = [morph.Offsets[r] for r in rows[kept].tolist()]
+        if morph.Type == 1:
+            columns.store_vectors(offsets, 'Move', summed[kept, :3])
+        else:
+            columns.store_vectors(offsets, 'UV', summed[kept])
+        morph.Offsets = offsets
+        report.removed_offsets[m] += int(removed[m])
+        report.merged_offsets[m] += int(folded[m])
+
+
+def _other_morphs(model, epsilon, report):
+    # group offsets add up; bone offsets are only dropped when they do nothing
+    for (m, morph) in enumerate(model.Morphs):
+        if morph.Type not in (0, 2) or len(morph.Offsets) == 0:
+            continue
+        values = offset_values(morph)
+        if morph.Type == 0:
+            index = np.array([o.Index for o in morph.Offsets], dtype=np.int64)
+            keep, merged, summed = compact_offsets(np.zeros(len(index), dtype=np.int64), index, values, epsilon)
+        else:
+            keep = ~_idle_bones(values, epsilon)
+            merged = np.zeros(len(keep), dtype=bool)
+        if keep.all():
+            continue
+        morph.Offsets = [o for (o, k) in zip(morph.Offsets, keep.tolist()) if k]
+        if morph.Type == 0:
+            for (o, power) in zip(morph.Offsets, summed[keep, 0].tolist()):
+                o.Power = power
+        report.removed_offsets[m] += int(np.count_nonzero(~keep & ~merged))
+        report.merged_offsets[m] += int(np.count_nonzero(merged))
+
+
+def morph_signature(morph) -> bytes:
+    # equal signatures: same type and the same offsets up to order (flips
+    # pick by position, so their order counts)
+    values = offset_values(morph)
+    index = np.array([o.Index for o in morph.Offsets], dtype=np.int64)
+    if morph.Type != 9 and len(index):
+        order = np.lexsort(np.vstack((values.T[::-1], index)))
+        index, values = index[order], values[order]
+    return bytes([morph.Type]) + index.tobytes() + values.tobytes()
+
+
+def compact_morphs(model, epsilon=EPSILON) -> CompactReport:
+    count = len(model.Morphs)
+    report = CompactReport()
+    report.removed_offsets = [0] * count
+    report.merged_offsets = [0] * count
+    report.bytes_before = offset_bytes(model).tolist()
+
+    _vertex_morphs(model, epsilon, report)
+    _other_morphs(model, epsilon, report)
+    if sum(report.removed_offsets) + sum(report.merged_offsets):
+        model.invalidate('Morphs')
+
+    report.bytes_after = offset_bytes(model).tolist()
+    report.empty = [m for (m, morph) in enumerate(model.Morphs) if len(morph.Offsets) == 0]
+    seen = {}
+    for (m, morph) in enumerate(model.Morphs):
+        if len(morph.Offsets) == 0:
+            continue
+        first = seen.setdefault(morph_signature(morph), m)
+        if first != m:
+            report.identical.append((m, first))
+    return report
@@ -0,0 +1,407 @@
+#
+# decimate.py : quadric error edge collapse for headless LOD generation
+#
+# Garland-Heckbert quadrics, collapsed in passes: each pass prices every
+# collapsible edge at once and takes cheapest edges no two of which touch
+# the same triangle, so a pass is a handful of array operations whatever
+# the mesh size. Vertices on open borders (UV seams are split vertices in
+# PMX, so they are borders too) and vertices shared by several materials
+# never move; interior vertices may collapse onto them. The surviving
+# vertex takes position, normal, UVs, edge size, weights and vertex/UV
+# morph offsets interpolated along the collapsed edge.
+#
+
+import mathutils
+import numpy as np
+
+from dataclasses import dataclass
+
+from . import columns
+from . import remap
+from . import weights as pmx_weights
+
+MIN_NORMAL_DOT = 0.2  # a collapse may not turn a triangle further than ~78 degrees
+
+
+@dataclass
+class DecimateReport:
+    triangles_before: int = 0
+    triangles_after: int = 0
+    vertices_before: int = 0
+    vertices_after: int = 0
+    passes: int = 0
+
+
+def mesh_edges(faces, count):
+    '''Unique (a, b) edges with a < b and the number of triangles using each.'''
+    pairs = np.sort(faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+    keys, uses = np.unique(pairs[:, 0] * count + pairs[:, 1], return_counts=True)
+    return np.stack((keys // count, keys % count), axis=1), uses
+
+
+def face_quadrics(positions, faces) -> np.ndarray:
+    '''(vertices, 4, 4) sum of the area weighted plane quadrics around each vertex.'''
+    p0 = positions[faces[:, 0]]
+    cross = np.cross(positions[faces[:, 1]] - p0, positions[faces[:, 2]] - p0)
+    area2 = np.linalg.norm(cross, axis=1)
+    normal = cross / np.where(area2 > 0, area2, 1.0)[:, None]
+    plane = np.concatenate((normal, -np.sum(normal * p0, axis=1, keepdims=True)), axis=1)
+    quadric = (plane[:, :, None] * plane[:, None, :] * (area2 / 2)[:, None, None]).reshape(-1, 16)
+
+    corner = faces.ravel()
+    out = np.empty((len(positions), 16))
+    for k in range(16):
+        out[:, k] = np.bincount(corner, weights=np.repeat(quadric[:, k], 3), minlength=len(positions))
+    return out.reshape(-1, 4, 4)
+
+
+def locked_vertices(faces, material, count) -> np.ndarray:
+    '''Vertices on border / non-manifold edges or used by more than one material.'''
+    locked = np.zeros(count, dtype=bool)
+    edges, uses = mesh_edges(faces, count)
+    locked[edges[uses != 2].ravel()] = True
+
+    corner = faces.ravel()
+    corner_material = np.repeat(material, 3)
+    low = np.full(count, np.iinfo(np.int64).max)
+    high = np.full(count, -1)
+    np.minimum.at(low, corner, corner_material)
+    np.maximum.at(high, corner, corner_material)
+    locked |= (high >= 0) & (low != high)
+    return locked
+
+
+def _cost(quadric, point):
+    point = np.concatenate((point, np.ones((len(point), 1))), axis=1)
+    return np.einsum('ei,eij,ej->e', point, quadric, point)
+
+
+def _place(quadric, pu, pv, lock_u, lock_v):
+    '''(position, t, cost) of each collapse; t is the share of v in the result.'''
+    edge = pv - pu
+    length2 = np.sum(edge * edge, axis=1)
+    candidates = [pu, pv, (pu + pv) / 2]
+    shares = [np.zeros(len(pu)), np.ones(len(pu)), np.full(len(pu), 0.5)]
+
+    # the quadric minimum, kept when well conditioned and near the edge
+    a = quadric[:, :3, :3]
+    scale = np.trace(a, axis1=1, axis2=2) / 3
+    solvable = np.abs(np.linalg.det(a)) > 1e-9 * np.maximum(scale, 1e-30) ** 3
+    best = pu.copy()
+    if solvable.any():
+        best[solvable] = np.linalg.solve(a[solvable], -quadric[solvable, :3, 3:])[..., 0]
+    t = np.clip(np.sum((best - pu) * edge, axis=1) / np.where(length2 > 0, length2, 1.0), 0.0, 1.0)
+    away = np.sum((best - (pu + t[:, None] * edge)) ** 2, axis=1)
+    solvable &= away <= length2
+    candidates.append(np.where(solvable[:, None], best, pu))
+    shares.append(np.where(solvable, t, 0.0))
+
+    # a locked end stays where it is
+    allowed = np.ones((len(pu), 4), dtype=bool)
+    allowed[:, 3] = solvable
+    allowed[lock_u] = (True, False, False, False)
+    allowed[lock_v] = (False, True, False, False)
+    costs = np.where(allowed, np.stack([_cost(quadric, c) for c in candidates], axis=1), np.inf)
+    pick = np.argmin(costs, axis=1)
+    rows = np.arange(len(pu))
+    position = np.stack(candidates, axis=1)[rows, pick]
+    share = np.stack(shares, axis=1)[rows, pick]
+    return position, share, costs[rows, pick]
+
+
+def _independent(edges, keys, faces, count, active, rounds=8):
+    '''Mask of edges no two of which touch one triangle, cheapest (lowest key) first.
+
+    Each round takes the edges whose key is the smallest around every
+    triangle at either end, then drops the edges they conflict with.
+    '''
+    big = np.iinfo(np.int64).max
+    chosen = np.zeros(len(edges), dtype=bool)
+    active = active.copy()
+    for _ in range(rounds):
+        if not active.any():
+            break
+        vertex_min = np.full(count, big)
+        np.minimum.at(vertex_min, edges[active, 0], keys[active])
+        np.minimum.at(vertex_min, edges[active, 1], keys[active])
+        ring_min = vertex_min.copy()
+        np.minimum.at(ring_min, faces.ravel(), np.repeat(vertex_min[faces].min(axis=1), 3))
+        picked = active & (ring_min[edges[:, 0]] == keys) & (ring_min[edges[:, 1]] == keys)
+        chosen |= picked
+
+        # every vertex of a triangle around a picked edge is taken
+        ends = np.zeros(count, dtype=bool)
+        ends[edges[picked].ravel()] = True
+        taken = np.zeros(count, dtype=bool)
+        taken[faces[ends[faces].any(axis=1)].ravel()] = True
+        active &= ~(taken[edges[:, 0]] | taken[edges[:, 1]])
+    return chosen
+
+
+def _common_neighbours(all_edges, edges, count):
+    # number of vertices adjacent to both ends of each edge
+    ends = np.concatenate((all_edges, all_edges[:, ::-1]))
+    order = np.argsort(ends[:, 0], kind='stable')
+    neighbours = ends[order, 1]
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(ends[:, 0], minlength=count), out=offsets[1:])
+
+    keys = []
+    for end in (0, 1):
+        v = edges[:, end]
+        lengths = offsets[v + 1] - offsets[v]
+        owner = np.repeat(np.arange(len(edges)), lengths)
+        run_start = np.cumsum(lengths) - lengths
+        pos = np.repeat(offsets[v] - run_start, lengths) + np.arange(int(lengths.sum()))
+        keys.append(owner * count + neighbours[pos])
+    shared = np.intersect1d(keys[0], keys[1], assume_unique=True)
+    return np.bincount(shared // count, minlength=len(edges))
+
+
+def _normals(positions, faces):
+    p0 = positions[..., 0, :]
+    cross = np.cross(positions[..., 1, :] - p0, positions[..., 2, :] - p0)
+    length = np.linalg.norm(cross, axis=-1, keepdims=True)
+    return cross / np.where(length > 0, length, 1.0), length[..., 0]
+
+
+class EdgeCollapse(object):
+    # Working columns, indexed by original vertex id until write back
+    #    positions, normals, uv, append_uv, edge_size | per vertex attributes
+    #    types, bones, weights    | columns.weight_columns layout
+    #    quadrics                 | (vertices, 4, 4)
+    #    locked, alive, touched   | (vertices,) bool; touched needs write back
+    #    placed, dirty            | last pass placements; vertices changed since
+    #    faces, material          | live triangles and their material
+    #    morph_*                  | vertex/UV morph offsets: morph, row in
+    #                               PMMorph.Offsets, vertex, value (Move or UV)
+
+    def __init__(self, model):
+        vertices = model.Vertices
+        count = len(vertices)
+        self.positions = columns.position_columns(vertices)
+        self.normals = columns.normal_columns(vertices)
+        self.uv = columns.uv_columns(vertices)
+        uv_count = model.Status.AppendUVCount
+        self.append_uv = np.array([[tuple(uv) for uv in v.AppendUV[:uv_count]] for v in vertices],
+                                  dtype=np.float64).reshape(count, uv_count, 4)
+        self.edge_size = np.array([v.EdgeSize for v in vertices], dtype=np.float64)
+        self.types, self.bones, self.weights = columns.weight_columns(vertices)
+
+        self.faces = model.face_array().astype(np.int64)
+        self.material = model.material_ranges().triangle_materials().astype(np.int64)[:len(self.faces)]
+        self.quadrics = face_quadrics(self.positions, self.faces)
+        self.locked = locked_vertices(self.faces, self.material, count)
+        self.alive = np.ones(count, dtype=bool)
+        self.touched = np.zeros(count, dtype=bool)
+        self.dirty = np.zeros(count, dtype=bool)
+        self.placed = None
+
+        self.morph_ids, self.morph_rows, self.morph_vertex = (
+            a.astype(np.int64) for a in columns.morph_offset_columns(model.Morphs, columns.VERTEX_MORPH_TYPES))
+        self.morph_values = np.zeros((len(self.morph_ids), 4))
+        for (i, (m, r)) in enumerate(zip(self.morph_ids.tolist(), self.morph_rows.tolist())):
+            offset = model.Morphs[m].Offsets[r]
+            self.morph_values[i] = tuple(offset.Move) + (0.0,) if model.Morphs[m].Type == 1 else tuple(offset.UV)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def _placements(self, edges):
+        # (position, share, cost) per edge; edges between untouched vertices
+        # reuse the previous pass
+        count = len(self)
+        u, v = edges[:, 0], edges[:, 1]
+        keys = u * count + v
+        position = np.empty((len(edges), 3))
+        share = np.empty(len(edges))
+        cost = np.empty(len(edges))
+        todo = np.ones(len(edges), dtype=bool)
+        if self.placed is not None:
+            old_keys, old_position, old_share, old_cost = self.placed
+            at = np.minimum(np.searchsorted(old_keys, keys), max(len(old_keys) - 1, 0))
+            found = (old_keys[at] == keys) & ~self.dirty[u] & ~self.dirty[v] if len(old_keys) else ~todo
+            position[found], share[found], cost[found] = old_position[at[found]], old_share[at[found]], \
+                old_cost[at[found]]
+            todo = ~found
+        u, v = u[todo], v[todo]
+        position[todo], share[todo], cost[todo] = _place(self.quadrics[u] + self.quadrics[v], self.positions[u],
+                                                         self.positions[v], self.locked[u], self.locked[v])
+        self.placed = (keys, position, share, cost)
+        self.dirty[:] = False
+        return position, share, cost
+
+    def step(self, budget) -> int:
+        '''Collapse up to budget edges; returns the number collapsed, 0 when stuck.'''
+        count = len(self)
+        all_edges, _ = mesh_edges(self.faces, count)
+        edges = all_edges[~(self.locked[all_edges[:, 0]] & self.locked[all_edges[:, 1]])]
+        if len(edges) == 0:
+            return 0
+        position, share, cost = self._placements(edges)
+
+        # equal costs (flat regions) are ordered at random, a fixed order
+        # would leave few local minima
+        keys = np.empty(len(edges), dtype=np.int64)
+        shuffle = np.random.default_rng(len(edges)).permutation(len(edges))
+        keys[np.lexsort((shuffle, cost))] = np.arange(len(edges))
+        open_edges = np.ones(len(edges), dtype=bool)
+        while open_edges.any():
+            chosen = np.flatnonzero(_independent(edges, keys, self.faces, count, open_edges))
+            chosen = chosen[np.argsort(keys[chosen])][:budget]
+
+            # link condition: the two triangles of the edge are the only shared ring
+            good = _common_neighbours(all_edges, edges[chosen], count) == 2
+            good &= self._keeps_orientation(edges[chosen], position[chosen])
+            if good.any():
+                chosen = chosen[good]
+                self._collapse(edges[chosen], position[chosen], share[chosen])
+                return len(chosen)
+            # every pick was rejected: retry without them
+            open_edges[chosen] = False
+        return 0
+
+    def _keeps_orientation(self, edges, position):
+        owner = np.full(len(self), -1)
+        owner[edges[:, 0]] = np.arange(len(edges))
+        owner[edges[:, 1]] = np.arange(len(edges))
+        face_owner = owner[self.faces].max(axis=1)
+        around = np.flatnonzero(face_owner >= 0)
+        faces = self.faces[around]
+        e = face_owner[around]
+        removed = (np.any(faces == edges[e, 0:1], axis=1)) & (np.any(faces == edges[e, 1:2], axis=1))
+        around, faces, e = around[~removed], faces[~removed], e[~removed]
+
+        before = self.positions[faces]
+        after = before.copy()
+        moved = owner[faces] >= 0
+        after[moved] = position[np.broadcast_to(e[:, None], faces.shape)[moved]]
+        old, _ = _normals(before, faces)
+        new, area = _normals(after, faces)
+        bad = (np.sum(old * new, axis=1) < MIN_NORMAL_DOT) | (area == 0)
+        ok = np.ones(len(edges), dtype=bool)
+        ok[e[bad]] = False
+        return ok
+
+    def _collapse(self, edges, position, share):
+        u, v = edges[:, 0], edges[:, 1]
+        keep_u = self.locked[u] | (~self.locked[v] & (share < 0.5))
+        s = np.where(keep_u, u, v)
+        r = np.where(keep_u, v, u)
+        a = (1.0 - share)[:, None]
+        b = share[:, None]
+
+        self.positions[s] = position
+        normal = a * self.normals[u] + b * self.normals[v]
+        length = np.linalg.norm(normal, axis=1, keepdims=True)
+        self.normals[s] = np.where(length > 0, normal / np.where(length > 0, length, 1.0), self.normals[s])
+        self.uv[s] = a * self.uv[u] + b * self.uv[v]
+        self.append_uv[s] = a[:, :, None] * self.append_uv[u] + b[:, :, None] * self.append_uv[v]
+        self.edge_size[s] = a[:, 0] * self.edge_size[u] + b[:, 0] * self.edge_size[v]
+        self.quadrics[s] = self.quadrics[u] + self.quadrics[v]
+        self._blend_weights(s, r, np.where(keep_u, a[:, 0], b[:, 0]))
+        self._carry_morphs(u, v, s, share)
+
+        target = np.arange(len(self))
+        target[r] = s
+        self.faces = target[self.faces]
+        live = (self.faces[:, 0] != self.faces[:, 1]) & (self.faces[:, 1] != self.faces[:, 2]) \
+            & (self.faces[:, 2] != self.faces[:, 0])
+        self.faces, self.material = self.faces[live], self.material[live]
+        self.alive[r] = False
+        self.touched[s] = True
+        self.dirty[s] = True
+
+    def _blend_weights(self, s, r, keep):
+        # survivor's slots first so SDEF keeps its pair order, then the 4 strongest
+        bones = np.concatenate((self.bones[s], self.bones[r]), axis=1)
+        weights = np.concatenate((self.weights[s] * keep[:, None], self.weights[r] * (1 - keep)[:, None]), axis=1)
+        weights = pmx_weights.merge_duplicates(bones, np.where(bones >= 0, weights, 0.0))
+        strongest = np.sort(np.argsort(-weights, axis=1, kind='stable')[:, :columns.MAX_INFLUENCES], axis=1)
+        bones = np.take_along_axis(bones, strongest, axis=1)
+        weights = np.take_along_axis(weights, strongest, axis=1)
+        self.types[s], self.bones[s], self.weights[s] = pmx_weights.normalize_columns(self.types[s], bones, weights)
+
+    def _carry_morphs(self, u, v, s, share):
+        factor = np.full(len(self), np.nan)
+        factor[u] = 1.0 - share
+        factor[v] = share
+        hit = np.flatnonzero(~np.isnan(factor[self.morph_vertex]))
+        if len(hit) == 0:
+            return
+        target = np.arange(len(self))
+        target[u] = s
+        target[v] = s
+        self.morph_values[hit] *= factor[self.morph_vertex[hit]][:, None]
+        self.morph_vertex[hit] = target[self.morph_vertex[hit]]
+
+        # offsets of both ends in one morph fold into the first
+        keys = self.morph_ids[hit] * len(self) + self.morph_vertex[hit]
+        uniq, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        if len(uniq) == len(hit):
+            return
+        summed = np.zeros((len(uniq), 4))
+        np.add.at(summed, inverse, self.morph_values[hit])
+        self.morph_values[hit[first]] = summed
+        drop = np.ones(len(self.morph_ids), dtype=bool)
+        drop[hit] = False
+        drop[hit[first]] = True
+        self.morph_ids, self.morph_rows = self.morph_ids[drop], self.morph_rows[drop]
+        self.morph_vertex, self.morph_values = self.morph_vertex[drop], self.morph_values[drop]
+
+    def store(self, model):
+        touched = np.flatnonzero(self.touched & self.alive).tolist()
+        vertices = [model.Vertices[i] for i in touched]
+        columns.store_vectors(vertices, 'Position', self.positions[touched])
+        columns.store_vectors(vertices, 'Normal', self.normals[touched])
+        columns.store_vectors(vertices, 'UV', self.uv[touched])
+        for (vert, i) in zip(vertices, touched):
+            vert.AppendUV[:self.append_uv.shape[1]] = [mathutils.Vector(uv) for uv in self.append_uv[i].tolist()]
+            vert.EdgeSize = float(self.edge_size[i])
+            pmx_weights.store_weights(vert, int(self.types[i]), self.bones[i].tolist(), self.weights[i].tolist())
+
+        for (m, morph) in enumerate(model.Morphs):
+            if morph.Type not in columns.VERTEX_MORPH_TYPES:
+                continue
+            mine = np.flatnonzero(self.morph_ids == m)
+            offsets = [morph.Offsets[r] for r in self.morph_rows[mine].tolist()]
+            for (o, i) in zip(offsets, self.morph_vertex[mine].tolist()):
+                o.Index = i
+            if morph.Type == 1:
+                columns.store_vectors(offsets, 'Move', self.morph_values[mine, :3])
+            else:
+                columns.store_vectors(offsets, 'UV', self.morph_values[mine])
+            morph.Offsets = offsets
+
+        model.Faces = self.faces.ravel().tolist()
+        for (material, count) in zip(model.Materials, np.bincount(self.material, minlength=len(model.Materials))):
+            material.FaceLength = int(count) * 3
+        model.invalidate()
+
+
+def decimate(model, ratio) -> DecimateReport:
+    '''Collapse edges until about ratio of the triangles remain (fewer may be
+    removed when only locked vertices are left).'''
+    if not 0 < ratio <= 1:
+        raise ValueError("ratio must be in (0, 1]")
+    report = DecimateReport()
+    report.vertices_before = len(model.Vertices)
+    report.triangles_before = len(model.Faces) // 3
+
+    target = int(np.ceil(report.triangles_before * ratio))
+    mesh = EdgeCollapse(model)
+    while len(mesh.faces) > target:
+        # an interior collapse removes two triangles
+        collapsed = mesh.step(max((len(mesh.faces) - target + 1) // 2, 1))
+        if collapsed == 0:
+            break
+        report.passes += 1
+
+    if report.passes:
+        mesh.store(model)
+        old_to_new = np.where(mesh.alive, np.cumsum(mesh.alive) - 1, -1)
+        remap.remap_vertices(model, old_to_new)
+
+    report.vertices_after = len(model.Vertices)
+    report.triangles_after = len(model.Faces) // 3
+    return report
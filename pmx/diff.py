@@ -0,0 +1,256 @@
+#
+# diff.py : structural differences between two models
+#
+# Every section is reduced to a digest first, so identical sections are
+# skipped by one comparison. Vertices and faces are hashed and compared as
+# column tables, row by row in index order. Records of the other sections
+# are flattened per attribute (strings plus a float array, morph offsets
+# as their typed payload columns), hashed, and paired by name (Path for
+# textures; repeated names by occurrence). Only pairs whose digests differ
+# are compared field by field, numbers within tolerance. Index fields are
+# compared as numbers, so inserting a bone also shows up in every record
+# that refers to the ones after it.
+#
+
+import hashlib
+
+import numpy as np
+
+from dataclasses import asdict
+from dataclasses import dataclass
+from dataclasses import field
+
+from typing import Dict
+from typing import List
+from typing import Tuple
+from typing import Union
+
+from . import columns
+from . import compact
+
+TOLERANCE = 1e-5
+
+HEADER = ('Name', 'Name_E', 'Comment', 'Comment_E')
+RECORD_SECTIONS = ('Textures', 'Materials', 'Bones', 'Morphs', 'DisplayFrames', 'Rigids', 'Joints', 'SoftBodies')
+
+# vertex table column groups, in table order
+VERTEX_FIELDS = (('Position', 3), ('Normal', 3), ('UV', 2), ('Type', 1), ('Bones', 4), ('Weights', 4),
+                 ('EdgeSize', 1), ('SDEF', 9))
+
+
+@dataclass
+class RecordChange:
+    key: Union[int, str]  # vertex / triangle index, or record name
+    fields: List[str] = field(default_factory=list)  # attributes differing beyond tolerance
+    delta: float = 0.0    # largest numeric difference, inf when the structure differs
+
+
+@dataclass
+class SectionDiff:
+    count_a: int = 0
+    count_b: int = 0
+    identical: bool = True
+    reordered: bool = False  # records present in both are in another order
+    added: List[Union[int, str]] = field(default_factory=list)
+    removed: List[Union[int, str]] = field(default_factory=list)
+    changed: List[RecordChange] = field(default_factory=list)
+
+
+@dataclass
+class DiffReport:
+    header: List[str] = field(default_factory=list)
+    sections: Dict[str, SectionDiff] = field(default_factory=dict)
+
+    @property
+    def identical(self) -> bool:
+        return not self.header and all(s.identical for s in self.sections.values())
+
+    def to_dict(self) -> dict:
+        '''JSON ready summary: only differing sections, changes as [key, delta, fields] (delta None for inf).'''
+        sections = {}
+        for (name, section) in self.sections.items():
+            if section.identical:
+                continue
+            entry = asdict(section)
+            entry['changed'] = [[c.key, c.delta if np.isfinite(c.delta) else None, c.fields]
+                                for c in section.changed]
+            del entry['identical']
+            sections[name] = entry
+        return {'identical': self.identical, 'header': list(self.header), 'sections': sections}
+
+
+def _digest(*parts) -> bytes:
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else str(part).encode('utf-8', 'surrogatepass'))
+        h.update(b'\0')
+    return h.digest()
+
+
+def vertex_table(vertices) -> np.ndarray:
+    '''(vertices, k) float columns in VERTEX_FIELDS order, then AppendUV.'''
+    count = len(vertices)
+    types, bones, weights = columns.weight_columns(vertices)
+    edge = np.fromiter((v.EdgeSize for v in vertices), dtype=np.float64, count=count)
+    sdef = np.zeros((count, 9))
+    ids, params = columns.sdef_columns(vertices)
+    sdef[ids] = params.reshape(-1, 9)
+    extra = max((len(v.AppendUV) for v in vertices), default=0)
+    append = np.zeros((count, 4 * extra))
+    for (i, v) in enumerate(vertices):
+        if v.AppendUV:
+            row = [c for uv in v.AppendUV for c in uv]
+            append[i, :len(row)] = row
+    return np.column_stack((columns.position_columns(vertices), columns.normal_columns(vertices),
+                            columns.uv_columns(vertices), types, bones, weights, edge, sdef, append))
+
+
+def _flatten(value, strings, numbers):
+    if isinstance(value, str):
+        strings.append(value)
+    elif value is None:
+        strings.append('\0None')
+    elif isinstance(value, (bool, int, float, np.integer, np.floating)):
+        numbers.append(float(value))
+    elif hasattr(value, '__dict__'):
+        for key in sorted(vars(value)):
+            _flatten(getattr(value, key), strings, numbers)
+    else:
+        items = list(value)
+        # the length keeps [a, b], [c] apart from [a], [b, c]
+        numbers.append(float(len(items)))
+        for item in items:
+            _flatten(item, strings, numbers)
+
+
+def record_fields(record) -> Dict[str, Tuple[Tuple[str, ...], np.ndarray]]:
+    '''attribute -> (strings, numbers) of a record.'''
+    fields = {}
+    for (key, value) in vars(record).items():
+        if key == 'Offsets' and hasattr(record, 'Type'):
+            index = np.array([o.Index for o in value], dtype=np.float64)
+            fields[key] = ((), np.column_stack((index, compact.offset_values(record))).ravel())
+            continue
+        strings, numbers = [], []
+        _flatten(value, strings, numbers)
+        fields[key] = (tuple(strings), np.array(numbers, dtype=np.float64))
+    return fields
+
+
+def record_digest(fields) -> bytes:
+    return _digest(*[p for key in sorted(fields) for p in (key, '\0'.join(fields[key][0]), fields[key][1].tobytes())])
+
+
+def _delta(a, b) -> float:
+    if a[0] != b[0] or a[1].shape != b[1].shape:
+        return np.inf
+    if len(a[1]) == 0:
+        return 0.0
+    gap = np.abs(a[1] - b[1])
+    gap[np.isnan(a[1]) & np.isnan(b[1])] = 0.0
+    return float(np.nanmax(np.where(np.isnan(gap), np.inf, gap)))
+
+
+def compare_fields(fa, fb, tolerance) -> Tuple[List[str], float]:
+    '''(attributes differing beyond tolerance, largest difference among them).'''
+    changed = []
+    worst = 0.0
+    for key in sorted(set(fa) | set(fb)):
+        delta = _delta(fa[key], fb[key]) if key in fa and key in fb else np.inf
+        if delta > tolerance:
+            changed.append(key)
+            worst = max(worst, delta)
+    return changed, worst
+
+
+def record_keys(records) -> List[str]:
+    # Name (Path for textures), '#k' marks the k-th repeat of a name
+    seen = {}
+    keys = []
+    for record in records:
+        name = record.Name if hasattr(record, 'Name') else record.Path
+        k = seen.get(name, 0)
+        seen[name] = k + 1
+        keys.append(name if k == 0 else '%s#%d' % (name, k))
+    return keys
+
+
+def _rows(table_a, table_b, groups, tolerance, report):
+    # index paired rows of two column tables; groups is ((name, width), ...)
+    common = min(len(table_a), len(table_b))
+    report.added = list(range(common, len(table_b)))
+    report.removed = list(range(common, len(table_a)))
+    a, b = table_a[:common], table_b[:common]
+    if a.shape[1] != b.shape[1]:
+        width = max(a.shape[1], b.shape[1])
+        a = np.pad(a, ((0, 0), (0, width - a.shape[1])))
+        b = np.pad(b, ((0, 0), (0, width - b.shape[1])))
+    gap = np.abs(a - b)
+    bounds = np.cumsum([0] + [w for (_, w) in groups])
+    tail = [('AppendUV', gap.shape[1] - bounds[-1])] if gap.shape[1] > bounds[-1] else []
+    names = [n for (n, _) in groups] + [n for (n, _) in tail]
+    starts = np.append(bounds, gap.shape[1])[:len(names)]
+    per_group = np.maximum.reduceat(gap, starts, axis=1) if gap.shape[1] else np.zeros((common, 0))
+    rows = np.flatnonzero(np.any(per_group > tolerance, axis=1))
+    over = per_group[rows] > tolerance
+    for (row, mask, worst) in zip(rows.tolist(), over.tolist(), per_group[rows].max(axis=1).tolist()):
+        report.changed.append(RecordChange(row, [n for (n, m) in zip(names, mask) if m], worst))
+
+
+def diff_vertices(a, b, tolerance) -> SectionDiff:
+    report = SectionDiff(len(a.Vertices), len(b.Vertices))
+    table_a, table_b = vertex_table(a.Vertices), vertex_table(b.Vertices)
+    if table_a.shape == table_b.shape and _digest(table_a.tobytes()) == _digest(table_b.tobytes()):
+        return report
+    _rows(table_a, table_b, VERTEX_FIELDS, tolerance, report)
+    report.identical = not (report.added or report.removed or report.changed)
+    return report
+
+
+def diff_faces(a, b) -> SectionDiff:
+    fa, fb = a.face_array(), b.face_array()
+    report = SectionDiff(len(fa), len(fb))
+    if fa.shape == fb.shape and _digest(fa.tobytes()) == _digest(fb.tobytes()):
+        return report
+    _rows(fa.astype(np.float64), fb.astype(np.float64), (('Indices', 3),), 0.0, report)
+    report.identical = False
+    return report
+
+
+def diff_records(records_a, records_b, tolerance) -> SectionDiff:
+    report = SectionDiff(len(records_a), len(records_b))
+    fields_a = [record_fields(r) for r in records_a]
+    fields_b = [record_fields(r) for r in records_b]
+    digests_a = [record_digest(f) for f in fields_a]
+    digests_b = [record_digest(f) for f in fields_b]
+    if _digest(*digests_a) == _digest(*digests_b) and len(digests_a) == len(digests_b):
+        return report
+
+    keys_a, keys_b = record_keys(records_a), record_keys(records_b)
+    where_a = {k: i for (i, k) in enumerate(keys_a)}
+    where_b = {k: i for (i, k) in enumerate(keys_b)}
+    report.added = [k for k in keys_b if k not in where_a]
+    report.removed = [k for k in keys_a if k not in where_b]
+    common = [k for k in keys_a if k in where_b]
+    report.reordered = common != [k for k in keys_b if k in where_a]
+    for key in common:
+        i, j = where_a[key], where_b[key]
+        if digests_a[i] == digests_b[j]:
+            continue
+        changed, worst = compare_fields(fields_a[i], fields_b[j], tolerance)
+        if changed:
+            report.changed.append(RecordChange(key, changed, worst))
+    report.identical = not (report.added or report.removed or report.changed or report.reordered)
+    return report
+
+
+def diff(a, b, tolerance=TOLERANCE) -> DiffReport:
+    report = DiffReport()
+    report.header = [k for k in HEADER if getattr(a, k) != getattr(b, k)]
+    if a.Status.Version != b.Status.Version:
+        report.header.append('Version')
+    report.sections['Vertices'] = diff_vertices(a, b, tolerance)
+    report.sections['Faces'] = diff_faces(a, b)
+    for section in RECORD_SECTIONS:
+        report.sections[section] = diff_records(getattr(a, section), getattr(b, section), tolerance)
+    return report
@@ -0,0 +1,204 @@
+#
+# ik.py : CCD inverse kinematics with PMX/MMD semantics
+#
+# Run from kinematics.Skeleton.solve when the deform order reaches an IK
+# bone. Each loop walks the links from the effector side, turning every
+# link at most Limit radians so the effector (IK.TargetIndex) approaches
+# the IK bone. Limited links are clamped in Euler angles
+# R = Rx(x) Ry(y) Rz(z) of their local rotation; a link limited on one
+# axis only (knees) rotates in that plane alone. The loop stops early
+# once the effector no longer gets closer, keeping the best result; all of
+# this runs for every frame at once.
+#
+
+import numpy as np
+
+from typing import List
+
+from . import rotation
+
+IDENTITY_QUAT = np.array([0.0, 0.0, 0.0, 1.0])
+MIN_ANGLE = 1e-5
+
+
+class IKChain(object):
+    # bone, target    | IK bone (goal) and the effector pulled towards it
+    # loops, limit    | iterations and max rotation per link and iteration
+    # links           | (k,) link bones, effector side first
+    # use_limit       | (k,) bool; lower, upper (k, 3) Euler limits
+    # plane_axis      | (k,) single limited axis 0..2, -1 otherwise
+
+    def __init__(self, bone, target, loops, limit, links, use_limit, lower, upper):
+        self.bone = bone
+        self.target = target
+        self.loops = loops
+        self.limit = limit
+        self.links = links
+        self.use_limit = use_limit
+        self.lower = lower
+        self.upper = upper
+
+        ranged = (lower != 0) | (upper != 0)
+        single = use_limit & (ranged.sum(axis=1) == 1)
+        self.plane_axis = np.where(single, np.argmax(ranged, axis=1), -1)
+
+
+def build_chains(bones) -> List[IKChain]:
+    chains = []
+    count = len(bones)
+    for (index, bone) in enumerate(bones):
+        if bone.UseIK != 1:
+            continue
+        members = [m for m in bone.IK.Member if 0 <= m.Index < count]
+        if not (0 <= bone.IK.TargetIndex < count) or len(members) == 0:
+            continue
+        lower = np.array([tuple(m.LowerLimit) for m in members], dtype=np.float64).reshape(-1, 3)
+        upper = np.array([tuple(m.UpperLimit) for m in members], dtype=np.float64).reshape(-1, 3)
+        chains.append(IKChain(
+            index, bone.IK.TargetIndex, bone.IK.Loops, bone.IK.Limit,
+            np.array([m.Index for m in members], dtype=np.int64),
+            np.array([m.UseLimit == 1 for m in members], dtype=bool),
+            np.minimum(lower, upper), np.maximum(lower, upper)))
+    return chains
+
+
+def euler_xyz_to_matrix(angles) -> np.ndarray:
+    angles = np.asarray(angles, dtype=np.float64)
+    cx, cy, cz = np.cos(angles[..., 0]), np.cos(angles[..., 1]), np.cos(angles[..., 2])
+    sx, sy, sz = np.sin(angles[..., 0]), np.sin(angles[..., 1]), np.sin(angles[..., 2])
+
+    mat = np.empty(angles.shape[:-1] + (3, 3))
+    mat[..., 0, 0] = cy * cz
+    mat[..., 0, 1] = -cy * sz
+    mat[..., 0, 2] = sy
+    mat[..., 1, 0] = sx * sy * cz + cx * sz
+    mat[..., 1, 1] = -sx * sy * sz + cx * cz
+    mat[..., 1, 2] = -sx * cy
+    mat[..., 2, 0] = -cx * sy * cz + sx * sz
+    mat[..., 2, 1] = cx * sy * sz + sx * cz
+    mat[..., 2, 2] = cx * cy
+    return mat
+
+
+def _wrap(angles):
+    return (angles + np.pi) % (2 * np.pi) - np.pi
+
+
+def matrix_to_euler_xyz(mat, before) -> np.ndarray:
+    '''Euler angles of mat; of the two solutions the one closest to before.'''
+    mat = np.asarray(mat, dtype=np.float64)
+    y = np.arcsin(np.clip(mat[..., 0, 2], -1.0, 1.0))
+    x = np.arctan2(-mat[..., 1, 2], mat[..., 2, 2])
+    z = np.arctan2(-mat[..., 0, 1], mat[..., 0, 0])
+
+    lock = np.hypot(mat[..., 0, 0], mat[..., 0, 1]) < 1e-9
+    x = np.where(lock, np.arctan2(mat[..., 2, 1], mat[..., 1, 1]), x)
+    z = np.where(lock, 0.0, z)
+
+    first = np.stack((x, y, z), axis=-1)
+    second = _wrap(np.stack((x + np.pi, np.pi - y, z + np.pi), axis=-1))
+    cost = np.abs(_wrap(first - before)).sum(axis=-1) > np.abs(_wrap(second - before)).sum(axis=-1)
+    return np.where(cost[..., None], second, first)
+
+
+def axis_angle(axis, angle) -> np.ndarray:
+    half = np.asarray(angle, dtype=np.float64)[..., None] / 2
+    return np.concatenate((np.asarray(axis) * np.sin(half), np.cos(half)), axis=-1)
+
+
+def quat_inverse(quat) -> np.ndarray:
+    return quat * np.array([-1.0, -1.0, -1.0, 1.0])
+
+
+def _unit(vectors):
+    length = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(length > 0, length, 1.0), length[..., 0]
+
+
+def _link_space(world, points):
+    # points (frames, 3) into the frame of world (frames, 4, 4)
+    inv = np.linalg.inv(world)
+    return np.einsum('fij,fj->fi', inv[:, :3, :3], points) + inv[:, :3, 3]
+
+
+def _solve_link(chain, j, goal, effector, anim, ik, prev, iteration):
+    '''New IK rotation (frames, 4) of link j and its updated Euler angles.'''
+    goal, goal_len = _unit(goal)
+    effector, effector_len = _unit(effector)
+    cos = np.clip(np.sum(goal * effector, axis=1), -1.0, 1.0)
+    angle = np.minimum(np.arccos(cos), chain.limit)
+    lower, upper = chain.lower[j], chain.upper[j]
+    axis_index = chain.plane_axis[j]
+
+    if axis_index >= 0:
+        axis = np.zeros(3)
+        axis[axis_index] = 1.0
+        # pick the turning direction that brings the effector closer
+        side = np.sign(np.einsum('fi,i->f', np.cross(effector, goal), axis))
+        step = np.where(side < 0, -angle, angle)
+        value = prev[:, axis_index] + step
+        if iteration == 0:
+            outside = (value < lower[axis_index]) | (value > upper[axis_index])
+            flip = -value
+            fits = (flip >= lower[axis_index]) & (flip <= upper[axis_index])
+            middle = (lower[axis_index] + upper[axis_index]) / 2
+            closer = np.abs(middle - value) > np.abs(middle + value)
+            value = np.where(outside & (fits | closer), flip, value)
+        value = np.clip(value, lower[axis_index], upper[axis_index])
+        euler = np.zeros_like(prev)
+        euler[:, axis_index] = value
+        return axis_angle(axis, value), euler
+
+    skip = (angle < MIN_ANGLE) | (goal_len == 0) | (effector_len == 0)
+    axis, axis_len = _unit(np.cross(effector, goal))
+    skip |= axis_len < 1e-12
+    turn = axis_angle(axis, np.where(skip, 0.0, angle))
+    local = rotation.quat_multiply(rotation.quat_multiply(ik, anim), turn)
+
+    euler = prev
+    if chain.use_limit[j]:
+        euler = matrix_to_euler_xyz(rotation.quat_to_matrix(local), prev)
+        euler = np.clip(euler, lower, upper)
+        euler = np.clip(euler - prev, -chain.limit, chain.limit) + prev
+        local = rotation.matrix_to_quat(euler_xyz_to_matrix(euler))
+    new_ik = rotation.quat_multiply(local, quat_inverse(anim))
+    return np.where(skip[:, None], ik, new_ik), np.where(skip[:, None], prev, euler)
+
+
+def solve(skeleton, pose, chain):
+    frames = len(pose.world)
+    links = chain.links
+    pose.ik_rot[:, links] = IDENTITY_QUAT
+    skeleton.update_local(pose, links)
+    for link in links[::-1].tolist():
+        skeleton.update_world(pose, skeleton.subtree(link))
+
+    prev = np.zeros((frames, len(links), 3))
+    best_rot = pose.ik_rot[:, links].copy()
+    best_dist = np.full(frames, np.inf)
+    active = np.ones(frames, dtype=bool)
+
+    for iteration in range(max(chain.loops, 0)):
+        for (j, link) in enumerate(links.tolist()):
+            if link == chain.target:
+                continue
+            world = pose.world[:, link]
+            goal = _link_space(world, pose.world[:, chain.bone, :3, 3])
+            effector = _link_space(world, pose.world[:, chain.target, :3, 3])
+            pose.ik_rot[:, link], prev[:, j] = _solve_link(
+                chain, j, goal, effector, pose.anim_rot[:, link], pose.ik_rot[:, link], prev[:, j], iteration)
+            skeleton.update_local(pose, [link])
+            skeleton.update_world(pose, skeleton.subtree(link))
+
+        dist = np.linalg.norm(pose.world[:, chain.target, :3, 3] - pose.world[:, chain.bone, :3, 3], axis=1)
+        improved = active & (dist < best_dist)
+        best_dist = np.where(improved, dist, best_dist)
+        best_rot[improved] = pose.ik_rot[improved][:, links]
+        active = improved
+        if not active.any():
+            break
+
+    pose.ik_rot[:, links] = best_rot
+    skeleton.update_local(pose, links)
+    for link in links[::-1].tolist():
+        skeleton.update_world(pose, skeleton.subtree(link))
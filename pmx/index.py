@@ -0,0 +1,237 @@
+#
+# index.py : lookup indices over pmx.Model sections
+#
+
+import numpy as np
+
+from typing import Dict
+from typing import Iterable
+from typing import Tuple
+
+from . import columns
+
+
+def csr_offsets(keys: np.ndarray, length: int) -> np.ndarray:
+    # keys must be sorted; offsets[k]:offsets[k + 1] is the run of key k
+    offsets = np.zeros(length + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=length)[:length], out=offsets[1:])
+    return offsets
+
+
+def csr_gather(offsets: np.ndarray, keys) -> np.ndarray:
+    # positions of every entry belonging to keys, in key order
+    keys = np.asarray(keys, dtype=np.int64)
+    starts = offsets[keys]
+    lengths = offsets[keys + 1] - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    run_start = np.cumsum(lengths) - lengths
+    return np.repeat(starts - run_start, lengths) + np.arange(total, dtype=np.int64)
+
+
+class BoneVertexIndex(object):
+    # CSR layout
+    #    offsets[bone]:offsets[bone + 1] slices vertices/weights
+    #    vertices | int32 vertex index, ascending inside a bone
+    #    weights  | float64 effective weight (duplicate influences summed)
+
+    def __init__(self, offsets, vertices, weights):
+        self.offsets = offsets
+        self.vertices = vertices
+        self.weights = weights
+
+    @classmethod
+    def build(cls, bones: np.ndarray, weights: np.ndarray, bone_count: int):
+        vert_count = len(bones)
+        flat_bone = bones.ravel().astype(np.int64)
+        flat_weight = weights.ravel()
+        flat_vert = np.repeat(np.arange(vert_count, dtype=np.int64), bones.shape[1])
+
+        use = (flat_bone >= 0) & (flat_bone < bone_count) & (flat_weight != 0.0)
+        key = flat_bone[use] * max(vert_count, 1) + flat_vert[use]
+        order = np.argsort(key, kind='stable')
+        key = key[order]
+        flat_weight = flat_weight[use][order]
+
+        # a vertex may name the same bone twice (e.g. BDEF2 with equal bones)
+        uniq, start = np.unique(key, return_index=True)
+        merged = np.add.reduceat(flat_weight, start) if len(start) else flat_weight[:0]
+
+        bone_of = uniq // max(vert_count, 1)
+        return cls(csr_offsets(bone_of, bone_count),
+                   (uniq % max(vert_count, 1)).astype(np.int32),
+                   merged)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def counts(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def lookup(self, bone: int) -> Tuple[np.ndarray, np.ndarray]:
+        start, end = self.offsets[bone], self.offsets[bone + 1]
+        return self.vertices[start:end], self.weights[start:end]
+
+    def vertices_of(self, bones: Iterable[int]) -> np.ndarray:
+        # sorted unique vertices touched by any of bones
+        return np.unique(self.vertices[csr_gather(self.offsets, list(bones))])
+
+    def bone_ids(self) -> np.ndarray:
+        # bone index for every CSR entry, aligned with vertices/weights
+        return np.repeat(np.arange(len(self), dtype=np.int32), self.counts())
+
+
+def build_bone_vertex_index(model) -> BoneVertexIndex:
+    types, bones, weights = columns.weight_columns(model.Vertices)
+    return BoneVertexIndex.build(bones, weights, len(model.Bones))
+
+
+class VertexMorphIndex(object):
+    # CSR layout over vertex and UV morph offsets
+    #    offsets[vert]:offsets[vert + 1] slices morphs/rows
+    #    morphs | int32 morph index, ascending inside a vertex
+    #    rows   | int32 position in PMMorph.Offsets
+
+    def __init__(self, offsets, morphs, rows):
+        self.offsets = offsets
+        self.morphs = morphs
+        self.rows = rows
+
+    @classmethod
+    def build(cls, morph_ids: np.ndarray, rows: np.ndarray, vertices: np.ndarray, vertex_count: int):
+        use = (vertices >= 0) & (vertices < vertex_count)
+        morph_ids, rows, vertices = morph_ids[use], rows[use], vertices[use]
+        order = np.lexsort((rows, morph_ids, vertices))
+        return cls(csr_offsets(vertices[order], vertex_count), morph_ids[order], rows[order])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def counts(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def lookup(self, vert: int) -> Tuple[np.ndarray, np.ndarray]:
+        start, end = self.offsets[vert], self.offsets[vert + 1]
+        return self.morphs[start:end], self.rows[start:end]
+
+    def entries(self, vertices) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # (vertex, morph, row) for every offset touching vertices
+        vertices = np.asarray(vertices, dtype=np.int64)
+        pos = csr_gather(self.offsets, vertices)
+        owner = np.repeat(vertices, self.offsets[vertices + 1] - self.offsets[vertices])
+        return owner, self.morphs[pos], self.rows[pos]
+
+    def morphs_of(self, vertices) -> np.ndarray:
+        return np.unique(self.entries(vertices)[1])
+
+
+def build_vertex_morph_index(model) -> VertexMorphIndex:
+    morph_ids, rows, vertices = columns.morph_offset_columns(model.Morphs, columns.VERTEX_MORPH_TYPES)
+    return VertexMorphIndex.build(morph_ids, rows, vertices, len(model.Vertices))
+
+
+def region_vertex_delta(model, morph_weights, vertices) -> np.ndarray:
+    '''Summed vertex morph Move for vertices only, shape (len(vertices), 3).
+
+    morph_weights maps morph index -> weight. Only offsets of the given
+    vertices are read, so cost follows the region, not the morph section.
+    '''
+    vertices = np.asarray(vertices, dtype=np.int64)
+    delta = np.zeros((len(vertices), 3), dtype=np.float64)
+    index = model.vertex_morph_index()
+    _, morphs, rows = index.entries(vertices)
+    slot = np.repeat(np.arange(len(vertices)), index.offsets[vertices + 1] - index.offsets[vertices])
+
+    weight = np.array([morph_weights.get(m, 0.0) if model.Morphs[m].Type == 1 else 0.0
+                       for m in morphs.tolist()], dtype=np.float64)
+    use = np.flatnonzero(weight)
+    if len(use) == 0:
+        return delta
+
+    moves = np.array([model.Morphs[m].Offsets[r].Move.to_tuple()
+                      for (m, r) in zip(morphs[use].tolist(), rows[use].tolist())], dtype=np.float64)
+    np.add.at(delta, slot[use], moves * weight[use, None])
+    return delta
+
+
+def drop_vertex_offsets(model, vertices) -> int:
+    '''Remove vertex/UV morph offsets that point at vertices. Returns the count removed.
+
+    Only the morphs that actually reference vertices are rewritten.
+    '''
+    _, morphs, rows = model.vertex_morph_index().entries(np.unique(vertices))
+    if len(morphs) == 0:
+        return 0
+
+    order = np.argsort(morphs, kind='stable')
+    morphs, rows = morphs[order], rows[order]
+    uniq, start = np.unique(morphs, return_index=True)
+    for (morph_index, drop) in zip(uniq.tolist(), np.split(rows, start[1:])):
+        offsets = model.Morphs[morph_index].Offsets
+        keep = np.ones(len(offsets), dtype=bool)
+        keep[drop] = False
+        model.Morphs[morph_index].Offsets = [o for (o, k) in zip(offsets, keep.tolist()) if k]
+
+    model.invalidate('Morphs')
+    return len(rows)
+
+
+class MaterialRanges(object):
+    # Prefix sums of PMMaterial.FaceLength in triangles
+    #    material m owns triangles starts[m]:ends[m]
+
+    def __init__(self, starts, ends):
+        self.starts = starts
+        self.ends = ends
+
+    @classmethod
+    def build(cls, face_lengths):
+        ends = np.cumsum(np.asarray(face_lengths, dtype=np.int64) // 3)
+        starts = ends - np.asarray(face_lengths, dtype=np.int64) // 3
+        return cls(starts, ends)
+
+    def __len__(self):
+        return len(self.ends)
+
+    def counts(self) -> np.ndarray:
+        return self.ends - self.starts
+
+    def range(self, material: int) -> Tuple[int, int]:
+        return int(self.starts[material]), int(self.ends[material])
+
+    def material_of(self, triangles) -> np.ndarray:
+        # triangles past the last material map to len(self)
+        return np.searchsorted(self.ends, triangles, side='right')
+
+    def triangle_materials(self) -> np.ndarray:
+        return np.repeat(np.arange(len(self), dtype=np.int32), self.counts())
+
+    def faces(self, face_array: np.ndarray, material: int) -> np.ndarray:
+        start, end = self.range(material)
+        return face_array[start:end]
+
+    def split(self, face_array: np.ndarray):
+        return [face_array[s:e] for (s, e) in zip(self.starts.tolist(), self.ends.tolist())]
+
+    def vertex_counts(self, face_array: np.ndarray) -> np.ndarray:
+        # distinct vertices referenced by each material
+        count = int(self.ends[-1]) if len(self) else 0
+        mats = np.repeat(self.triangle_materials(), 3)
+        verts = face_array[:count].ravel()
+        span = int(verts.max(initial=0)) + 1
+        pairs = np.unique(mats.astype(np.int64) * span + verts)
+        return np.bincount(pairs // span, minlength=len(self))
+
+
+def build_material_ranges(model) -> MaterialRanges:
+    return MaterialRanges.build([m.FaceLength for m in model.Materials])
+
+
+def build_name_index(records) -> Dict[str, int]:
+    # Name -> index of its first record; unnamed records are left out
+    names = {}
+    for (i, record) in enumerate(records):
+        if record.Name:
+            names.setdefault(record.Name, i)
+    return names
@@ -0,0 +1,192 @@
+#
+# joints.py : Spring6DOF joints between the rigid bodies of bone chains
+#
+# Each selected rigid is jointed to the rigid of its bone's nearest ancestor
+# bone that has one (first rigid of that bone), at the head of its own bone
+# and in its own frame. The ancestor lookup is memoised per bone, so the
+# hierarchy is walked once. With horizontal links, rigids at the same depth
+# of different chains (skirt rows) are also jointed to their nearest such
+# neighbour on either side, found through a grid over each row's rigids.
+#
+
+import numpy as np
+
+from dataclasses import dataclass
+
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+from . import columns
+from .spatial import VertexGrid
+
+SPRING_6DOF = 0
+
+# neighbours asked from the grid of a row per rigid
+LINK_CANDIDATES = 12
+
+
+@dataclass
+class JointLimits:
+    # rotation limits in degrees, position limits in model units; springs
+    # are stiffness constants and stored as given
+    rot_lower: Tuple[float, float, float] = (0.0, 0.0, 0.0)
+    rot_upper: Tuple[float, float, float] = (0.0, 0.0, 0.0)
+    pos_lower: Tuple[float, float, float] = (0.0, 0.0, 0.0)
+    pos_upper: Tuple[float, float, float] = (0.0, 0.0, 0.0)
+    rot_spring: Tuple[float, float, float] = (0.0, 0.0, 0.0)
+    pos_spring: Tuple[float, float, float] = (0.0, 0.0, 0.0)
+
+
+PRESETS: Dict[str, JointLimits] = {
+    'hair': JointLimits((-30.0, -5.0, -30.0), (30.0, 5.0, 30.0)),
+    'skirt': JointLimits((-45.0, -5.0, -15.0), (45.0, 5.0, 15.0), rot_spring=(50.0, 0.0, 50.0)),
+    'skirt_link': JointLimits((-20.0, -20.0, -20.0), (20.0, 20.0, 20.0),
+                              (-0.1, -0.1, -0.1), (0.1, 0.1, 0.1)),
+    'stiff': JointLimits((-5.0, -5.0, -5.0), (5.0, 5.0, 5.0), rot_spring=(100.0, 100.0, 100.0)),
+    'fixed': JointLimits(),
+}
+
+
+def _limits(preset) -> JointLimits:
+    if isinstance(preset, JointLimits):
+        return preset
+    if preset not in PRESETS:
+        raise ValueError('unknown joint preset: %r' % (preset,))
+    return PRESETS[preset]
+
+
+def ancestor_rigids(model) -> np.ndarray:
+    '''For each bone, the first rigid of its nearest strict ancestor that has one, or -1.'''
+    count = len(model.Bones)
+    own = np.full(count, -1, dtype=np.int64)
+    for (r, rigid) in reversed(list(enumerate(model.Rigids))):
+        if 0 <= rigid.Bone < count:
+            own[rigid.Bone] = r
+
+    parents = [b.Parent if 0 <= b.Parent < count else -1 for b in model.Bones]
+    above = np.full(count, -2, dtype=np.int64)  # -2 unresolved, -3 on the current path
+    for bone in range(count):
+        path = []
+        b = bone
+        while b >= 0 and above[b] == -2:
+            above[b] = -3
+            path.append(b)
+            b = parents[b]
+        if not path:
+            continue
+        # a loop in the hierarchy is cut where the walk met itself
+        value = -1 if b < 0 or above[b] == -3 else (own[b] if own[b] >= 0 else above[b])
+        above[path[-1]] = value
+        for (child, b) in zip(path[-2::-1], path[::-1]):
+            above[child] = own[b] if own[b] >= 0 else above[b]
+    return above
+
+
+def chain_rows(parent, selected) -> Tuple[np.ndarray, np.ndarray]:
+    '''(depth, root) of each rigid along parent links that stay inside selected.'''
+    count = len(parent)
+    depth = np.full(count, -1, dtype=np.int64)
+    root = np.arange(count)
+    for r in np.flatnonzero(selected).tolist():
+        path = []
+        x = r
+        while depth[x] < 0:
+            path.append(x)
+            p = parent[x]
+            if p < 0 or not selected[p] or len(path) > count:
+                depth[x] = 0
+                path.pop()
+                break
+            x = p
+        for y in reversed(path):
+            depth[y] = depth[parent[y]] + 1
+            root[y] = root[parent[y]]
+    return depth, root
+
+
+def row_links(positions, depth, root, selected) -> np.ndarray:
+    '''(links, 2) pairs of selected rigids in one row of different chains, nearest on either side.'''
+    pairs = [np.zeros((0, 2), dtype=np.int64)]
+    for row in np.unique(depth[selected]).tolist():
+        ids = np.flatnonzero(selected & (depth == row))
+        if len(ids) < 2:
+            continue
+        near, _ = VertexGrid(positions[ids]).knn(positions[ids], min(LINK_CANDIDATES, len(ids)))
+        valid = near >= 0
+        cand = ids[np.where(valid, near, 0)]
+        valid &= root[cand] != root[ids][:, None]
+
+        # the nearest candidate, then the nearest one on the other side of it
+        rows = np.arange(len(ids))
+        first = np.argmax(valid, axis=1)
+        a = cand[rows, first]
+        side = np.einsum('nkc,nc->nk', positions[cand] - positions[ids][:, None], positions[a] - positions[ids])
+        other = valid & (side < 0.0)
+        second = np.argmax(other, axis=1)
+        pairs.append(np.stack((ids, a), axis=1)[valid[rows, first]])
+        pairs.append(np.stack((ids, cand[rows, second]), axis=1)[other[rows, second]])
+    return np.unique(np.sort(np.concatenate(pairs), axis=1), axis=0)
+
+
+def _store_limits(joints, limits):
+    columns.store_vectors(joints, 'RotLowerLimit', np.radians([l.rot_lower for l in limits]))
+    columns.store_vectors(joints, 'RotUpperLimit', np.radians([l.rot_upper for l in limits]))
+    columns.store_vectors(joints, 'PosLowerLimit', np.array([l.pos_lower for l in limits]))
+    columns.store_vectors(joints, 'PosUpperLimit', np.array([l.pos_upper for l in limits]))
+    columns.store_vectors(joints, 'RotSpring', np.array([l.rot_spring for l in limits]))
+    columns.store_vectors(joints, 'PosSpring', np.array([l.pos_spring for l in limits]))
+
+
+def generate_joints(model, rigids=None, preset='hair', horizontal=False, link_preset='skirt_link') -> List:
+    '''PMJoint records for rigids (indices into model.Rigids, every dynamic one by default).
+
+    The records are not added to the model. preset and link_preset name an
+    entry of PRESETS or are JointLimits.
+    '''
+    from .pmx import PMJoint
+
+    limits = _limits(preset)
+    link_limits = _limits(link_preset)
+    count = len(model.Rigids)
+    selected = np.zeros(count, dtype=bool)
+    if rigids is None:
+        selected[[r for (r, rigid) in enumerate(model.Rigids) if rigid.PhysicalType != 0]] = True
+    else:
+        selected[np.asarray(rigids, dtype=np.int64)] = True
+
+    bone_count = len(model.Bones)
+    above = ancestor_rigids(model)
+    bones = np.array([r.Bone for r in model.Rigids], dtype=np.int64)
+    known = (bones >= 0) & (bones < bone_count)
+    parent = np.where(known, above[np.where(known, bones, 0)], -1)
+
+    pairs = [(int(parent[r]), r) for r in np.flatnonzero(selected & (parent >= 0)).tolist()]
+    names = [model.Rigids[r].Name for (_, r) in pairs]
+    positions = [tuple(model.Bones[model.Rigids[r].Bone].Position) for (_, r) in pairs]
+    frames = [tuple(model.Rigids[r].Rotate) for (_, r) in pairs]
+    kinds = [limits] * len(pairs)
+
+    if horizontal:
+        centers = columns.position_columns(model.Rigids)
+        depth, root = chain_rows(parent, selected)
+        for (a, b) in row_links(centers, depth, root, selected).tolist():
+            pairs.append((a, b))
+            names.append('%s-%s' % (model.Rigids[a].Name, model.Rigids[b].Name))
+            positions.append(tuple((centers[a] + centers[b]) / 2))
+            frames.append(tuple(model.Rigids[a].Rotate))
+            kinds.append(link_limits)
+
+    joints = []
+    for ((a, b), name) in zip(pairs, names):
+        joint = PMJoint()
+        joint.Name = name
+        joint.Type = SPRING_6DOF
+        joint.Parent = a
+        joint.Child = b
+        joints.append(joint)
+    if joints:
+        columns.store_vectors(joints, 'Position', np.array(positions))
+        columns.store_vectors(joints, 'Rotate', np.array(frames))
+        _store_limits(joints, kinds)
+    return joints
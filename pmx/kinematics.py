@@ -0,0 +1,173 @@
+#
+# kinematics.py : batched forward kinematics of pmx.Model bones
+#
+# Poses are evaluated for many frames at once. Rotations are quaternions
+# (x, y, z, w) and translations offsets from the rest position, both in the
+# bone's local (= model, PMX bones have no rest rotation) axes. Results are
+# world matrices (frames, bones, 4, 4) with column vectors, which
+# Model.skin takes as they are to pose a mesh for every frame.
+#
+# Evaluation follows MMD: bones are visited in deform order (AfterPhysical,
+# Level, index); a bone with append (grant) rotation/movement takes its
+# source's rotation/movement scaled by AdditionalPower, then its subtree is
+# refreshed. IK bones run the CCD solver (see ik.py) at their turn.
+#
+
+import numpy as np
+
+from . import ik as pmx_ik
+from . import rotation
+
+IDENTITY_QUAT = np.array([0.0, 0.0, 0.0, 1.0])
+
+
+def twist(quat, axis) -> np.ndarray:
+    '''Rotation component of quat about axis (swing-twist decomposition).'''
+    axis = np.asarray(axis, dtype=np.float64)
+    along = np.sum(quat[..., :3] * axis, axis=-1, keepdims=True) * axis
+    out = np.concatenate((along, quat[..., 3:]), axis=-1)
+    norm = np.linalg.norm(out, axis=-1, keepdims=True)
+    return np.where(norm > 1e-12, out / np.where(norm > 1e-12, norm, 1.0), IDENTITY_QUAT)
+
+
+class Pose(object):
+    # Per frame evaluation state, arrays lead with (frames, bones)
+    #    anim_rot, anim_move     | input rotation / translation
+    #    append_rot, append_move | grant result of append bones
+    #    ik_rot                  | IK result of link bones
+    #    local, world            | (frames, bones, 4, 4)
+
+    def __init__(self, frames, bones):
+        self.anim_rot = np.tile(IDENTITY_QUAT, (frames, bones, 1))
+        self.anim_move = np.zeros((frames, bones, 3))
+        self.append_rot = np.tile(IDENTITY_QUAT, (frames, bones, 1))
+        self.append_move = np.zeros((frames, bones, 3))
+        self.ik_rot = np.tile(IDENTITY_QUAT, (frames, bones, 1))
+        self.local = np.tile(np.eye(4), (frames, bones, 1, 1))
+        self.world = np.tile(np.eye(4), (frames, bones, 1, 1))
+
+
+class Skeleton(object):
+    # parent        | (bones,) parent index, -1 for roots
+    # offset        | (bones, 3) rest position relative to the parent
+    # topology      | parents before children
+    # order         | deform order (AfterPhysical, Level, index)
+    # append_*      | source, power and rotate / move / local flags
+    # fixed_axis    | (bones, 3), zero when unused
+
+    def __init__(self, bones):
+        count = len(bones)
+        self.positions = np.array([tuple(b.Position) for b in bones], dtype=np.float64).reshape(count, 3)
+        parent = np.array([b.Parent for b in bones], dtype=np.int64)
+        self.parent = np.where((parent >= 0) & (parent < count), parent, -1)
+        self.offset = self.positions - np.where(self.parent[:, None] >= 0, self.positions[self.parent], 0.0)
+        self.topology = self._topology()
+
+        keys = [(b.AfterPhysical, b.Level, i) for (i, b) in enumerate(bones)]
+        self.order = np.array([k[2] for k in sorted(keys)], dtype=np.int64)
+
+        source = np.array([b.AdditionalBoneIndex for b in bones], dtype=np.int64)
+        valid = (source >= 0) & (source < count)
+        self.append_source = np.where(valid, source, -1)
+        self.append_rotate = valid & np.array([b.AdditionalRotation == 1 for b in bones], dtype=bool)
+        self.append_move = valid & np.array([b.AdditionalMovement == 1 for b in bones], dtype=bool)
+        self.append_local = np.array([b.AdditionalLocal == 1 for b in bones], dtype=bool)
+        self.append_power = np.array([b.AdditionalPower for b in bones], dtype=np.float64)
+
+        self.fixed_axis = np.array([tuple(b.FixedAxis) if b.UseFixedAxis == 1 else (0, 0, 0) for b in bones],
+                                   dtype=np.float64).reshape(count, 3)
+        norm = np.linalg.norm(self.fixed_axis, axis=1, keepdims=True)
+        self.fixed_axis = self.fixed_axis / np.where(norm > 0, norm, 1.0)
+
+        self.chains = {chain.bone: chain for chain in pmx_ik.build_chains(bones)}
+        self._subtrees = {}
+
+    def __len__(self):
+        return len(self.parent)
+
+    def _topology(self):
+        depth = np.zeros(len(self.parent), dtype=np.int64)
+        current = self.parent.copy()
+        # a parent loop would never reach -1; stop after len(bones) steps
+        for _ in range(len(self.parent)):
+            alive = current >= 0
+            if not alive.any():
+                break
+            depth += alive
+            current = np.where(alive, self.parent[np.maximum(current, 0)], -1)
+        return np.argsort(depth, kind='stable')
+
+    def subtree(self, bone) -> np.ndarray:
+        '''bone and its descendants, parents first.'''
+        if bone not in self._subtrees:
+            inside = np.zeros(len(self), dtype=bool)
+            inside[bone] = True
+            for b in self.topology.tolist():
+                if self.parent[b] >= 0 and inside[self.parent[b]]:
+                    inside[b] = True
+            self._subtrees[bone] = self.topology[inside[self.topology]]
+        return self._subtrees[bone]
+
+    def new_pose(self, rotations=None, translations=None) -> Pose:
+        frames = 1
+        for value in (rotations, translations):
+            if value is not None and np.ndim(value) == 3:
+                frames = max(frames, len(value))
+        pose = Pose(frames, len(self))
+        if rotations is not None:
+            pose.anim_rot[:] = np.asarray(rotations, dtype=np.float64)
+        if translations is not None:
+            pose.anim_move[:] = np.asarray(translations, dtype=np.float64)
+
+        fixed = np.flatnonzero(np.any(self.fixed_axis != 0, axis=1))
+        if len(fixed):
+            pose.anim_rot[:, fixed] = twist(pose.anim_rot[:, fixed], self.fixed_axis[fixed])
+        return pose
+
+    def update_local(self, pose, bones):
+        rot = rotation.quat_multiply(rotation.quat_multiply(pose.ik_rot[:, bones], pose.anim_rot[:, bones]),
+                                     pose.append_rot[:, bones])
+        local = np.tile(np.eye(4), rot.shape[:2] + (1, 1))
+        local[..., :3, :3] = rotation.quat_to_matrix(rot)
+        local[..., :3, 3] = self.offset[bones] + pose.anim_move[:, bones] + pose.append_move[:, bones]
+        pose.local[:, bones] = local
+
+    def update_world(self, pose, bones):
+        # bones must be ordered parents first
+        for b in np.asarray(bones).tolist():
+            p = self.parent[b]
+            pose.world[:, b] = pose.local[:, b] if p < 0 else pose.world[:, p] @ pose.local[:, b]
+
+    def update_append(self, pose, bone):
+        source = self.append_source[bone]
+        power = self.append_power[bone]
+        chained = not self.append_local[bone] and self.append_source[source] >= 0
+        if self.append_rotate[bone]:
+            rot = pose.append_rot[:, source] if chained and self.append_rotate[source] else pose.anim_rot[:, source]
+            rot = rotation.quat_multiply(pose.ik_rot[:, source], rot)
+            pose.append_rot[:, bone] = rotation.quat_slerp(IDENTITY_QUAT, rot, np.full(len(rot), power))
+        if self.append_move[bone]:
+            move = pose.append_move[:, source] if chained and self.append_move[source] else pose.anim_move[:, source]
+            pose.append_move[:, bone] = move * power
+
+    def evaluate(self, rotations=None, translations=None, ik=True) -> np.ndarray:
+        '''World matrices (frames, bones, 4, 4) for rotations (frames, bones, 4)
+        and translations (frames, bones, 3); a missing frame axis means one frame.'''
+        pose = self.new_pose(rotations, translations)
+        self.solve(pose, ik)
+        return pose.world
+
+    def solve(self, pose, ik=True):
+        self.update_local(pose, np.arange(len(self)))
+        self.update_world(pose, self.topology)
+        for bone in self.order.tolist():
+            if self.append_rotate[bone] or self.append_move[bone]:
+                self.update_append(pose, bone)
+                self.update_local(pose, [bone])
+                self.update_world(pose, self.subtree(bone))
+            if ik and bone in self.chains:
+                pmx_ik.solve(self, pose, self.chains[bone])
+
+
+def build_skeleton(model) -> Skeleton:
+    return Skeleton(model.Bones)
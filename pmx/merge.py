@@ -0,0 +1,190 @@
+#
+# merge.py : assemble one model from parts (body, hair, outfits)
+#
+# Sections are concatenated in part order, so every index a part holds
+# moves by the length of the sections before it, except bones: with
+# bone_match='name' a part's bone whose name is already in the result is
+# dropped and its references go to the existing bone, which is how parts
+# rigged against the same skeleton share it. Textures are shared by path
+# and display frames by name. Each index field of a part is read into one
+# array, mapped in one pass (offset or lookup table) and written back.
+#
+# Each part is deep-copied before its indices are rewritten, so the parts
+# stay valid and one model may be passed more than once.
+#
+
+import copy
+
+import numpy as np
+
+from typing import Dict
+
+from . import columns
+from . import remap
+
+BONE_MATCHES = ('name', None)
+
+GROUP_MORPHS = (0, 9)
+BONE_MORPH = 2
+MATERIAL_MORPH = 8
+IMPULSE_MORPH = 10
+
+
+def shift(index, offset) -> np.ndarray:
+    '''index + offset, leaving the negative "none" entries alone.'''
+    index = np.asarray(index, dtype=np.int64)
+    return np.where(index >= 0, index + offset, index)
+
+
+def _rewrite(records, attr, mapping):
+    # read attr of every record, map the array, write it back
+    if not records:
+        return
+    values = mapping(np.fromiter((getattr(r, attr) for r in records), dtype=np.int64, count=len(records)))
+    for (record, value) in zip(records, values.tolist()):
+        setattr(record, attr, value)
+
+
+def _rewrite_offsets(morphs, types, mapping):
+    morph_ids, rows, index = columns.morph_offset_columns(morphs, types)
+    for (m, row, value) in zip(morph_ids.tolist(), rows.tolist(), mapping(index).tolist()):
+        morphs[m].Offsets[row].Index = value
+
+
+def bone_map(model, names: Dict[str, int], base: int, bone_match) -> np.ndarray:
+    '''New index of each of model's bones; names (result name index) gains the new ones.'''
+    count = len(model.Bones)
+    mapped = np.full(count, -1, dtype=np.int64)
+    if bone_match == 'name':
+        for (name, i) in model.name_index('Bones').items():
+            mapped[i] = names.get(name, -1)
+    new = np.flatnonzero(mapped < 0)
+    mapped[new] = base + np.arange(len(new))
+    for i in new.tolist():
+        if model.Bones[i].Name:
+            names.setdefault(model.Bones[i].Name, int(mapped[i]))
+    return mapped
+
+
+def texture_map(model, paths: Dict[str, int]):
+    '''(new index of each texture, textures to append); paths (result path index) gains the new ones.'''
+    mapped = np.empty(len(model.Textures), dtype=np.int64)
+    added = []
+    for (i, texture) in enumerate(model.Textures):
+        if texture.Path not in paths:
+            paths[texture.Path] = len(paths)
+            added.append(texture)
+        mapped[i] = paths[texture.Path]
+    return mapped, added
+
+
+def _remap_bones(model, bones):
+    # bones is the old -> new lookup table
+    def lookup(index):
+        return remap.lookup(bones, index)
+
+    _, weight_bones, _ = columns.weight_columns(model.Vertices)
+    new_bones = lookup(weight_bones).tolist()
+    for (vert, row) in zip(model.Vertices, new_bones):
+        vert.Bones = row[:len(vert.Bones)]
+
+    _rewrite(model.Bones, 'Parent', lookup)
+    _rewrite([b for b in model.Bones if b.ToConnectType == 1], 'ChildIndex', lookup)
+    _rewrite([b for b in model.Bones if b.AdditionalRotation == 1 or b.AdditionalMovement == 1],
+             'AdditionalBoneIndex', lookup)
+    ik = [b.IK for b in model.Bones if b.UseIK == 1]
+    _rewrite(ik, 'TargetIndex', lookup)
+    _rewrite([link for solver in ik for link in solver.Member], 'Index', lookup)
+    _rewrite_offsets(model.Morphs, (BONE_MORPH,), lookup)
+    _rewrite(model.Rigids, 'Bone', lookup)
+
+
+def _remap_part(model, offsets, bones, textures):
+    _remap_bones(model, bones)
+
+    def texture(index):
+        return remap.lookup(textures, index)
+
+    _rewrite(model.Materials, 'TextureIndex', texture)
+    _rewrite(model.Materials, 'SphereIndex', texture)
+    _rewrite([m for m in model.Materials if remap.toon_texture(m)], 'ToonIndex', texture)
+
+    _rewrite_offsets(model.Morphs, columns.VERTEX_MORPH_TYPES, lambda i: shift(i, offsets['Vertices']))
+    _rewrite_offsets(model.Morphs, GROUP_MORPHS, lambda i: shift(i, offsets['Morphs']))
+    _rewrite_offsets(model.Morphs, (MATERIAL_MORPH,), lambda i: shift(i, offsets['Materials']))
+    _rewrite_offsets(model.Morphs, (IMPULSE_MORPH,), lambda i: shift(i, offsets['Rigids']))
+
+    _rewrite(model.Joints, 'Parent', lambda i: shift(i, offsets['Rigids']))
+    _rewrite(model.Joints, 'Child', lambda i: shift(i, offsets['Rigids']))
+    _rewrite(model.SoftBodies, 'Material', lambda i: shift(i, offsets['Materials']))
+    for soft in model.SoftBodies:
+        anchors = np.array(soft.Anchors, dtype=np.int64).reshape(-1, 3)
+        anchors[:, 0] = shift(anchors[:, 0], offsets['Rigids'])
+        anchors[:, 1] = shift(anchors[:, 1], offsets['Vertices'])
+        soft.Anchors = anchors.tolist()
+        soft.Pins = shift(soft.Pins, offsets['Vertices']).tolist()
+
+
+def _merge_frames(result, frames, model, bones, morph_offset):
+    # bone members through the bone table, morph members shifted; frames
+    # of one name become one, members already listed are not repeated
+    for frame in model.DisplayFrames:
+        members = np.array(frame.Members, dtype=np.int64).reshape(-1, 2)
+        is_bone = members[:, 0] == 0
+        members[:, 1] = np.where(is_bone, remap.lookup(bones, members[:, 1]), shift(members[:, 1], morph_offset))
+        members = [m for m in members.tolist() if m[1] >= 0]
+
+        target = frames.get(frame.Name)
+        if target is None:
+            frame.Members = members
+            frames[frame.Name] = frame
+            result.DisplayFrames.append(frame)
+            continue
+        seen = {tuple(m) for m in target.Members}
+        target.Members.extend(m for m in members if tuple(m) not in seen)
+
+
+def merge(models, bone_match='name'):
+    '''One model from parts, the first part supplying the header.
+
+    bone_match='name' unifies bones by name, None keeps every bone.
+    '''
+    from .pmx import Model
+
+    if bone_match not in BONE_MATCHES:
+        raise ValueError('unknown bone_match: %r' % (bone_match,))
+    models = list(models)
+    result = Model()
+    if not models:
+        return result
+    head = models[0]
+    result.Status = copy.copy(head.Status)
+    result.Name, result.Name_E = head.Name, head.Name_E
+    result.Comment, result.Comment_E = head.Comment, head.Comment_E
+
+    names = {}
+    paths = {}
+    frames = {}
+    faces = []
+    for model in models:
+        model = copy.deepcopy(model)
+        offsets = {s: len(getattr(result, s)) for s in ('Vertices', 'Materials', 'Morphs', 'Rigids')}
+        bones = bone_map(model, names, len(result.Bones), bone_match)
+        textures, new_textures = texture_map(model, paths)
+        new_bones = [b for (i, b) in enumerate(model.Bones) if bones[i] >= len(result.Bones)]
+
+        _remap_part(model, offsets, bones, textures)
+        _merge_frames(result, frames, model, bones, offsets['Morphs'])
+        faces.append(model.face_array().ravel() + offsets['Vertices'])
+
+        result.Vertices.extend(model.Vertices)
+        result.Textures.extend(new_textures)
+        result.Materials.extend(model.Materials)
+        result.Bones.extend(new_bones)
+        result.Morphs.extend(model.Morphs)
+        result.Rigids.extend(model.Rigids)
+        result.Joints.extend(model.Joints)
+        result.SoftBodies.extend(model.SoftBodies)
+
+    result.Faces = np.concatenate(faces).tolist()
+    return result
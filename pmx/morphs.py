@@ -0,0 +1,355 @@
+#
+# morphs.py : evaluation of pmx.Model morphs for arbitrary weight mixes
+#
+# Group morphs (Type 0) pass weight * Power on to the morphs they list and
+# flip morphs (Type 9) switch on one of theirs, picked by their weight.
+# Once both are resolved to leaf weights (see MorphGraph), vertex and UV
+# offsets are summed as one sparse product over the offsets of the active
+# morphs only; bone and material morphs come out as per-bone and
+# per-material arrays. Impulse morphs (Type 10) drive physics and are not
+# evaluated here.
+#
+
+import numpy as np
+
+from dataclasses import dataclass
+
+from . import index as pmx_index
+from . import rotation
+
+IDENTITY_QUAT = np.array([0.0, 0.0, 0.0, 1.0])
+
+GROUP = 0
+VERTEX = 1
+BONE = 2
+UV = 3
+MATERIAL = 8
+FLIP = 9
+UV_CHANNELS = 5  # UV, ExUV1..4
+
+# PMMorphOffset attribute, PMMaterial attribute, width; columns in this order
+MATERIAL_FIELDS = (
+    ('MatDiffuse', 'Deffuse', 4),
+    ('MatSpeculer', 'Specular', 3),
+    ('MatPower', 'Power', 1),
+    ('MatAmbient', 'Ambient', 3),
+    ('MatEdgeColor', 'EdgeColor', 4),
+    ('MatEdgeSize', 'EdgeSize', 1),
+    ('MatTexture', None, 4),
+    ('MatSphere', None, 4),
+    ('MatToon', None, 4),
+)
+MATERIAL_WIDTH = sum(f[2] for f in MATERIAL_FIELDS)
+
+
+@dataclass
+class MorphResult:
+    weights: np.ndarray         # (morphs,) effective weight after group / flip expansion
+    vertex: np.ndarray          # (vertices, 3) position delta
+    uv: np.ndarray              # (5, vertices, 4) UV and ExUV1..4 delta
+    bone_move: np.ndarray       # (bones, 3) translation
+    bone_rotate: np.ndarray     # (bones, 4) quaternion (x, y, z, w)
+    material_mul: np.ndarray    # (materials, MATERIAL_WIDTH) factors, 1 when untouched
+    material_add: np.ndarray    # (materials, MATERIAL_WIDTH) terms, 0 when untouched
+
+
+def _vector(value, width):
+    if width == 1:
+        return (float(value),)
+    return tuple(value)[:width]
+
+
+class OffsetColumns(object):
+    # Offsets of one kind of morph, grouped by morph (CSR)
+    #    offsets[m]:offsets[m + 1] slices index/values
+    #    index   | PMMorphOffset.Index
+    #    values  | (entries, width) payload of the kind
+    #    extra   | (entries,) UV channel (UV kinds) or MatEffectType (material)
+
+    def __init__(self, offsets, index, values, extra):
+        self.offsets = offsets
+        self.index = index
+        self.values = values
+        self.extra = extra
+
+    @classmethod
+    def build(cls, morphs, types, read, width, read_extra=None):
+        lengths = np.array([len(m.Offsets) if m.Type in types else 0 for m in morphs], dtype=np.int64)
+        offsets = np.zeros(len(morphs) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        total = int(offsets[-1])
+        index = np.empty(total, dtype=np.int64)
+        values = np.empty((total, width), dtype=np.float64)
+        extra = np.zeros(total, dtype=np.int64)
+        for (m, morph) in enumerate(morphs):
+            if lengths[m] == 0:
+                continue
+            span = slice(offsets[m], offsets[m + 1])
+            index[span] = [o.Index for o in morph.Offsets]
+            values[span] = [read(o) for o in morph.Offsets]
+            if read_extra is not None:
+                extra[span] = [read_extra(morph, o) for o in morph.Offsets]
+        return cls(offsets, index, values, extra)
+
+    def gather(self, morphs, weights):
+        '''(positions, weights) of every entry of morphs, each with its morph's weight.'''
+        pos = pmx_index.csr_gather(self.offsets, morphs)
+        lengths = self.offsets[morphs + 1] - self.offsets[morphs]
+        return pos, np.repeat(weights, lengths)
+
+
+def material_offset(offset):
+    return sum((_vector(getattr(offset, f[0]), f[2]) for f in MATERIAL_FIELDS), ())
+
+
+class MorphGraph(object):
+    # Dependencies of group (Type 0) and flip (Type 9) morphs
+    #    offsets[m]:offsets[m + 1] slices targets/powers, the morphs m refers to
+    #    cycles      | (k, 2) back edges (morph, child) left out to break cycles
+    #    order       | every morph, referenced morphs before their users
+    #    flat_*      | CSR group -> leaf: flat_leaves/flat_factors of row m give
+    #                  the non-group morphs m drives and their effective weight;
+    #                  rows of other morphs hold the morph itself with factor 1.
+    #                  Flips are leaves here: their choice depends on the weight.
+
+    def __init__(self, types, offsets, children, powers, cycles, order):
+        self.types = types
+        self.offsets = offsets
+        self.targets = children
+        self.powers = powers
+        self.cycles = cycles
+        self.order = order
+        self._flatten()
+
+    @classmethod
+    def build(cls, morphs):
+        types = np.array([m.Type for m in morphs], dtype=np.int64)
+        count = len(morphs)
+        edges = [[(o.Index, o.Power) for o in m.Offsets if 0 <= o.Index < count] if m.Type in (GROUP, FLIP) else []
+                 for m in morphs]
+
+        # depth first from every morph in index order; an edge into a morph
+        # still on the stack closes a cycle and is dropped
+        state = np.zeros(count, dtype=np.int8)  # 0 new, 1 on stack, 2 done
+        keep = [[True] * len(e) for e in edges]
+        cycles = []
+        order = []
+        for root in range(count):
+            if state[root]:
+                continue
+            state[root] = 1
+            stack = [(root, 0)]
+            while stack:
+                (node, at) = stack[-1]
+                if at == len(edges[node]):
+                    stack.pop()
+                    state[node] = 2
+                    order.append(node)
+                    continue
+                stack[-1] = (node, at + 1)
+                child = edges[node][at][0]
+                if state[child] == 1:
+                    keep[node][at] = False
+                    cycles.append((node, child))
+                elif state[child] == 0:
+                    state[child] = 1
+                    stack.append((child, 0))
+
+        kept = [[e for (e, k) in zip(es, ks) if k] for (es, ks) in zip(edges, keep)]
+        lengths = np.array([len(e) for e in kept], dtype=np.int64)
+        offsets = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        flat = [e for es in kept for e in es]
+        children = np.array([e[0] for e in flat], dtype=np.int64)
+        powers = np.array([e[1] for e in flat], dtype=np.float64)
+        return cls(types, offsets, children, powers,
+                   np.array(cycles, dtype=np.int64).reshape(-1, 2), np.array(order, dtype=np.int64))
+
+    def __len__(self):
+        return len(self.types)
+
+    def children(self, morph):
+        span = slice(self.offsets[morph], self.offsets[morph + 1])
+        return self.targets[span], self.powers[span]
+
+    def _flatten(self):
+        rows = [None] * len(self)
+        for m in self.order.tolist():
+            if self.types[m] != GROUP:
+                rows[m] = (np.array([m], dtype=np.int64), np.ones(1))
+                continue
+            children, powers = self.children(m)
+            if len(children) == 0:
+                rows[m] = (np.zeros(0, dtype=np.int64), np.zeros(0))
+                continue
+            leaves = np.concatenate([rows[c][0] for c in children.tolist()])
+            factors = np.concatenate([rows[c][1] * p for (c, p) in zip(children.tolist(), powers.tolist())])
+            uniq, inverse = np.unique(leaves, return_inverse=True)
+            rows[m] = (uniq, np.bincount(inverse, weights=factors, minlength=len(uniq)))
+
+        lengths = np.array([len(r[0]) for r in rows], dtype=np.int64)
+        self.flat_offsets = np.zeros(len(self) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.flat_offsets[1:])
+        self.flat_leaves = np.concatenate([r[0] for r in rows]) if rows else np.zeros(0, dtype=np.int64)
+        self.flat_factors = np.concatenate([r[1] for r in rows]) if rows else np.zeros(0)
+
+    def leaves(self, morph):
+        '''(leaves, factors) reached from morph, itself for a non-group morph.'''
+        span = slice(self.flat_offsets[morph], self.flat_offsets[morph + 1])
+        return self.flat_leaves[span], self.flat_factors[span]
+
+    def depends_on(self, morph) -> np.ndarray:
+        '''Morphs whose flattened row reaches morph (morph included when not a group).'''
+        owner = np.repeat(np.arange(len(self)), np.diff(self.flat_offsets))
+        return owner[self.flat_leaves == morph]
+
+    def apply(self, weights) -> np.ndarray:
+        '''Leaf weights of a (morphs,) weight vector: weights @ flattened matrix.'''
+        weights = np.asarray(weights, dtype=np.float64)
+        active = np.flatnonzero(weights)
+        pos = pmx_index.csr_gather(self.flat_offsets, active)
+        w = np.repeat(weights[active], self.flat_offsets[active + 1] - self.flat_offsets[active])
+        return np.bincount(self.flat_leaves[pos], weights=self.flat_factors[pos] * w, minlength=len(self))
+
+
+def build_morph_graph(model) -> MorphGraph:
+    return MorphGraph.build(model.Morphs)
+
+
+class MorphData(object):
+    # Column form of model.Morphs, built once and reused for every evaluation
+    #    types            | (morphs,) PMMorph.Type
+    #    vertex, uv, bone | OffsetColumns; bone values are Move + Rotate
+    #    material         | OffsetColumns; values MATERIAL_FIELDS, extra MatEffectType
+
+    def __init__(self, morphs):
+        self.types = np.array([m.Type for m in morphs], dtype=np.int64)
+        self.names = {}
+        for (i, m) in enumerate(morphs):
+            self.names.setdefault(m.Name, i)
+
+        self.vertex = OffsetColumns.build(morphs, (VERTEX,), lambda o: tuple(o.Move), 3)
+        self.uv = OffsetColumns.build(morphs, (3, 4, 5, 6, 7), lambda o: tuple(o.UV), 4,
+                                      lambda m, o: m.Type - UV)
+        self.bone = OffsetColumns.build(morphs, (BONE,), lambda o: tuple(o.Move) + tuple(o.Rotate), 7)
+        self.material = OffsetColumns.build(morphs, (MATERIAL,), material_offset, MATERIAL_WIDTH,
+                                            lambda m, o: o.MatEffectType)
+
+    def __len__(self):
+        return len(self.types)
+
+    def resolve(self, graph, weights) -> np.ndarray:
+        '''Effective weight of every morph once groups and flips are expanded.'''
+        out = graph.apply(weights)
+
+        # a flip switches on one morph with its Power; each flip fires once
+        done = set()
+        while True:
+            flips = [m for m in np.flatnonzero(out).tolist() if self.types[m] == FLIP and m not in done]
+            if len(flips) == 0:
+                break
+            for m in flips:
+                done.add(m)
+                children, powers = graph.children(m)
+                if out[m] <= 0 or len(children) == 0:
+                    continue
+                pick = int(np.clip((len(children) + 1) * out[m] - 1, 0, len(children) - 1))
+                leaves, factors = graph.leaves(int(children[pick]))
+                np.add.at(out, leaves, factors * powers[pick])
+        return out
+
+    def weight_array(self, weights) -> np.ndarray:
+        # weights: (morphs,) array or {index or name: weight}
+        if not isinstance(weights, dict):
+            return np.asarray(weights, dtype=np.float64).reshape(len(self))
+        out = np.zeros(len(self), dtype=np.float64)
+        for (key, value) in weights.items():
+            key = self.names[key] if isinstance(key, str) else key
+            out[key] += value
+        return out
+
+    def _active(self, weights, types):
+        active = np.flatnonzero((weights != 0) & np.isin(self.types, types))
+        return active, weights[active]
+
+    def vertex_deltas(self, weights, vertex_count):
+        vertex = np.zeros((vertex_count, 3), dtype=np.float64)
+        active, w = self._active(weights, (VERTEX,))
+        pos, w = self.vertex.gather(active, w)
+        index = self.vertex.index[pos]
+        keep = (index >= 0) & (index < vertex_count)
+        pos, w, index = pos[keep], w[keep], index[keep]
+        for c in range(3):
+            vertex[:, c] = np.bincount(index, weights=self.vertex.values[pos, c] * w, minlength=vertex_count)
+
+        uv = np.zeros((UV_CHANNELS * vertex_count, 4), dtype=np.float64)
+        active, w = self._active(weights, (3, 4, 5, 6, 7))
+        pos, w = self.uv.gather(active, w)
+        index = self.uv.index[pos]
+        keep = (index >= 0) & (index < vertex_count)
+        pos, w = pos[keep], w[keep]
+        slot = self.uv.extra[pos] * vertex_count + index[keep]
+        for c in range(4):
+            uv[:, c] = np.bincount(slot, weights=self.uv.values[pos, c] * w, minlength=len(uv))
+        return vertex, uv.reshape(UV_CHANNELS, vertex_count, 4)
+
+    def bone_deltas(self, weights, bone_count):
+        move = np.zeros((bone_count, 3), dtype=np.float64)
+        rotate = np.tile(IDENTITY_QUAT, (bone_count, 1))
+        active, w = self._active(weights, (BONE,))
+        pos, w = self.bone.gather(active, w)
+        index = self.bone.index[pos]
+        keep = (index >= 0) & (index < bone_count)
+        pos, w, index = pos[keep], w[keep], index[keep]
+        if len(pos) == 0:
+            return move, rotate
+
+        np.add.at(move, index, self.bone.values[pos, :3] * w[:, None])
+        quat = self.bone.values[pos, 3:]
+        norm = np.linalg.norm(quat, axis=1, keepdims=True)
+        quat = np.where(norm > 0, quat / np.where(norm > 0, norm, 1.0), IDENTITY_QUAT)
+        quat = rotation.quat_slerp(IDENTITY_QUAT, quat, w)
+
+        # compose the morphs acting on one bone in morph order
+        order = np.argsort(index, kind='stable')
+        index, quat = index[order], quat[order]
+        start = np.searchsorted(index, index)
+        rank = np.arange(len(index)) - start
+        for r in range(int(rank.max()) + 1):
+            at = rank == r
+            rotate[index[at]] = rotation.quat_multiply(rotate[index[at]], quat[at])
+        return move, rotate
+
+    def material_deltas(self, weights, material_count):
+        mul = np.ones((material_count, MATERIAL_WIDTH), dtype=np.float64)
+        add = np.zeros((material_count, MATERIAL_WIDTH), dtype=np.float64)
+        active, w = self._active(weights, (MATERIAL,))
+        pos, w = self.material.gather(active, w)
+        index = self.material.index[pos]
+
+        # Index -1 targets every material
+        spread = np.where(index < 0, material_count, 1)
+        pos, w, index = np.repeat(pos, spread), np.repeat(w, spread), np.repeat(index, spread)
+        within = np.arange(len(index)) - np.repeat(np.cumsum(spread) - spread, spread)
+        index = np.where(index < 0, within, index)
+        keep = (index >= 0) & (index < material_count)
+        pos, w, index = pos[keep], w[keep], index[keep]
+
+        values = self.material.values[pos]
+        multiply = self.material.extra[pos] == 0
+        np.multiply.at(mul, index[multiply], 1.0 + (values[multiply] - 1.0) * w[multiply, None])
+        np.add.at(add, index[~multiply], values[~multiply] * w[~multiply, None])
+        return mul, add
+
+
+def build_morph_data(model) -> MorphData:
+    return MorphData(model.Morphs)
+
+
+def evaluate_morphs(model, weights) -> MorphResult:
+    data = model.cached('morph_data', ('Morphs',), lambda: build_morph_data(model))
+    weights = data.resolve(model.morph_graph(), data.weight_array(weights))
+    vertex, uv = data.vertex_deltas(weights, len(model.Vertices))
+    bone_move, bone_rotate = data.bone_deltas(weights, len(model.Bones))
+    material_mul, material_add = data.material_deltas(weights, len(model.Materials))
+    return MorphResult(weights, vertex, uv, bone_move, bone_rotate, material_mul, material_add)
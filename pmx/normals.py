@@ -0,0 +1,92 @@
+#
+# normals.py : recompute vertex normals from the triangles
+#
+# Face normals follow the PMX winding, cross(p1 - p0, p2 - p0) points out.
+#
+
+import numpy as np
+
+from . import columns
+from . import remap
+
+MODES = ('area', 'angle')
+
+
+def face_normals(positions, faces) -> np.ndarray:
+    # unnormalised: length is twice the triangle area
+    p0, p1, p2 = positions[faces[:, 0]], positions[faces[:, 1]], positions[faces[:, 2]]
+    return np.cross(p1 - p0, p2 - p0)
+
+
+def _unit(vectors):
+    length = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(length > 0, length, 1.0)
+
+
+def corner_angles(positions, faces) -> np.ndarray:
+    '''Interior angle at each corner, shape (n, 3).'''
+    corners = positions[faces]
+    angles = np.empty(faces.shape)
+    for i in range(3):
+        a = _unit(corners[:, (i + 1) % 3] - corners[:, i])
+        b = _unit(corners[:, (i + 2) % 3] - corners[:, i])
+        angles[:, i] = np.arccos(np.clip(np.einsum('ij,ij->i', a, b), -1.0, 1.0))
+    return angles
+
+
+def vertex_normals(positions, faces, mode='area') -> np.ndarray:
+    '''Accumulated, normalised vertex normals; zero rows for unused vertices.'''
+    if mode not in MODES:
+        raise ValueError("mode must be one of %s" % (MODES,))
+    normals = face_normals(positions, faces)
+    if mode == 'area':
+        weighted = np.repeat(normals[:, None, :], 3, axis=1)
+    else:
+        weighted = _unit(normals)[:, None, :] * corner_angles(positions, faces)[:, :, None]
+
+    result = np.zeros((len(positions), 3))
+    np.add.at(result, faces.ravel(), weighted.reshape(-1, 3))
+    return _unit(result)
+
+
+def split_material_vertices(model) -> int:
+    '''Duplicate vertices shared by several materials so every material owns
+    its vertices. Morph offsets and soft-body references follow (see
+    remap.duplicate_vertices). Returns the number of vertices added.'''
+    ranges = model.material_ranges()
+    faces = model.face_array()
+    count = int(ranges.ends[-1]) if len(ranges) else 0
+    mats = np.repeat(ranges.triangle_materials().astype(np.int64), 3)
+    verts = faces[:count].ravel()
+
+    # (vertex, material) pairs; the first material of a vertex keeps it
+    pairs, inverse = np.unique(np.stack((verts, mats), axis=1), axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    first = np.ones(len(pairs), dtype=bool)
+    first[1:] = pairs[1:, 0] != pairs[:-1, 0]
+    clones = np.flatnonzero(~first)
+    if len(clones) == 0:
+        return 0
+
+    target = pairs[:, 0].copy()
+    target[clones] = remap.duplicate_vertices(model, pairs[clones, 0], pairs[clones, 1])
+    new_faces = faces.ravel().copy()
+    new_faces[:count * 3] = target[inverse]
+    model.Faces = new_faces.tolist()
+    model.invalidate()
+    return len(clones)
+
+
+def recompute_normals(model, mode='area', split_by_material=False) -> int:
+    '''Rebuild PMVertex.Normal from the faces. Vertices without usable faces
+    keep their normal. Returns the number of vertices split_by_material added.'''
+    if mode not in MODES:
+        raise ValueError("mode must be one of %s" % (MODES,))
+    added = split_material_vertices(model) if split_by_material else 0
+
+    positions = columns.position_columns(model.Vertices)
+    normals = vertex_normals(positions, model.face_array(), mode)
+    valid = np.any(normals != 0, axis=1)
+    normals[~valid] = columns.normal_columns(model.Vertices)[~valid]
+    columns.store_vectors(model.Vertices, 'Normal', normals)
+    return added
@@ -257,6 +257,9 @@ class Model(object):
     #    Rigids = []
     #    Joints = []
     #    SoftBodies = []
+    #
+    # Derived data (see cached / invalidate)
+    #    _cache = {}
 
     def __init__(self):
         # Status
@@ -286,7 +289,136 @@ class Model(object):
         self.Joints = []
         self.SoftBodies = []
 
+        # Derived data
+        self._cache = {}
+
+    def cached(self, key, sections, build):
+        # Rebuilt when any listed section is replaced or changes length.
+        # In-place edits of existing records need an explicit invalidate().
+        stamp = tuple((id(getattr(self, s)), len(getattr(self, s))) for s in sections)
+        entry = self._cache.get(key)
+        if entry is None or entry[0] != stamp:
+            entry = (stamp, tuple(sections), build())
+            self._cache[key] = entry
+        return entry[2]
+
+    def invalidate(self, *sections):
+        if len(sections) == 0:
+            self._cache.clear()
+            return
+        for key in [k for (k, e) in self._cache.items() if set(e[1]) & set(sections)]:
+            del self._cache[key]
+
+    def bone_vertex_index(self):
+        from . import index
+        return self.cached('bone_vertex', ('Vertices', 'Bones'),
+                           lambda: index.build_bone_vertex_index(self))
+
+    def vertex_morph_index(self):
+        from . import index
+        return self.cached('vertex_morph', ('Vertices', 'Morphs'),
+                           lambda: index.build_vertex_morph_index(self))
+
+    def face_array(self):
+        from . import columns
+        return self.cached('faces', ('Faces',), lambda: columns.face_columns(self.Faces))
+
+    def material_ranges(self):
+        from . import index
+        return self.cached('material_ranges', ('Materials', 'Faces'),
+                           lambda: index.build_material_ranges(self))
+
+    def name_index(self, section='Bones'):
+        from . import index
+        return self.cached(('names', section), (section,),
+                           lambda: index.build_name_index(getattr(self, section)))
+
+    def vertex_index(self):
+        from . import spatial
+        return self.cached('vertex_grid', ('Vertices',), lambda: spatial.build_vertex_grid(self))
+
+    def transform(self, matrix, scale=1.0):
+        from . import transform
+        transform.Transform(matrix, scale).apply(self)
+
+    def optimize_vertex_cache(self, cache_size=32):
+        from . import vcache
+        return vcache.optimize_vertex_cache(self, cache_size)
+
+    def prune(self):
+        from . import prune
+        return prune.prune(self)
+
+    def plan_save(self, shrink=False):
+        from . import saveplan
+        return saveplan.plan_save(self, shrink)
+
+    def weld(self, epsilon=1e-5):
+        from . import weld
+        return weld.weld(self, epsilon)
+
+    def recompute_normals(self, mode='area', split_by_material=False):
+        from . import normals
+        return normals.recompute_normals(self, mode, split_by_material)
+
+    def normalize_weights(self, max_influences=4, prune_below=1e-4):
+        from . import weights
+        return weights.normalize_weights(self, max_influences, prune_below)
+
+    def skin(self, world):
+        from . import skinning
+        return skinning.skin_model(self, world)
+
+    def skeleton(self):
+        from . import kinematics
+        return self.cached('skeleton', ('Bones',), lambda: kinematics.build_skeleton(self))
+
+    def forward_kinematics(self, rotations=None, translations=None, ik=True):
+        return self.skeleton().evaluate(rotations, translations, ik)
+
+    def morph_graph(self):
+        from . import morphs
+        return self.cached('morph_graph', ('Morphs',), lambda: morphs.build_morph_graph(self))
+
+    def evaluate_morphs(self, weights):
+        from . import morphs
+        return morphs.evaluate_morphs(self, weights)
+
+    def decimate(self, ratio):
+        from . import decimate
+        return decimate.decimate(self, ratio)
+
+    def compact_morphs(self, epsilon=1e-5):
+        from . import compact
+        return compact.compact_morphs(self, epsilon)
+
+    def bounds(self):
+        from . import bounds
+        return self.cached('bounds', ('Vertices', 'Faces', 'Materials', 'Bones'),
+                           lambda: bounds.build_bounds(self))
+
+    def update_bounds(self, start, end):
+        # after editing Vertices[start:end] in place
+        self.bounds().update(self.Vertices, start, end)
+
+    def fit_rigids(self, bones=None, shape='capsule', min_weight=0.5):
+        from . import rigidfit
+        return rigidfit.fit_rigids(self, bones, shape, min_weight)
+
+    def generate_joints(self, rigids=None, preset='hair', horizontal=False, link_preset='skirt_link'):
+        from . import joints
+        return joints.generate_joints(self, rigids, preset, horizontal, link_preset)
+
+    def collision_table(self):
+        from . import collision
+        return self.cached('collision', ('Rigids',), lambda: collision.build_collision_table(self))
+
+    def split(self, by='material', roots=None):
+        from . import split
+        return split.split(self, by, roots)
+
     def Load(self, f):
+        self.invalidate()
         self.Status.Load(f)
 
         if self.Status.Magic == 0:  # PMD
@@ -519,9 +651,7 @@ class PMVertex(object):
         self.Normal = mathutils.Vector(ReadStruct(f, "3f"))
         self.UV = mathutils.Vector(ReadStruct(f, "2f"))
 
-        self.AppendUV = [mathutils.Vector((0, 0, 0, 0))] * mode.AppendUVCount
-        for tempUV in self.AppendUV:
-            ReadStruct(f, "4f")
+        self.AppendUV = [mathutils.Vector(ReadStruct(f, "4f")) for i in range(mode.AppendUVCount)]
 
         self.Type = ReadStruct(f, "b")
 
@@ -579,7 +709,7 @@ class PMVertex(object):
         WriteStruct(f, "2f", self.UV.to_tuple())
 
         for index in range(mode.AppendUVCount):
-            WriteStruct(f, "4f", self.AppendUV[index])
+            WriteStruct(f, "4f", self.AppendUV[index].to_tuple())
 
         WriteStruct(f, "b", self.Type)
 
@@ -609,6 +739,16 @@ class PMVertex(object):
             WriteStruct(f, "3f", self.Weights[2].to_tuple())
             WriteStruct(f, "3f", self.Weights[3].to_tuple())
 
+        elif self.Type == 4:  # 4:QDEF
+            WriteStruct(f, mode.BoneIndexSize, self.Bones[0])
+            WriteStruct(f, mode.BoneIndexSize, self.Bones[1])
+            WriteStruct(f, mode.BoneIndexSize, self.Bones[2])
+            WriteStruct(f, mode.BoneIndexSize, self.Bones[3])
+            WriteStruct(f, "f", self.Weights[0])
+            WriteStruct(f, "f", self.Weights[1])
+            WriteStruct(f, "f", self.Weights[2])
+            WriteStruct(f, "f", self.Weights[3])
+
         WriteStruct(f, "f", self.EdgeSize)
 
 
@@ -1344,7 +1484,7 @@ class PMSoftBody(object):
         self.Anchors = [0] * count
         for i in range(count):
             self.Anchors[i] = [0, 0, 0]
-            self.Anchors[i][0] = ReadStruct(f, mode.RegidIndexSize)
+            self.Anchors[i][0] = ReadStruct(f, mode.RigidIndexSize)
             self.Anchors[i][1] = ReadStruct(f, mode.VertexIndexSize)
             self.Anchors[i][2] = ReadStruct(f, "B")  # [0:OFF 1:ON ]
 
@@ -1386,11 +1526,10 @@ class PMSoftBody(object):
         count = len(self.Anchors)
         WriteStruct(f, "i", count)
         for i in range(count):
-            WriteStruct(f, mode.RegidIndexSize, self.Anchors[i][0])
+            WriteStruct(f, mode.RigidIndexSize, self.Anchors[i][0])
             WriteStruct(f, mode.VertexIndexSize, self.Anchors[i][1])
             WriteStruct(f, "B", self.Anchors[i][2])
 
-        self.Pins = []
         count = len(self.Pins)
         WriteStruct(f, "i", count)
         for i in range(count):
@@ -1399,6 +1538,16 @@ class PMSoftBody(object):
         return
 
 
+def merge(models, bone_match='name'):
+    from . import merge as pmx_merge
+    return pmx_merge.merge(models, bone_match)
+
+
+def diff(a, b, tolerance=1e-5):
+    from . import diff as pmx_diff
+    return pmx_diff.diff(a, b, tolerance)
+
+
 #
 # main
 #
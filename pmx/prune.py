@@ -0,0 +1,130 @@
+#
+# prune.py : drop unreferenced vertices, textures and helper bones
+#
+
+import io
+
+import numpy as np
+
+from dataclasses import dataclass
+from dataclasses import field
+
+from typing import Dict
+
+from . import remap
+
+
+@dataclass
+class PruneReport:
+    removed_vertices: int = 0
+    removed_textures: int = 0
+    removed_bones: int = 0
+    bytes_before: int = 0
+    bytes_after: int = 0
+    index_sizes_before: Dict[str, str] = field(default_factory=dict)
+    index_sizes_after: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.bytes_before - self.bytes_after
+
+
+def index_sizes(model) -> Dict[str, str]:
+    # the widths Model.Save will pick through paramSize
+    from .pmx import paramSize
+    return {
+        'Vertex': paramSize(model.Vertices, 1),
+        'Texture': paramSize(model.Textures, 0),
+        'Material': paramSize(model.Materials, 0),
+        'Bone': paramSize(model.Bones, 0),
+        'Morph': paramSize(model.Morphs, 0),
+        'Rigid': paramSize(model.Rigids, 0),
+    }
+
+
+def saved_size(model) -> int:
+    buffer = io.BytesIO()
+    model.Save(buffer)
+    return buffer.tell()
+
+
+def _mark(mask, index):
+    index = np.asarray(index, dtype=np.int64).ravel()
+    mask[index[(index >= 0) & (index < len(mask))]] = True
+
+
+def used_vertices(model) -> np.ndarray:
+    used = np.zeros(len(model.Vertices), dtype=bool)
+    _mark(used, model.face_array())
+    for soft in model.SoftBodies:
+        _mark(used, [a[1] for a in soft.Anchors])
+        _mark(used, soft.Pins)
+    return used
+
+
+def used_textures(model) -> np.ndarray:
+    used = np.zeros(len(model.Textures), dtype=bool)
+    _mark(used, [m.TextureIndex for m in model.Materials])
+    _mark(used, [m.SphereIndex for m in model.Materials])
+    _mark(used, [m.ToonIndex for m in model.Materials if remap.toon_texture(m)])
+    return used
+
+
+def used_bones(model, vertex_mask=None) -> np.ndarray:
+    '''Bones with weights, bone morph, IK, rigid or display references, plus
+    every parent and append source those bones depend on.'''
+    bone_count = len(model.Bones)
+    bone_vertex = model.bone_vertex_index()
+    if vertex_mask is None:
+        used = bone_vertex.counts() > 0
+    else:
+        used = np.zeros(bone_count, dtype=bool)
+        _mark(used, bone_vertex.bone_ids()[vertex_mask[bone_vertex.vertices]])
+
+    _mark(used, [o.Index for m in model.Morphs if m.Type == 2 for o in m.Offsets])
+    _mark(used, [r.Bone for r in model.Rigids])
+    _mark(used, [m[1] for f in model.DisplayFrames for m in f.Members if m[0] == 0])
+    for (bone_index, bone) in enumerate(model.Bones):
+        if bone.UseIK == 1:
+            _mark(used, [bone_index, bone.IK.TargetIndex] + [link.Index for link in bone.IK.Member])
+
+    parent = np.array([b.Parent for b in model.Bones], dtype=np.int64)
+    append = np.array([b.AdditionalBoneIndex if (b.AdditionalRotation == 1 or b.AdditionalMovement == 1) else -1
+                       for b in model.Bones], dtype=np.int64)
+    while True:
+        before = int(used.sum())
+        _mark(used, parent[used])
+        _mark(used, append[used])
+        if int(used.sum()) == before:
+            return used
+
+
+def _old_to_new(mask):
+    old_to_new = np.full(len(mask), -1, dtype=np.int64)
+    old_to_new[mask] = np.arange(int(mask.sum()))
+    return old_to_new
+
+
+def prune(model) -> PruneReport:
+    report = PruneReport()
+    report.index_sizes_before = index_sizes(model)
+    report.bytes_before = saved_size(model)
+
+    vertex_mask = used_vertices(model)
+    bone_mask = used_bones(model, vertex_mask)
+    texture_mask = used_textures(model)
+
+    report.removed_vertices = int((~vertex_mask).sum())
+    report.removed_bones = int((~bone_mask).sum())
+    report.removed_textures = int((~texture_mask).sum())
+
+    if report.removed_vertices:
+        remap.remap_vertices(model, _old_to_new(vertex_mask))
+    if report.removed_bones:
+        remap.remap_bones(model, _old_to_new(bone_mask))
+    if report.removed_textures:
+        remap.remap_textures(model, _old_to_new(texture_mask))
+
+    report.index_sizes_after = index_sizes(model)
+    report.bytes_after = saved_size(model)
+    return report
@@ -0,0 +1,217 @@
+#
+# remap.py : rewrite every index field of pmx.Model after reordering or deleting elements
+#
+
+import copy
+
+import numpy as np
+
+from . import columns
+
+
+def _reorder(records, old_to_new):
+    # several old records may share a new index (merge); the first one wins
+    keep = np.flatnonzero(old_to_new >= 0)[::-1]
+    result = [None] * (int(old_to_new[keep].max()) + 1 if len(keep) else 0)
+    for (old, new) in zip(keep.tolist(), old_to_new[keep].tolist()):
+        result[new] = records[old]
+    return result
+
+
+def _first_valid(index):
+    # mask of entries that are >= 0 and the first occurrence of their value
+    first = np.zeros(len(index), dtype=bool)
+    first[np.unique(index, return_index=True)[1]] = True
+    return first & (index >= 0)
+
+
+def lookup(old_to_new, index):
+    # index -> new index, -1 for removed or out of range
+    index = np.asarray(index, dtype=np.int64)
+    if len(old_to_new) == 0:
+        return np.full(index.shape, -1, dtype=np.int64)
+    inside = (index >= 0) & (index < len(old_to_new))
+    return np.where(inside, old_to_new[np.where(inside, index, 0)], -1)
+
+
+def _fold_offsets(morph, old, index, old_to_new):
+    # offsets of a merge: those of the first vertex of each group (merged
+    # vertices are the same vertex), repeated offsets of one vertex summed
+    owner = np.full(int(old_to_new.max()) + 1, -1, dtype=np.int64)
+    kept = np.flatnonzero(old_to_new >= 0)[::-1]
+    owner[old_to_new[kept]] = kept
+    rows = np.flatnonzero(index >= 0)
+    rows = rows[owner[index[rows]] == old[rows]]
+    if len(rows) == 0:
+        return []
+    attr = 'Move' if morph.Type == 1 else 'UV'
+    values = np.array([tuple(getattr(morph.Offsets[r], attr)) for r in rows.tolist()], dtype=np.float64)
+    _, first, inverse = np.unique(index[rows], return_index=True, return_inverse=True)
+    summed = np.zeros((len(first), values.shape[1]))
+    np.add.at(summed, inverse.ravel(), values)
+    order = np.argsort(first)
+    offsets = [morph.Offsets[r] for r in rows[first[order]].tolist()]
+    columns.store_vectors(offsets, attr, summed[order])
+    for (o, i) in zip(offsets, index[rows[first[order]]].tolist()):
+        o.Index = i
+    return offsets
+
+
+def remap_vertices(model, old_to_new):
+    '''Reorder/delete vertices. old_to_new[i] is the new index of vertex i or -1.
+
+    Triangles touching a deleted vertex are dropped (material FaceLength
+    follows), as are vertex/UV morph offsets and soft-body anchors/pins.
+    Vertices mapped to the same new index are merged: the first record and
+    its morph offsets are kept, repeated offsets of it summed. Without
+    merges offsets are only reindexed, repeated ones included.
+    '''
+    old_to_new = np.asarray(old_to_new, dtype=np.int64)
+    ranges = model.material_ranges()
+    faces = model.face_array()
+
+    new_faces = lookup(old_to_new, faces)
+    valid = np.all(new_faces >= 0, axis=1)
+    if not valid.all():
+        material_tris = ranges.triangle_materials()
+        kept = np.bincount(material_tris[valid[:len(material_tris)]], minlength=len(ranges))
+        for (material, count) in zip(model.Materials, kept.tolist()):
+            material.FaceLength = count * 3
+
+    targets = old_to_new[old_to_new >= 0]
+    merges = len(np.unique(targets)) < len(targets)
+    model.Vertices = _reorder(model.Vertices, old_to_new)
+    model.Faces = new_faces[valid].ravel().tolist()
+
+    for morph in model.Morphs:
+        if morph.Type not in columns.VERTEX_MORPH_TYPES:
+            continue
+        old = np.array([o.Index for o in morph.Offsets], dtype=np.int64)
+        index = lookup(old_to_new, old)
+        if merges:
+            morph.Offsets = _fold_offsets(morph, old, index, old_to_new)
+            continue
+        keep = index >= 0
+        morph.Offsets = [o for (o, k) in zip(morph.Offsets, keep.tolist()) if k]
+        for (o, i) in zip(morph.Offsets, index[keep].tolist()):
+            o.Index = i
+
+    for soft in model.SoftBodies:
+        index = lookup(old_to_new, [a[1] for a in soft.Anchors])
+        soft.Anchors = [[a[0], i, a[2]] for (a, i) in zip(soft.Anchors, index.tolist()) if i >= 0]
+        index = lookup(old_to_new, soft.Pins)
+        soft.Pins = index[_first_valid(index)].tolist()
+
+    model.invalidate()
+
+
+def duplicate_vertices(model, source, materials) -> np.ndarray:
+    '''Append copies of the vertices source, copy k for material materials[k].
+
+    The vertex/UV morph offsets of a source vertex are copied to its copy,
+    and the anchors and pins of a soft body on materials[k] naming
+    source[k] move to copy k. Faces are left to the caller. Returns the
+    indices of the copies.
+    '''
+    source = np.asarray(source, dtype=np.int64)
+    materials = np.asarray(materials, dtype=np.int64)
+    copies = len(model.Vertices) + np.arange(len(source))
+
+    morph_index = model.vertex_morph_index()
+    _, morphs, rows = morph_index.entries(source)
+    slot = np.repeat(np.arange(len(source)), morph_index.offsets[source + 1] - morph_index.offsets[source])
+    model.Vertices = model.Vertices + [copy.deepcopy(model.Vertices[v]) for v in source.tolist()]
+    for (m, r, s) in zip(morphs.tolist(), rows.tolist(), slot.tolist()):
+        offset = copy.deepcopy(model.Morphs[m].Offsets[r])
+        offset.Index = int(copies[s])
+        model.Morphs[m].Offsets.append(offset)
+
+    for soft in model.SoftBodies:
+        mine = materials == soft.Material
+        if not mine.any():
+            continue
+        table = np.arange(len(model.Vertices))
+        table[source[mine]] = copies[mine]
+        anchors = lookup(table, [a[1] for a in soft.Anchors]).tolist()
+        soft.Anchors = [[a[0], i if i >= 0 else a[1], a[2]] for (a, i) in zip(soft.Anchors, anchors)]
+        soft.Pins = [i if i >= 0 else p for (p, i) in zip(soft.Pins, lookup(table, soft.Pins).tolist())]
+
+    model.invalidate()
+    return copies
+
+
+def _new_index(old_to_new, index):
+    if 0 <= index < len(old_to_new):
+        return int(old_to_new[index])
+    return -1
+
+
+def remap_bones(model, old_to_new):
+    '''Reorder/delete bones. old_to_new[i] is the new index of bone i or -1.
+
+    Removed parents, children, append and IK references become -1 (append
+    and IK flags are cleared); bone morph offsets and display frame members
+    of removed bones are dropped. A weight slot naming a removed bone is
+    pointed at the vertex's first surviving bone.
+    '''
+    old_to_new = np.asarray(old_to_new, dtype=np.int64)
+
+    for vert in model.Vertices:
+        bones = [_new_index(old_to_new, b) for b in vert.Bones]
+        fallback = next((b for b in bones if b >= 0), 0)
+        vert.Bones = [b if b >= 0 else fallback for b in bones]
+
+    for bone in model.Bones:
+        bone.Parent = _new_index(old_to_new, bone.Parent)
+        if bone.ToConnectType == 1:
+            bone.ChildIndex = _new_index(old_to_new, bone.ChildIndex)
+        if bone.AdditionalRotation == 1 or bone.AdditionalMovement == 1:
+            bone.AdditionalBoneIndex = _new_index(old_to_new, bone.AdditionalBoneIndex)
+            if bone.AdditionalBoneIndex < 0:
+                bone.AdditionalRotation = 0
+                bone.AdditionalMovement = 0
+        if bone.UseIK == 1:
+            bone.IK.TargetIndex = _new_index(old_to_new, bone.IK.TargetIndex)
+            for link in bone.IK.Member:
+                link.Index = _new_index(old_to_new, link.Index)
+            bone.IK.Member = [link for link in bone.IK.Member if link.Index >= 0]
+            if bone.IK.TargetIndex < 0:
+                bone.UseIK = 0
+    model.Bones = _reorder(model.Bones, old_to_new)
+
+    for morph in model.Morphs:
+        if morph.Type != 2:
+            continue
+        for offset in morph.Offsets:
+            offset.Index = _new_index(old_to_new, offset.Index)
+        morph.Offsets = [o for o in morph.Offsets if o.Index >= 0]
+
+    for frame in model.DisplayFrames:
+        for member in frame.Members:
+            if member[0] == 0:
+                member[1] = _new_index(old_to_new, member[1])
+        frame.Members = [m for m in frame.Members if m[0] != 0 or m[1] >= 0]
+
+    for rigid in model.Rigids:
+        rigid.Bone = _new_index(old_to_new, rigid.Bone)
+
+    model.invalidate()
+
+
+def toon_texture(material):
+    # UseSystemToon 0: ToonIndex refers to Textures (PMX "individual toon")
+    return material.UseSystemToon == 0
+
+
+def remap_textures(model, old_to_new):
+    '''Reorder/delete textures; removed references become -1.'''
+    old_to_new = np.asarray(old_to_new, dtype=np.int64)
+
+    for material in model.Materials:
+        material.TextureIndex = _new_index(old_to_new, material.TextureIndex)
+        material.SphereIndex = _new_index(old_to_new, material.SphereIndex)
+        if toon_texture(material):
+            material.ToonIndex = _new_index(old_to_new, material.ToonIndex)
+    model.Textures = _reorder(model.Textures, old_to_new)
+
+    model.invalidate()
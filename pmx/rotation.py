@@ -0,0 +1,121 @@
+#
+# rotation.py : batched rotation conversions (column vectors, radians)
+#
+# Euler angles follow the PMX rigid/joint convention (yaw-pitch-roll):
+#    M = Ry(y) @ Rx(x) @ Rz(z)
+# Quaternions are stored (x, y, z, w) as in PMMorphOffset.Rotate.
+#
+
+import numpy as np
+
+
+def euler_to_matrix(angles) -> np.ndarray:
+    angles = np.asarray(angles, dtype=np.float64)
+    cx, cy, cz = np.cos(angles[..., 0]), np.cos(angles[..., 1]), np.cos(angles[..., 2])
+    sx, sy, sz = np.sin(angles[..., 0]), np.sin(angles[..., 1]), np.sin(angles[..., 2])
+
+    mat = np.empty(angles.shape[:-1] + (3, 3))
+    mat[..., 0, 0] = cy * cz + sy * sx * sz
+    mat[..., 0, 1] = -cy * sz + sy * sx * cz
+    mat[..., 0, 2] = sy * cx
+    mat[..., 1, 0] = cx * sz
+    mat[..., 1, 1] = cx * cz
+    mat[..., 1, 2] = -sx
+    mat[..., 2, 0] = -sy * cz + cy * sx * sz
+    mat[..., 2, 1] = sy * sz + cy * sx * cz
+    mat[..., 2, 2] = cy * cx
+    return mat
+
+
+def matrix_to_euler(mat) -> np.ndarray:
+    mat = np.asarray(mat, dtype=np.float64)
+    x = np.arcsin(np.clip(-mat[..., 1, 2], -1.0, 1.0))
+    y = np.arctan2(mat[..., 0, 2], mat[..., 2, 2])
+    z = np.arctan2(mat[..., 1, 0], mat[..., 1, 1])
+
+    # gimbal lock: cos(x) == 0, put everything into y
+    lock = np.hypot(mat[..., 1, 0], mat[..., 1, 1]) < 1e-9
+    y = np.where(lock, np.arctan2(-mat[..., 2, 0], mat[..., 0, 0]), y)
+    z = np.where(lock, 0.0, z)
+    return np.stack((x, y, z), axis=-1)
+
+
+def quat_to_matrix(quat) -> np.ndarray:
+    quat = np.asarray(quat, dtype=np.float64)
+    norm = np.linalg.norm(quat, axis=-1, keepdims=True)
+    x, y, z, w = np.moveaxis(quat / np.where(norm == 0.0, 1.0, norm), -1, 0)
+
+    mat = np.empty(quat.shape[:-1] + (3, 3))
+    mat[..., 0, 0] = 1 - 2 * (y * y + z * z)
+    mat[..., 0, 1] = 2 * (x * y - z * w)
+    mat[..., 0, 2] = 2 * (x * z + y * w)
+    mat[..., 1, 0] = 2 * (x * y + z * w)
+    mat[..., 1, 1] = 1 - 2 * (x * x + z * z)
+    mat[..., 1, 2] = 2 * (y * z - x * w)
+    mat[..., 2, 0] = 2 * (x * z - y * w)
+    mat[..., 2, 1] = 2 * (y * z + x * w)
+    mat[..., 2, 2] = 1 - 2 * (x * x + y * y)
+    return mat
+
+
+def matrix_to_quat(mat) -> np.ndarray:
+    mat = np.asarray(mat, dtype=np.float64)
+    m = [[mat[..., i, j] for j in range(3)] for i in range(3)]
+
+    # Shepperd: solve from the largest of w, x, y, z to stay well conditioned
+    diag = np.stack((1 + m[0][0] + m[1][1] + m[2][2],
+                     1 + m[0][0] - m[1][1] - m[2][2],
+                     1 - m[0][0] + m[1][1] - m[2][2],
+                     1 - m[0][0] - m[1][1] + m[2][2]), axis=-1)
+    root = np.sqrt(np.maximum(diag, 1e-300)) / 2
+    four = 4 * root
+    rw, rx, ry, rz = np.moveaxis(root, -1, 0)
+    fw, fx, fy, fz = np.moveaxis(four, -1, 0)
+
+    cand = np.stack((
+        np.stack(((m[2][1] - m[1][2]) / fw, (m[0][2] - m[2][0]) / fw, (m[1][0] - m[0][1]) / fw, rw), axis=-1),
+        np.stack((rx, (m[0][1] + m[1][0]) / fx, (m[0][2] + m[2][0]) / fx, (m[2][1] - m[1][2]) / fx), axis=-1),
+        np.stack(((m[0][1] + m[1][0]) / fy, ry, (m[1][2] + m[2][1]) / fy, (m[0][2] - m[2][0]) / fy), axis=-1),
+        np.stack(((m[0][2] + m[2][0]) / fz, (m[1][2] + m[2][1]) / fz, rz, (m[1][0] - m[0][1]) / fz), axis=-1),
+    ), axis=-2)
+    pick = np.argmax(diag, axis=-1)[..., None, None]
+    quat = np.take_along_axis(cand, pick, axis=-2)[..., 0, :]
+    return np.where(quat[..., 3:] < 0, -quat, quat)
+
+
+def quat_multiply(a, b) -> np.ndarray:
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    ax, ay, az, aw = np.moveaxis(a, -1, 0)
+    bx, by, bz, bw = np.moveaxis(b, -1, 0)
+    return np.stack((
+        aw * bx + ax * bw + ay * bz - az * by,
+        aw * by - ax * bz + ay * bw + az * bx,
+        aw * bz + ax * by - ay * bx + az * bw,
+        aw * bw - ax * bx - ay * by - az * bz,
+    ), axis=-1)
+
+
+def orthonormal(linear) -> np.ndarray:
+    # closest rotation or reflection to a 3x3 linear map (polar decomposition)
+    u, _, vt = np.linalg.svd(np.asarray(linear, dtype=np.float64))
+    return u @ vt
+
+
+def quat_slerp(a, b, t) -> np.ndarray:
+    # shortest-path spherical interpolation, t broadcast against a/b[..., 0]
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    t = np.asarray(t, dtype=np.float64)[..., None]
+    dot = np.sum(a * b, axis=-1, keepdims=True)
+    b = np.where(dot < 0, -b, b)
+    dot = np.abs(dot)
+
+    theta = np.arccos(np.clip(dot, -1.0, 1.0))
+    sin = np.sin(theta)
+    near = sin < 1e-6
+    safe = np.where(near, 1.0, sin)
+    wa = np.where(near, 1.0 - t, np.sin((1.0 - t) * theta) / safe)
+    wb = np.where(near, t, np.sin(t * theta) / safe)
+    out = wa * a + wb * b
+    return out / np.linalg.norm(out, axis=-1, keepdims=True)
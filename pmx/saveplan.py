@@ -0,0 +1,150 @@
+#
+# saveplan.py : index widths Model.Save will pick and what they cost
+#
+# PMX stores every vertex/texture/material/bone/morph/rigid reference with
+# one width per kind, chosen by paramSize from the list length alone.
+#
+
+import numpy as np
+
+from dataclasses import dataclass
+from dataclasses import field
+
+from typing import Dict
+from typing import Optional
+
+from . import prune as pmx_prune
+
+SECTIONS = {
+    # kind     : (Model attribute, is_vert)
+    'Vertex': ('Vertices', 1),
+    'Texture': ('Textures', 0),
+    'Material': ('Materials', 0),
+    'Bone': ('Bones', 0),
+    'Morph': ('Morphs', 0),
+    'Rigid': ('Rigids', 0),
+}
+
+# element count limit of each width (paramSize)
+WIDTHS = {
+    1: (('B', 1, 256), ('H', 2, 65536), ('i', 4, None)),
+    0: (('b', 1, 128), ('h', 2, 32768), ('i', 4, None)),
+}
+
+# bone references written per vertex, by weight type
+VERTEX_BONE_FIELDS = np.array([1, 2, 4, 2, 4])
+
+# kind of Index written by PMMorphOffset.Save, by morph type
+MORPH_OFFSET_KIND = {0: 'Morph', 1: 'Vertex', 2: 'Bone', 3: 'Vertex', 4: 'Vertex', 5: 'Vertex',
+                     6: 'Vertex', 7: 'Vertex', 8: 'Material', 9: 'Morph', 10: 'Rigid'}
+
+HOT_KINDS = ('Vertex', 'Bone')
+
+
+@dataclass
+class IndexCost:
+    kind: str = ''
+    count: int = 0          # elements in the section
+    size: str = ''          # struct format Save will use
+    fields: int = 0         # index fields written with that format
+    bytes: int = 0
+    widened_bytes: int = 0  # bytes above a 1 byte index
+    narrower: str = ''      # next smaller format, '' when already 1 byte
+    excess: int = 0         # elements to drop to fit narrower
+    narrower_savings: int = 0
+
+
+@dataclass
+class SavePlan:
+    costs: Dict[str, IndexCost] = field(default_factory=dict)
+    pruned: Optional[pmx_prune.PruneReport] = None
+
+    @property
+    def index_bytes(self) -> int:
+        return sum(c.bytes for c in self.costs.values())
+
+    @property
+    def widened_bytes(self) -> int:
+        return sum(c.widened_bytes for c in self.costs.values())
+
+
+def index_fields(model) -> Dict[str, int]:
+    '''Number of index fields of each kind Model.Save writes.'''
+    fields = dict.fromkeys(SECTIONS, 0)
+
+    fields['Vertex'] += len(model.Faces)
+    types = np.fromiter((v.Type for v in model.Vertices), dtype=np.int64, count=len(model.Vertices))
+    fields['Bone'] += int(VERTEX_BONE_FIELDS[types].sum())
+
+    for material in model.Materials:
+        fields['Texture'] += 2 + (material.UseSystemToon != 0)
+
+    for bone in model.Bones:
+        fields['Bone'] += 1 + (bone.ToConnectType == 1)
+        if bone.AdditionalRotation == 1 or bone.AdditionalMovement == 1:
+            fields['Bone'] += 1
+        if bone.UseIK == 1:
+            fields['Bone'] += 1 + len(bone.IK.Member)
+
+    for morph in model.Morphs:
+        kind = MORPH_OFFSET_KIND.get(morph.Type)
+        if kind is not None:
+            fields[kind] += len(morph.Offsets)
+
+    for frame in model.DisplayFrames:
+        for member in frame.Members:
+            fields['Bone' if member[0] == 0 else 'Morph'] += 1
+
+    fields['Bone'] += len(model.Rigids)
+    fields['Rigid'] += 2 * len(model.Joints)
+
+    for soft in model.SoftBodies:
+        fields['Material'] += 1
+        fields['Rigid'] += len(soft.Anchors)
+        fields['Vertex'] += len(soft.Anchors) + len(soft.Pins)
+    return fields
+
+
+def width_of(count, is_vert):
+    for (size, width, limit) in WIDTHS[is_vert]:
+        if limit is None or count < limit:
+            return (size, width, limit)
+
+
+def index_costs(model, fields=None) -> Dict[str, IndexCost]:
+    if fields is None:
+        fields = index_fields(model)
+    costs = {}
+    for (kind, (attr, is_vert)) in SECTIONS.items():
+        count = len(getattr(model, attr))
+        (size, width, _) = width_of(count, is_vert)
+        cost = IndexCost(kind=kind, count=count, size=size, fields=fields[kind])
+        cost.bytes = cost.fields * width
+        cost.widened_bytes = cost.fields * (width - 1)
+
+        formats = WIDTHS[is_vert]
+        step = [f[0] for f in formats].index(size)
+        if step > 0:
+            (narrower, narrower_width, limit) = formats[step - 1]
+            cost.narrower = narrower
+            cost.excess = count - limit + 1
+            cost.narrower_savings = cost.fields * (width - narrower_width)
+        costs[kind] = cost
+    return costs
+
+
+def plan_save(model, shrink=False) -> SavePlan:
+    '''Report index costs. With shrink, prune the model when dropping its
+    unused vertices/bones lets either of them fit a narrower index.'''
+    plan = SavePlan()
+    if shrink:
+        vertex_mask = pmx_prune.used_vertices(model)
+        bone_mask = pmx_prune.used_bones(model, vertex_mask)
+        kept = {'Vertex': int(vertex_mask.sum()), 'Bone': int(bone_mask.sum())}
+        for kind in HOT_KINDS:
+            (attr, is_vert) = SECTIONS[kind]
+            if width_of(kept[kind], is_vert)[1] < width_of(len(getattr(model, attr)), is_vert)[1]:
+                plan.pruned = pmx_prune.prune(model)
+                break
+    plan.costs = index_costs(model)
+    return plan
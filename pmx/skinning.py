@@ -0,0 +1,152 @@
+#
+# skinning.py : CPU vertex skinning of pmx.Model (column vectors, 4x4 matrices)
+#
+# world[b] is the posed world matrix of bone b. PMX bones have no rest
+# rotation, so the rest world matrix is a translation to PMBone.Position
+# and the skinning matrix is world[b] @ T(-Position[b]). world may carry
+# leading frame axes, (frames, bones, 4, 4) as Model.forward_kinematics
+# returns it, and poses every frame at once.
+#
+#    BDEF1/2/4 | linear blend
+#    SDEF      | spherical deformation from C, R0, R1
+#    QDEF      | dual quaternion blend
+#
+
+import numpy as np
+
+from . import columns
+from . import rotation
+
+
+class SkinData(object):
+    # positions, normals | (n, 3) rest pose
+    # types              | (n,) weight type
+    # bones, weights     | (n, 4) padded influences (see columns.weight_columns)
+    # sdef_ids           | (k,) SDEF vertices, sdef_params (k, 3, 3) C, R0, R1
+    # qdef_ids           | (q,) QDEF vertices
+
+    def __init__(self, positions, normals, types, bones, weights, sdef_ids, sdef_params):
+        self.positions = positions
+        self.normals = normals
+        self.types = types
+        self.bones = np.maximum(bones, 0)
+        self.weights = weights
+        self.sdef_ids = sdef_ids
+        self.sdef_params = sdef_params
+        self.qdef_ids = np.flatnonzero(types == columns.QDEF)
+
+    @classmethod
+    def build(cls, vertices):
+        types, bones, weights = columns.weight_columns(vertices)
+        sdef_ids, sdef_params = columns.sdef_columns(vertices)
+        return cls(columns.position_columns(vertices), columns.normal_columns(vertices),
+                   types, bones, weights, sdef_ids, sdef_params)
+
+    def __len__(self):
+        return len(self.types)
+
+
+def bind_matrices(model) -> np.ndarray:
+    '''Inverse rest matrices T(-Position), shape (bones, 4, 4).'''
+    bind = np.tile(np.eye(4), (len(model.Bones), 1, 1))
+    bind[:, :3, 3] = -np.array([tuple(b.Position) for b in model.Bones], dtype=np.float64).reshape(-1, 3)
+    return bind
+
+
+def rest_matrices(model) -> np.ndarray:
+    rest = np.tile(np.eye(4), (len(model.Bones), 1, 1))
+    rest[:, :3, 3] = -bind_matrices(model)[:, :3, 3]
+    return rest
+
+
+def _unit(vectors):
+    length = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(length > 0, length, 1.0)
+
+
+def _rotate(mat, vectors):
+    # linear part of (..., n, 3 or 4, 4) matrices on (..., n, 3) vectors
+    return np.einsum('...ij,...j->...i', mat[..., :3, :3], vectors)
+
+
+def _apply(mat, points):
+    # (..., n, 3, 4) or (..., n, 4, 4) affine matrices on (n, 3) points
+    return _rotate(mat, points) + mat[..., :3, 3]
+
+
+def linear_blend(data, skin):
+    blend = np.zeros(skin.shape[:-3] + (len(data), 3, 4))
+    for j in range(columns.MAX_INFLUENCES):
+        blend += data.weights[:, j, None, None] * skin[..., data.bones[:, j], :3, :]
+    positions = _apply(blend, data.positions)
+    normals = _unit(_rotate(blend, data.normals))
+    return positions, normals
+
+
+def sdef(data, skin, quats):
+    '''Spherical deformation of the SDEF vertices (MMD formulation).'''
+    ids = data.sdef_ids
+    b0, b1 = data.bones[ids, 0], data.bones[ids, 1]
+    w0, w1 = data.weights[ids, 0], data.weights[ids, 1]
+    c, r0, r1 = data.sdef_params[:, 0], data.sdef_params[:, 1], data.sdef_params[:, 2]
+
+    rw = r0 * w0[:, None] + r1 * w1[:, None]
+    cr0 = (c + (c + r0 - rw)) * 0.5
+    cr1 = (c + (c + r1 - rw)) * 0.5
+    rot = rotation.quat_to_matrix(rotation.quat_slerp(quats[..., b0, :], quats[..., b1, :], w1))
+
+    positions = (_rotate(rot, data.positions[ids] - c)
+                 + _apply(skin[..., b0, :, :], cr0) * w0[:, None] + _apply(skin[..., b1, :, :], cr1) * w1[:, None])
+    normals = _unit(_rotate(rot, data.normals[ids]))
+    return positions, normals
+
+
+def dual_quaternions(skin, quats) -> np.ndarray:
+    '''(..., bones, 8) real (x, y, z, w) and dual parts of the skinning matrices.'''
+    trans = np.concatenate((skin[..., :3, 3], np.zeros(skin.shape[:-2] + (1,))), axis=-1)
+    return np.concatenate((quats, 0.5 * rotation.quat_multiply(trans, quats)), axis=-1)
+
+
+def qdef(data, dual):
+    ids = data.qdef_ids
+    bones = data.bones[ids]
+    weights = data.weights[ids]
+
+    # blend in the hemisphere of the first influence
+    pivot = dual[..., bones[:, 0], :4]
+    blend = np.zeros(dual.shape[:-2] + (len(ids), 8))
+    for j in range(columns.MAX_INFLUENCES):
+        dq = dual[..., bones[:, j], :]
+        sign = np.where(np.sum(dq[..., :4] * pivot, axis=-1) < 0, -1.0, 1.0)
+        blend += (weights[:, j] * sign)[..., None] * dq
+
+    norm = np.linalg.norm(blend[..., :4], axis=-1, keepdims=True)
+    real, dual_part = blend[..., :4] / norm, blend[..., 4:] / norm
+    vr, wr = real[..., :3], real[..., 3:]
+    vd, wd = dual_part[..., :3], dual_part[..., 3:]
+    translation = 2.0 * (wr * vd - wd * vr + np.cross(vr, vd))
+
+    rot = rotation.quat_to_matrix(real)
+    positions = _rotate(rot, data.positions[ids]) + translation
+    normals = _unit(_rotate(rot, data.normals[ids]))
+    return positions, normals
+
+
+def skin(data, world, bind):
+    '''Posed (positions, normals), each (..., n, 3), for bone world matrices (..., bones, 4, 4).'''
+    matrices = np.asarray(world, dtype=np.float64) @ bind
+    positions, normals = linear_blend(data, matrices)
+    if len(data.sdef_ids) or len(data.qdef_ids):
+        quats = rotation.matrix_to_quat(rotation.orthonormal(matrices[..., :3, :3]))
+    if len(data.sdef_ids):
+        positions[..., data.sdef_ids, :], normals[..., data.sdef_ids, :] = sdef(data, matrices, quats)
+    if len(data.qdef_ids):
+        positions[..., data.qdef_ids, :], normals[..., data.qdef_ids, :] = \
+            qdef(data, dual_quaternions(matrices, quats))
+    return positions, normals
+
+
+def skin_model(model, world):
+    data = model.cached('skin_data', ('Vertices',), lambda: SkinData.build(model.Vertices))
+    bind = model.cached('bind_matrices', ('Bones',), lambda: bind_matrices(model))
+    return skin(data, world, bind)
@@ -0,0 +1,211 @@
+#
+# spatial.py : uniform grid over vertex positions for nearest-neighbour queries
+#
+
+import numpy as np
+
+from typing import Tuple
+
+from . import columns
+from .index import csr_gather
+from .index import csr_offsets
+
+POINTS_PER_CELL = 1.0
+QUERY_CHUNK = 65536
+
+
+DENSE_CELLS = 1 << 22
+
+
+def _cube(radius: int, dims: np.ndarray) -> np.ndarray:
+    # query cells are clamped into the grid, so offsets past dims - 1 never hit
+    sides = [np.arange(-min(radius, d - 1), min(radius, d - 1) + 1) for d in dims.tolist()]
+    return np.stack(np.meshgrid(*sides, indexing='ij'), axis=-1).reshape(-1, 3)
+
+
+def _shell(radius: int, dims: np.ndarray) -> np.ndarray:
+    cube = _cube(radius, dims)
+    return cube[np.abs(cube).max(axis=1) == radius]
+
+
+def _segment_topk(owner: np.ndarray, dist: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    # owner is sorted; k passes of a segmented argmin instead of a full sort.
+    # Returns (owners, positions) with positions (len(owners), k), -1 when exhausted.
+    start = np.flatnonzero(np.r_[True, owner[1:] != owner[:-1]])
+    seg = np.repeat(np.arange(len(start)), np.diff(np.r_[start, len(owner)]))
+    pos = np.full((len(start), k), -1, dtype=np.int64)
+    work = dist.copy()
+
+    for rank in range(k):
+        mins = np.minimum.reduceat(work, start)
+        hit = np.flatnonzero(work == mins[seg])
+        hit_seg = seg[hit]
+        first = hit[np.r_[True, hit_seg[1:] != hit_seg[:-1]]]
+        valid = np.isfinite(work[first])
+        pos[seg[first[valid]], rank] = first[valid]
+        work[first] = np.inf
+
+    return owner[start], pos
+
+
+class VertexGrid(object):
+    # Points bucketed into cubic cells of cell_size
+    #    order      | point ids sorted by cell key
+    #    cell_keys  | sorted occupied cell keys (None when cell_start is dense)
+    #    cell_start | CSR offsets of each cell into order
+
+    def __init__(self, points, cell_size=None):
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        count = len(self.points)
+
+        if count:
+            lower = self.points.min(axis=0)
+            extent = self.points.max(axis=0) - lower
+        else:
+            lower = np.zeros(3)
+            extent = np.zeros(3)
+
+        if cell_size is None:
+            # keep flat or degenerate meshes from collapsing the volume to zero
+            floor = max(extent.max() * 1e-3, 1e-6)
+            volume = np.prod(np.maximum(extent, floor))
+            cell_size = (volume * POINTS_PER_CELL / max(count, 1)) ** (1.0 / 3.0)
+
+        self.cell_size = float(cell_size)
+        self.origin = lower
+        self.dims = (extent // self.cell_size).astype(np.int64) + 1
+
+        keys = self._keys(self._cells(self.points))
+        self.order = np.argsort(keys, kind='stable')
+        cell_total = int(np.prod(self.dims))
+        if cell_total <= max(DENSE_CELLS, 4 * count):
+            # direct key -> offsets table, no search per lookup
+            self.cell_keys = None
+            self.cell_start = csr_offsets(keys[self.order], cell_total)
+        else:
+            self.cell_keys, start = np.unique(keys[self.order], return_index=True)
+            self.cell_start = np.append(start, count).astype(np.int64)
+
+    def __len__(self):
+        return len(self.points)
+
+    def _cells(self, points: np.ndarray) -> np.ndarray:
+        cells = np.floor((points - self.origin) / self.cell_size).astype(np.int64)
+        return np.clip(cells, 0, self.dims - 1)
+
+    def _keys(self, cells: np.ndarray) -> np.ndarray:
+        return cells[..., 0] + self.dims[0] * (cells[..., 1] + self.dims[1] * cells[..., 2])
+
+    def _gather(self, query_cells: np.ndarray, offsets: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # (query slot, point id) for every point in query_cells + offsets
+        cells = query_cells[:, None, :] + offsets[None, :, :]
+        inside = np.all((cells >= 0) & (cells < self.dims), axis=2)
+        owner = np.broadcast_to(np.arange(len(query_cells))[:, None], inside.shape)[inside]
+        slot = self._keys(cells[inside])
+
+        if self.cell_keys is not None:
+            keys = slot
+            slot = np.minimum(np.searchsorted(self.cell_keys, keys), len(self.cell_keys) - 1)
+            hit = self.cell_keys[slot] == keys
+            owner, slot = owner[hit], slot[hit]
+
+        pos = csr_gather(self.cell_start, slot)
+        return np.repeat(owner, np.diff(self.cell_start)[slot]), self.order[pos]
+
+    def knn(self, queries, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        '''Return (indices, distances) of shape (m, k), nearest first.
+
+        Missing neighbours (fewer than k points) are -1 / inf.
+        '''
+        queries = np.asarray(queries, dtype=np.float64).reshape(-1, 3)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        distances = np.full((len(queries), k), np.inf)
+        if len(self.points) == 0:
+            return indices, distances
+
+        for start in range(0, len(queries), QUERY_CHUNK):
+            chunk = slice(start, start + QUERY_CHUNK)
+            self._knn_chunk(queries[chunk], indices[chunk], distances[chunk])
+        return indices, distances
+
+    def _knn_chunk(self, queries, indices, distances):
+        k = indices.shape[1]
+        query_cells = self._cells(queries)
+        active = np.arange(len(queries))
+        ring = 0
+
+        # distance from each query to the walls of its own cell
+        lower = queries - (self.origin + query_cells * self.cell_size)
+        margin = np.clip(np.minimum(lower, self.cell_size - lower).min(axis=1), 0.0, None)
+        last_ring = int(self.dims.max())
+
+        while len(active):
+            owner, points = self._gather(query_cells[active], _shell(ring, self.dims))
+            if len(owner):
+                owner = active[owner]
+                dist = np.linalg.norm(self.points[points] - queries[owner], axis=1)
+                found, pos = _segment_topk(owner, dist, k)
+
+                # merge this ring's k best into the current k best
+                cand_index = np.where(pos >= 0, points[pos], -1)
+                cand_dist = np.where(pos >= 0, dist[pos], np.inf)
+                all_index = np.concatenate((indices[found], cand_index), axis=1)
+                all_dist = np.concatenate((distances[found], cand_dist), axis=1)
+                order = np.argsort(all_dist, axis=1, kind='stable')[:, :k]
+                indices[found] = np.take_along_axis(all_index, order, axis=1)
+                distances[found] = np.take_along_axis(all_dist, order, axis=1)
+
+            # unseen points lie outside the explored cube of cells
+            bound = ring * self.cell_size + margin[active]
+            done = (distances[active, k - 1] <= bound) | (ring >= last_ring)
+            active = active[~done]
+            ring += 1
+
+    def radius(self, queries, radius: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        '''Return CSR (offsets, indices, distances) of points within radius, nearest first.'''
+        queries = np.asarray(queries, dtype=np.float64).reshape(-1, 3)
+        cube = _cube(int(np.ceil(radius / self.cell_size)), self.dims)
+        owners = []
+        found = []
+        dists = []
+
+        for start in range(0, len(queries) if len(self.points) else 0, QUERY_CHUNK):
+            chunk = queries[start:start + QUERY_CHUNK]
+            owner, points = self._gather(self._cells(chunk), cube)
+            dist = np.linalg.norm(self.points[points] - chunk[owner], axis=1)
+            near = dist <= radius
+            owners.append(owner[near] + start)
+            found.append(points[near])
+            dists.append(dist[near])
+
+        if not owners:
+            return np.zeros(len(queries) + 1, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+
+        owner = np.concatenate(owners)
+        points = np.concatenate(found)
+        dist = np.concatenate(dists)
+        order = np.lexsort((dist, owner))
+        return csr_offsets(owner[order], len(queries)), points[order], dist[order]
+
+
+def build_vertex_grid(model) -> VertexGrid:
+    return VertexGrid(columns.position_columns(model.Vertices))
+
+
+def transfer_weights(model, positions) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''Nearest-vertex weight mapping from model onto positions.
+
+    Returns (types, bones, weights) columns as weight_columns does.
+    '''
+    types, bones, weights = columns.weight_columns(model.Vertices)
+    nearest, _ = model.vertex_index().knn(positions, 1)
+    nearest = nearest[:, 0]
+    return types[nearest], bones[nearest], weights[nearest]
+
+
+def mirror_pairs(model, axis: int = 0, tolerance: float = 1e-4) -> np.ndarray:
+    '''For each vertex, the vertex at its mirrored position across axis or -1.'''
+    mirrored = columns.position_columns(model.Vertices)
+    mirrored[:, axis] *= -1.0
+    nearest, dist = model.vertex_index().knn(mirrored, 1)
+    return np.where(dist[:, 0] <= tolerance, nearest[:, 0], -1)
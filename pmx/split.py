@@ -0,0 +1,254 @@
+#
+# split.py : cut one model into parts by material or by bone subtree
+#
+# Every triangle gets a part: its material's, or the subtree holding the
+# dominant bone of most of its corners. A part keeps its triangles, the
+# vertices they use, its materials and the textures they use, compacted
+# through old -> new tables; bones, morphs and display frames are kept
+# whole (shared skeleton, morph indices unchanged), vertex and UV morph
+# offsets are cut to the part's vertices. A rigid goes to the part owning
+# its bone (its subtree, or the material it weights most) and a joint to
+# its child rigid's part, bringing the parent rigid along when that lives
+# elsewhere.
+#
+# Every record a part holds is a copy, so editing a part in place leaves
+# the source model and the other parts alone.
+#
+
+import copy
+
+import numpy as np
+
+from typing import List
+
+from . import bounds as pmx_bounds
+from . import columns
+from . import remap
+
+SPLITS = ('material', 'bone_subtree')
+
+MATERIAL_MORPH = 8
+IMPULSE_MORPH = 10
+
+
+def old_to_new(mask) -> np.ndarray:
+    table = np.full(len(mask), -1, dtype=np.int64)
+    table[mask] = np.arange(int(np.count_nonzero(mask)))
+    return table
+
+
+def subtree_parts(model, roots) -> np.ndarray:
+    '''Part of each bone: the position in roots of its nearest root ancestor (or itself), else len(roots).'''
+    count = len(model.Bones)
+    part = np.full(count, -2, dtype=np.int64)  # -2 unresolved, -3 on the current path
+    for (p, root) in enumerate(roots):
+        part[root] = p
+    parents = [b.Parent if 0 <= b.Parent < count else -1 for b in model.Bones]
+    for bone in range(count):
+        path = []
+        b = bone
+        while b >= 0 and part[b] == -2:
+            part[b] = -3
+            path.append(b)
+            b = parents[b]
+        value = len(roots) if b < 0 or part[b] == -3 else part[b]
+        part[path] = value
+    return part
+
+
+def triangle_parts(faces, vertex_part) -> np.ndarray:
+    # the part of at least two corners, else the first corner's
+    corner = vertex_part[faces]
+    pair = (corner[:, 1] == corner[:, 2]) & (corner[:, 0] != corner[:, 1])
+    return np.where(pair, corner[:, 1], corner[:, 0])
+
+
+def weighted_owners(model, vertex_part, part_count) -> np.ndarray:
+    '''Part receiving most of each bone's vertex weight (0 for bones without weights).'''
+    index = model.bone_vertex_index()
+    part = vertex_part[index.vertices]
+    use = part >= 0
+    keys = index.bone_ids()[use].astype(np.int64) * part_count + part[use]
+    totals = np.bincount(keys, weights=index.weights[use], minlength=len(index) * part_count)
+    if part_count == 0:
+        return np.zeros(len(index), dtype=np.int64)
+    return np.argmax(totals.reshape(len(index), part_count), axis=1)
+
+
+def _copy_offsets(morph, rows, index):
+    offsets = []
+    for (row, i) in zip(rows, index):
+        offset = copy.deepcopy(morph.Offsets[row])
+        offset.Index = i
+        offsets.append(offset)
+    return offsets
+
+
+class Splitter(object):
+    # source model columns read once and shared by every part
+    #    faces        | (triangles, 3) inside the material ranges
+    #    materials    | (triangles,) material of each triangle
+    #    morph_*      | vertex and UV morph offsets (morph, row, index), by morph
+
+    def __init__(self, model):
+        self.model = model
+        ranges = model.material_ranges()
+        self.faces = model.face_array()[:int(ranges.ends[-1]) if len(ranges) else 0]
+        self.materials = ranges.triangle_materials()
+        self.morph_ids, self.morph_rows, self.morph_index = \
+            columns.morph_offset_columns(model.Morphs, columns.VERTEX_MORPH_TYPES)
+        self.morph_starts = np.searchsorted(self.morph_ids, np.arange(len(model.Morphs) + 1))
+
+    def part(self, name, triangles, materials, rigids, joints):
+        '''Model of the triangle ids, material mask, rigid mask and joint ids.'''
+        from .pmx import Model
+
+        model = self.model
+        part = Model()
+        part.Status = copy.copy(model.Status)
+        part.Name, part.Name_E = name, model.Name_E
+        part.Comment, part.Comment_E = model.Comment, model.Comment_E
+
+        faces = self.faces[triangles]
+        used = np.zeros(len(model.Vertices), dtype=bool)
+        used[faces.ravel()] = True
+        vertices = old_to_new(used)
+        part.Vertices = [copy.deepcopy(model.Vertices[v]) for v in np.flatnonzero(used).tolist()]
+        part.Faces = vertices[faces].ravel().tolist()
+
+        counts = np.bincount(self.materials[triangles], minlength=len(model.Materials))
+        kept = np.flatnonzero(materials).tolist()
+        part.Materials = [copy.deepcopy(model.Materials[m]) for m in kept]
+        for (material, m) in zip(part.Materials, kept):
+            material.FaceLength = int(counts[m]) * 3
+        self._textures(part)
+
+        part.Bones = copy.deepcopy(model.Bones)
+        part.DisplayFrames = copy.deepcopy(model.DisplayFrames)
+        rigid_table = old_to_new(rigids)
+        self._morphs(part, vertices, old_to_new(materials), rigid_table)
+        self._physics(part, vertices, old_to_new(materials), rigid_table, joints)
+        return part
+
+    def _textures(self, part):
+        used = np.zeros(len(self.model.Textures), dtype=bool)
+        refs = [(m.TextureIndex, m.SphereIndex, m.ToonIndex if remap.toon_texture(m) else -1) for m in part.Materials]
+        refs = np.array(refs, dtype=np.int64).reshape(-1, 3)
+        used[refs[(refs >= 0) & (refs < len(used))]] = True
+        table = old_to_new(used)
+        part.Textures = [copy.deepcopy(t) for (t, u) in zip(self.model.Textures, used.tolist()) if u]
+        new = remap.lookup(table, refs).tolist()
+        for (material, (texture, sphere, toon)) in zip(part.Materials, new):
+            material.TextureIndex = texture
+            material.SphereIndex = sphere
+            if remap.toon_texture(material):
+                material.ToonIndex = toon
+
+    def _morphs(self, part, vertices, materials, rigids):
+        index = remap.lookup(vertices, self.morph_index)
+        part.Morphs = []
+        for (m, morph) in enumerate(self.model.Morphs):
+            new = copy.copy(morph)
+            if morph.Type in columns.VERTEX_MORPH_TYPES:
+                span = slice(self.morph_starts[m], self.morph_starts[m + 1])
+                keep = index[span] >= 0
+                new.Offsets = _copy_offsets(morph, self.morph_rows[span][keep].tolist(), index[span][keep].tolist())
+            elif morph.Type in (MATERIAL_MORPH, IMPULSE_MORPH):
+                table = materials if morph.Type == MATERIAL_MORPH else rigids
+                old = np.array([o.Index for o in morph.Offsets], dtype=np.int64)
+                mapped = remap.lookup(table, old)
+                # material index -1 means every material
+                keep = (mapped >= 0) | ((old == -1) & (morph.Type == MATERIAL_MORPH))
+                mapped = np.where(old == -1, -1, mapped)
+                new.Offsets = _copy_offsets(morph, np.flatnonzero(keep).tolist(), mapped[keep].tolist())
+            else:
+                new.Offsets = copy.deepcopy(morph.Offsets)
+            part.Morphs.append(new)
+
+    def _physics(self, part, vertices, materials, rigids, joints):
+        model = self.model
+        part.Rigids = [copy.deepcopy(r) for (r, t) in zip(model.Rigids, rigids.tolist()) if t >= 0]
+        part.Joints = [copy.deepcopy(model.Joints[j]) for j in joints.tolist()]
+        ends = remap.lookup(rigids, [(j.Parent, j.Child) for j in part.Joints]).reshape(-1, 2)
+        for (joint, (parent, child)) in zip(part.Joints, ends.tolist()):
+            joint.Parent, joint.Child = parent, child
+
+        part.SoftBodies = []
+        for soft in model.SoftBodies:
+            material = int(remap.lookup(materials, [soft.Material])[0])
+            if material < 0:
+                continue
+            soft = copy.deepcopy(soft)
+            soft.Material = material
+            anchors = np.array(soft.Anchors, dtype=np.int64).reshape(-1, 3)
+            anchors[:, 0] = remap.lookup(rigids, anchors[:, 0])
+            anchors[:, 1] = remap.lookup(vertices, anchors[:, 1])
+            soft.Anchors = anchors[np.all(anchors[:, :2] >= 0, axis=1)].tolist()
+            pins = remap.lookup(vertices, soft.Pins)
+            soft.Pins = pins[pins >= 0].tolist()
+            part.SoftBodies.append(soft)
+
+
+def _physics_parts(model, bone_owner, part_count):
+    # (rigid masks, joint ids) per part
+    bones = np.array([r.Bone for r in model.Rigids], dtype=np.int64)
+    known = (bones >= 0) & (bones < len(bone_owner))
+    owner = np.where(known, bone_owner[np.where(known, bones, 0)], 0)
+    joints = np.array([(j.Parent, j.Child) for j in model.Joints], dtype=np.int64).reshape(-1, 2)
+    valid = np.all((joints >= 0) & (joints < len(owner)), axis=1)
+    joint_part = np.where(valid, owner[np.where(valid, joints[:, 1], 0)], -1)
+
+    masks = []
+    ids = []
+    for p in range(part_count):
+        mask = owner == p
+        mine = np.flatnonzero(joint_part == p)
+        mask[joints[mine, 0]] = True
+        masks.append(mask)
+        ids.append(mine)
+    return masks, ids
+
+
+def split(model, by='material', roots=None) -> List:
+    '''Parts of model, one per material or one per bone subtree.
+
+    For 'bone_subtree' roots lists the subtree root bones (default: bones
+    without a parent); bones outside every subtree form a last part when
+    it has triangles or rigids.
+    '''
+    if by not in SPLITS:
+        raise ValueError('unknown split: %r' % (by,))
+    splitter = Splitter(model)
+    triangle_ids = np.arange(len(splitter.faces))
+
+    if by == 'material':
+        count = len(model.Materials)
+        tri_part = splitter.materials
+        vertex_part = np.full(len(model.Vertices), -1, dtype=np.int64)
+        vertex_part[splitter.faces.ravel()[::-1]] = np.repeat(tri_part, 3)[::-1]
+        bone_owner = weighted_owners(model, vertex_part, count)
+        names = [m.Name for m in model.Materials]
+    else:
+        if roots is None:
+            roots = [b for (b, bone) in enumerate(model.Bones) if not 0 <= bone.Parent < len(model.Bones)]
+        roots = [int(r) for r in roots]
+        count = len(roots) + 1
+        bone_owner = subtree_parts(model, roots)
+        dominant = pmx_bounds.dominant_bones(model.Vertices)
+        valid = (dominant >= 0) & (dominant < len(bone_owner))
+        vertex_part = np.where(valid, bone_owner[np.where(valid, dominant, 0)], len(roots))
+        tri_part = triangle_parts(splitter.faces, vertex_part)
+        names = [model.Bones[r].Name for r in roots] + [model.Name]
+
+    rigid_masks, joint_ids = _physics_parts(model, bone_owner, count)
+    parts = []
+    for p in range(count):
+        triangles = triangle_ids[tri_part == p]
+        if by == 'material':
+            materials = np.arange(count) == p
+        else:
+            materials = np.bincount(splitter.materials[triangles], minlength=len(model.Materials)) > 0
+            if p == len(roots) and len(triangles) == 0 and not rigid_masks[p].any():
+                continue
+        parts.append(splitter.part(names[p], triangles, materials, rigid_masks[p], joint_ids[p]))
+    return parts
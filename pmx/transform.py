@@ -0,0 +1,131 @@
+#
+# transform.py : whole-model affine transform on columnar arrays
+#
+
+import numpy as np
+
+from . import columns
+from . import rotation
+
+# import_pmx.convert_translate / convert_normal: scale 0.08, then xzy swizzle
+BLENDER_MATRIX = np.array(((1, 0, 0), (0, 0, 1), (0, 1, 0)), dtype=np.float64)
+BLENDER_SCALE = 0.08
+
+
+def _vector_array(records, attr, size=3):
+    return np.array([tuple(getattr(r, attr)) for r in records], dtype=np.float64).reshape(len(records), size)
+
+
+class Transform(object):
+    # p' = scale * (linear @ p) + translation
+    #    matrix | 3x3 linear part, or 4x4 affine with translation in the last column
+
+    def __init__(self, matrix, scale=1.0):
+        matrix = np.asarray(matrix, dtype=np.float64)
+        if matrix.shape == (4, 4):
+            linear = matrix[:3, :3]
+            self.translation = matrix[:3, 3].copy()
+        elif matrix.shape == (3, 3):
+            linear = matrix
+            self.translation = np.zeros(3)
+        else:
+            raise ValueError('matrix must be 3x3 or 4x4, got {0}'.format(matrix.shape))
+
+        self.linear = linear * scale
+        self.normal_matrix = np.linalg.inv(self.linear).T
+        self.rotation = rotation.orthonormal(self.linear)
+        self.flip = np.linalg.det(self.rotation) < 0
+        self.uniform = abs(np.linalg.det(self.linear)) ** (1.0 / 3.0)
+
+    def points(self, values: np.ndarray) -> np.ndarray:
+        return values @ self.linear.T + self.translation
+
+    def vectors(self, values: np.ndarray) -> np.ndarray:
+        return values @ self.linear.T
+
+    def normals(self, values: np.ndarray) -> np.ndarray:
+        out = values @ self.normal_matrix.T
+        length = np.linalg.norm(out, axis=1, keepdims=True)
+        return np.divide(out, length, out=out, where=length > 0)
+
+    def directions(self, values: np.ndarray) -> np.ndarray:
+        # rotate only, length preserved
+        return values @ self.rotation.T
+
+    def pseudovectors(self, values: np.ndarray) -> np.ndarray:
+        # axial vectors (torque) flip with a reflection
+        return self.directions(values) * (-1.0 if self.flip else 1.0)
+
+    def orientations(self, euler: np.ndarray) -> np.ndarray:
+        # a reflection is folded into the local frame (M' = -R M) so the
+        # result stays a rotation; symmetric shapes and rotation limits
+        # are unaffected, local translation limits change sign
+        mat = self.rotation @ rotation.euler_to_matrix(euler)
+        if self.flip:
+            mat = -mat
+        return rotation.matrix_to_euler(mat)
+
+    def quaternions(self, quat: np.ndarray) -> np.ndarray:
+        # world-axis rotation deltas: R Q R^T, zero quaternions left alone
+        mat = self.rotation @ rotation.quat_to_matrix(quat) @ self.rotation.T
+        out = rotation.matrix_to_quat(mat)
+        return np.where(np.any(quat != 0.0, axis=-1, keepdims=True), out, quat)
+
+    def apply(self, model):
+        self.apply_vertices(model)
+        self.apply_bones(model)
+        self.apply_morphs(model)
+        self.apply_physics(model)
+        model.invalidate()
+
+    def apply_vertices(self, model):
+        verts = model.Vertices
+        columns.store_vectors(verts, 'Position', self.points(columns.position_columns(verts)))
+        columns.store_vectors(verts, 'Normal', self.normals(columns.normal_columns(verts)))
+
+        ids, params = columns.sdef_columns(verts)
+        columns.store_sdef(verts, ids, self.points(params.reshape(-1, 3)).reshape(-1, 3, 3))
+
+    def apply_bones(self, model):
+        bones = model.Bones
+        columns.store_vectors(bones, 'Position', self.points(_vector_array(bones, 'Position')))
+
+        offset_tail = [b for b in bones if b.ToConnectType == 0]
+        columns.store_vectors(offset_tail, 'TailPosition', self.vectors(_vector_array(offset_tail, 'TailPosition')))
+
+        fixed = [b for b in bones if b.UseFixedAxis == 1]
+        columns.store_vectors(fixed, 'FixedAxis', self.directions(_vector_array(fixed, 'FixedAxis')))
+
+        local = [b for b in bones if b.UseLocalAxis == 1]
+        columns.store_vectors(local, 'LocalAxisX', self.directions(_vector_array(local, 'LocalAxisX')))
+        columns.store_vectors(local, 'LocalAxisZ', self.directions(_vector_array(local, 'LocalAxisZ')))
+
+    def apply_morphs(self, model):
+        # [1:Vertex 2:Bone 10:Impulse] carry geometric offsets
+        def offsets(types):
+            return [o for m in model.Morphs if m.Type in types for o in m.Offsets]
+
+        moved = offsets((1, 2, 10))
+        columns.store_vectors(moved, 'Move', self.vectors(_vector_array(moved, 'Move')))
+
+        rotated = offsets((2,))
+        columns.store_vectors(rotated, 'Rotate', self.quaternions(_vector_array(rotated, 'Rotate', 4)))
+
+        impulse = offsets((10,))
+        columns.store_vectors(impulse, 'Torque', self.pseudovectors(_vector_array(impulse, 'Torque')))
+
+    def apply_physics(self, model):
+        for records in (model.Rigids, model.Joints):
+            columns.store_vectors(records, 'Position', self.points(_vector_array(records, 'Position')))
+            columns.store_vectors(records, 'Rotate', self.orientations(_vector_array(records, 'Rotate')))
+
+        rigids = model.Rigids
+        columns.store_vectors(rigids, 'Size', _vector_array(rigids, 'Size') * self.uniform)
+
+        joints = model.Joints
+        lower = _vector_array(joints, 'PosLowerLimit') * self.uniform
+        upper = _vector_array(joints, 'PosUpperLimit') * self.uniform
+        if self.flip:
+            lower, upper = -upper, -lower
+        columns.store_vectors(joints, 'PosLowerLimit', lower)
+        columns.store_vectors(joints, 'PosUpperLimit', upper)
@@ -0,0 +1,189 @@
+#
+# vcache.py : post-transform vertex cache optimisation (Forsyth)
+#
+# Tom Forsyth, "Linear-Speed Vertex Cache Optimisation", 2006.
+#
+# The optimiser and acmr() model the same LRU cache: after each triangle
+# its three vertices are the most recent, in triangle order. A material
+# keeps its faces unless the new order has a lower ACMR.
+#
+
+import collections
+
+import numpy as np
+
+from dataclasses import dataclass
+from dataclasses import field
+
+from typing import List
+
+from . import remap
+
+CACHE_SIZE = 32
+CACHE_DECAY_POWER = 1.5
+LAST_TRI_SCORE = 0.75
+VALENCE_BOOST_SCALE = 2.0
+VALENCE_BOOST_POWER = 0.5
+MAX_VALENCE = 64
+
+
+@dataclass
+class CacheReport:
+    acmr_before: float = 0.0
+    acmr_after: float = 0.0
+    material_acmr_before: List[float] = field(default_factory=list)
+    material_acmr_after: List[float] = field(default_factory=list)
+
+
+def acmr(faces: np.ndarray, cache_size: int = CACHE_SIZE) -> float:
+    '''Average cache miss ratio (transformed vertices per triangle) of the LRU cache optimize_faces scores with.'''
+    faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+    if len(faces) == 0:
+        return 0.0
+    cache = collections.OrderedDict()  # most recent first
+    misses = 0
+    for tri in faces.tolist():
+        for vert in reversed(tri):
+            if vert not in cache:
+                misses += 1
+                cache[vert] = None
+            cache.move_to_end(vert, last=False)
+        while len(cache) > cache_size:
+            cache.popitem()
+    return misses / len(faces)
+
+
+def _score_table(cache_size):
+    # table[cache_pos + 1][valence] ; cache_pos -1 = not cached
+    table = []
+    for pos in range(-1, cache_size):
+        if pos < 0:
+            base = 0.0
+        elif pos < 3:
+            base = LAST_TRI_SCORE
+        else:
+            base = (1.0 - (pos - 3) / (cache_size - 3)) ** CACHE_DECAY_POWER
+        row = [-1.0]
+        for valence in range(1, MAX_VALENCE + 1):
+            row.append(base + VALENCE_BOOST_SCALE * valence ** -VALENCE_BOOST_POWER)
+        table.append(row)
+    return table
+
+
+def optimize_faces(faces: np.ndarray, cache_size: int = CACHE_SIZE) -> np.ndarray:
+    '''Return faces (n, 3) reordered for an LRU cache of cache_size.'''
+    faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+    tri_count = len(faces)
+    if tri_count < 2:
+        return faces.copy()
+
+    # compact vertex ids so per-vertex lists stay small
+    uniq, local = np.unique(faces, return_inverse=True)
+    local = local.reshape(-1, 3)
+    vert_count = len(uniq)
+
+    # vertex -> triangles adjacency (CSR, then per-vertex python lists)
+    flat = local.ravel()
+    order = np.argsort(flat, kind='stable')
+    counts = np.bincount(flat, minlength=vert_count)
+    starts = np.concatenate(([0], np.cumsum(counts)))
+    adj_flat = (order // 3).tolist()
+    starts = starts.tolist()
+    adjacency = [adj_flat[starts[v]:starts[v + 1]] for v in range(vert_count)]
+
+    table = _score_table(cache_size)
+    tris = local.tolist()
+    remaining = counts.tolist()
+    cache_pos = [-1] * vert_count
+    vert_score = [table[0][min(c, MAX_VALENCE)] for c in remaining]
+    tri_score = [vert_score[a] + vert_score[b] + vert_score[c] for (a, b, c) in tris]
+    emitted = [False] * tri_count
+
+    output = []
+    cache = []
+    best = max(range(tri_count), key=tri_score.__getitem__)
+    scan = 0
+
+    while True:
+        if best < 0:
+            # cache ran dry: continue from the next untouched triangle
+            while scan < tri_count and emitted[scan]:
+                scan += 1
+            if scan == tri_count:
+                break
+            best = scan
+
+        tri = tris[best]
+        emitted[best] = True
+        output.append(best)
+
+        for vert in tri:
+            adjacency[vert].remove(best)
+            remaining[vert] -= 1
+
+        # LRU: the new triangle's vertices move to the front
+        cache = tri + [v for v in cache if v not in tri]
+        evicted = cache[cache_size:]
+        cache = cache[:cache_size]
+
+        for vert in evicted:
+            cache_pos[vert] = -1
+            vert_score[vert] = table[0][min(remaining[vert], MAX_VALENCE)]
+        for (pos, vert) in enumerate(cache):
+            cache_pos[vert] = pos
+            vert_score[vert] = table[pos + 1][min(remaining[vert], MAX_VALENCE)]
+
+        best = -1
+        best_score = -1.0
+        for vert in evicted:
+            for t in adjacency[vert]:
+                a, b, c = tris[t]
+                tri_score[t] = vert_score[a] + vert_score[b] + vert_score[c]
+        for vert in cache:
+            for t in adjacency[vert]:
+                a, b, c = tris[t]
+                score = vert_score[a] + vert_score[b] + vert_score[c]
+                tri_score[t] = score
+                if score > best_score:
+                    best_score = score
+                    best = t
+
+    return faces[np.array(output, dtype=np.int64)]
+
+
+def fetch_order(faces: np.ndarray, vertex_count: int) -> np.ndarray:
+    '''old_to_new vertex map: first use in faces, unreferenced vertices last.'''
+    flat = np.asarray(faces, dtype=np.int64).ravel()
+    _, first = np.unique(flat, return_index=True)
+    used = flat[np.sort(first)]
+
+    rank = np.full(vertex_count, -1, dtype=np.int64)
+    rank[used] = np.arange(len(used))
+    unused = np.flatnonzero(rank < 0)
+    rank[unused] = np.arange(len(used), vertex_count)
+    return rank
+
+
+def optimize_vertex_cache(model, cache_size: int = CACHE_SIZE) -> CacheReport:
+    ranges = model.material_ranges()
+    faces = model.face_array()
+    report = CacheReport()
+    report.acmr_before = acmr(faces, cache_size)
+
+    parts = []
+    for part in ranges.split(faces):
+        before = acmr(part, cache_size)
+        optimized = optimize_faces(part, cache_size)
+        after = acmr(optimized, cache_size)
+        if after < before:
+            part = optimized
+        report.material_acmr_before.append(before)
+        report.material_acmr_after.append(min(before, after))
+        parts.append(part)
+    # triangles beyond the last material are kept as they are
+    parts.append(faces[int(ranges.ends[-1]) if len(ranges) else 0:])
+
+    model.Faces = np.concatenate(parts).ravel().tolist()
+    remap.remap_vertices(model, fetch_order(model.face_array(), len(model.Vertices)))
+    report.acmr_after = acmr(model.face_array(), cache_size)
+    return report
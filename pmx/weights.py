@@ -0,0 +1,126 @@
+#
+# weights.py : influence limiting, renormalisation and weight type reclassification
+#
+
+import numpy as np
+
+from dataclasses import dataclass
+from dataclasses import field
+
+from typing import List
+from typing import Tuple
+
+from . import columns
+from . import saveplan
+
+PRUNE_BELOW = 1e-4
+
+# (bone index fields, weight floats) written per vertex, by weight type
+RECORD_FIELDS = np.array([(1, 0), (2, 1), (4, 4), (2, 10), (4, 4)])
+
+
+@dataclass
+class WeightReport:
+    changed: int = 0
+    types_before: List[int] = field(default_factory=list)  # vertices per weight type
+    types_after: List[int] = field(default_factory=list)
+    bytes_saved: int = 0
+
+
+def record_bytes(types, bone_width) -> int:
+    # bytes of the weight part of the given vertex records
+    fields = RECORD_FIELDS[np.asarray(types, dtype=np.int64)]
+    return int(fields[:, 0].sum()) * bone_width + int(fields[:, 1].sum()) * 4
+
+
+def merge_duplicates(bones, weights) -> np.ndarray:
+    '''Fold repeated bones of a row into their first slot.'''
+    weights = weights.copy()
+    for j in range(1, bones.shape[1]):
+        for k in range(j):
+            same = (bones[:, j] == bones[:, k]) & (weights[:, k] > 0)
+            weights[:, k] += np.where(same, weights[:, j], 0.0)
+            weights[:, j] = np.where(same, 0.0, weights[:, j])
+    return weights
+
+
+def normalize_columns(types, bones, weights, max_influences=columns.MAX_INFLUENCES,
+                      prune_below=PRUNE_BELOW) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''Limit, renormalise and reclassify weight columns (see columns.weight_columns).
+
+    Influences below prune_below are dropped and only the max_influences
+    strongest are kept, strongest first. Rows then take the cheapest type:
+    BDEF1/BDEF2/BDEF4 by influence count. SDEF keeps its slot order (C, R0
+    and R1 depend on it) and QDEF stays QDEF while 2 or more influences
+    remain; both fall back to BDEF1 on a single influence.
+    '''
+    if not 1 <= max_influences <= columns.MAX_INFLUENCES:
+        raise ValueError("max_influences must be 1..%d" % columns.MAX_INFLUENCES)
+    types = np.asarray(types, dtype=np.int8)
+    bones = np.asarray(bones, dtype=np.int32)
+    weights = np.where(bones >= 0, np.maximum(np.asarray(weights, dtype=np.float64), 0.0), 0.0)
+    weights = merge_duplicates(bones, weights)
+    strongest = np.argmax(weights, axis=1)
+
+    weights[weights < prune_below] = 0.0
+    if max_influences < columns.MAX_INFLUENCES:
+        drop = np.argpartition(weights, columns.MAX_INFLUENCES - max_influences - 1, axis=1)
+        np.put_along_axis(weights, drop[:, :columns.MAX_INFLUENCES - max_influences], 0.0, axis=1)
+
+    # nothing left: the strongest original influence takes it all
+    total = weights.sum(axis=1)
+    empty = np.flatnonzero(total == 0)
+    weights[empty, strongest[empty]] = 1.0
+    total[empty] = 1.0
+    weights /= total[:, None]
+
+    # strongest first, unused slots last; SDEF keeps its slot order
+    sdef = np.flatnonzero(types == columns.SDEF)
+    order = np.argsort(-weights, axis=1, kind='stable')
+    order[sdef] = np.argsort(weights[sdef] == 0, axis=1, kind='stable')
+    bones = np.take_along_axis(bones, order, axis=1)
+    weights = np.take_along_axis(weights, order, axis=1)
+    bones[weights == 0] = 0
+
+    count = np.count_nonzero(weights, axis=1)
+    new_types = np.where(count == 1, columns.BDEF1, np.where(count == 2, columns.BDEF2, columns.BDEF4))
+    new_types = np.where((types == columns.QDEF) & (count >= 2), columns.QDEF, new_types)
+    new_types = np.where((types == columns.SDEF) & (count == 2), columns.SDEF, new_types).astype(np.int8)
+    return new_types, bones, weights
+
+
+def store_weights(vert, vert_type, bones, weights):
+    if vert_type == columns.BDEF1:
+        vert.Bones = [bones[0]]
+        vert.Weights = []
+    elif vert_type == columns.BDEF2:
+        vert.Bones = bones[:2]
+        vert.Weights = [weights[0]]
+    elif vert_type == columns.SDEF:
+        vert.Bones = bones[:2]
+        vert.Weights = [weights[0]] + vert.Weights[1:4]
+    else:
+        vert.Bones = bones
+        vert.Weights = weights
+    vert.Type = vert_type
+
+
+def normalize_weights(model, max_influences=columns.MAX_INFLUENCES, prune_below=PRUNE_BELOW) -> WeightReport:
+    types, bones, weights = columns.weight_columns(model.Vertices)
+    new_types, new_bones, new_weights = normalize_columns(types, bones, weights, max_influences, prune_below)
+
+    # compare with the padded form of the new rows
+    old_bones = np.where(weights > 0, bones, 0)
+    changed = np.flatnonzero((new_types != types) | np.any(new_bones != old_bones, axis=1)
+                             | np.any(np.abs(new_weights - weights) > 1e-7, axis=1))
+    for i in changed.tolist():
+        store_weights(model.Vertices[i], int(new_types[i]), new_bones[i].tolist(), new_weights[i].tolist())
+    if len(changed):
+        model.invalidate('Vertices')
+
+    bone_width = saveplan.width_of(len(model.Bones), 0)[1]
+    report = WeightReport(changed=len(changed))
+    report.types_before = np.bincount(types, minlength=5).tolist()
+    report.types_after = np.bincount(new_types, minlength=5).tolist()
+    report.bytes_saved = record_bytes(types, bone_width) - record_bytes(new_types, bone_width)
+    return report
@@ -0,0 +1,107 @@
+#
+# weld.py : merge duplicate vertices
+#
+# Vertices are keyed by their quantised columns (position, normal, UV,
+# additional UVs, edge size, weights, SDEF parameters) plus a hash of their
+# vertex/UV morph offsets, and grouped with a sort-based unique.
+#
+
+import numpy as np
+
+from dataclasses import dataclass
+from dataclasses import field
+
+from typing import List
+
+from . import columns
+from . import remap
+
+EPSILON = 1e-5
+
+
+@dataclass
+class WeldReport:
+    vertices_before: int = 0
+    vertices_after: int = 0
+    material_removed: List[int] = field(default_factory=list)
+
+    @property
+    def removed_vertices(self) -> int:
+        return self.vertices_before - self.vertices_after
+
+
+def quantize(values, epsilon) -> np.ndarray:
+    values = np.asarray(values, dtype=np.float64)
+    if epsilon > 0:
+        return np.floor(values / epsilon + 0.5).astype(np.int64)
+    # exact: compare bit patterns, with -0.0 folded onto 0.0
+    return (values + 0.0).view(np.int64)
+
+
+def _mix(h):
+    # splitmix64 finaliser, wrapping uint64 arithmetic
+    h = (h ^ (h >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return h ^ (h >> np.uint64(31))
+
+
+def morph_signature(model, epsilon) -> np.ndarray:
+    '''Per vertex, an order independent hash of its vertex/UV morph offsets.'''
+    signature = np.zeros(len(model.Vertices), dtype=np.uint64)
+    for (morph_index, morph) in enumerate(model.Morphs):
+        if morph.Type not in columns.VERTEX_MORPH_TYPES or len(morph.Offsets) == 0:
+            continue
+        index = np.fromiter((o.Index for o in morph.Offsets), dtype=np.int64, count=len(morph.Offsets))
+        if morph.Type == 1:
+            delta = [tuple(o.Move) for o in morph.Offsets]
+        else:
+            delta = [tuple(o.UV) for o in morph.Offsets]
+        delta = quantize(delta, epsilon)
+
+        h = np.full(len(index), morph_index, dtype=np.uint64)
+        for column in delta.T:
+            h = _mix(h ^ column.view(np.uint64))
+        inside = (index >= 0) & (index < len(signature))
+        np.add.at(signature, index[inside], h[inside])
+    return signature
+
+
+def vertex_keys(model, epsilon=EPSILON) -> np.ndarray:
+    vertices = model.Vertices
+    count = len(vertices)
+    types, bones, weights = columns.weight_columns(vertices)
+    sdef = np.zeros((count, 9))
+    ids, params = columns.sdef_columns(vertices)
+    sdef[ids] = params.reshape(-1, 9)
+    append_uv = np.array([[c for uv in v.AppendUV for c in uv] for v in vertices],
+                         dtype=np.float64).reshape(count, -1)
+    edge = np.fromiter((v.EdgeSize for v in vertices), dtype=np.float64, count=count)
+
+    floats = np.column_stack((columns.position_columns(vertices), columns.normal_columns(vertices),
+                              columns.uv_columns(vertices), append_uv, edge, weights, sdef))
+    return np.column_stack((quantize(floats, epsilon), types, bones,
+                            morph_signature(model, epsilon).view(np.int64)))
+
+
+def weld_map(keys) -> np.ndarray:
+    '''old_to_new map merging equal key rows; groups keep first-use order.'''
+    if len(keys) == 0:
+        return np.zeros(0, dtype=np.int64)
+    _, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+    rank = np.empty(len(first), dtype=np.int64)
+    rank[np.argsort(first)] = np.arange(len(first))
+    return rank[inverse.ravel()]
+
+
+def weld(model, epsilon=EPSILON) -> WeldReport:
+    report = WeldReport()
+    report.vertices_before = len(model.Vertices)
+    before = model.material_ranges().vertex_counts(model.face_array())
+
+    old_to_new = weld_map(vertex_keys(model, epsilon))
+    if len(old_to_new) and int(old_to_new.max()) + 1 < len(old_to_new):
+        remap.remap_vertices(model, old_to_new)
+
+    report.vertices_after = len(model.Vertices)
+    report.material_removed = (before - model.material_ranges().vertex_counts(model.face_array())).tolist()
+    return report
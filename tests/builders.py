@@ -0,0 +1,112 @@
+#
+# builders.py : small pmx records and models shared by the tests
+#
+# Keyword values land on the record attribute of the same name, tuples as
+# mathutils.Vector, so a test only spells out what it is about.
+#
+
+import io
+
+import mathutils
+
+from pmx import pmx
+
+# weight type by number of influences
+VERTEX_TYPES = {1: 0, 2: 1, 4: 2}
+
+
+def _fill(record, values):
+    for (key, value) in values.items():
+        setattr(record, key, mathutils.Vector(value) if isinstance(value, tuple) else value)
+    return record
+
+
+def make_pmx():
+    '''Empty PMX 2.0 model, ready to Save.'''
+    model = pmx.Model()
+    model.Status.Magic = 1
+    model.Status.Version = 2.0
+    return model
+
+
+def make_vertex(position=(0, 0, 0), bones=(0,), weights=None, **values):
+    '''BDEF1/2/4 by the number of bones unless Type is given; weights
+    default to none for one bone and an even split for two.'''
+    vert = pmx.PMVertex()
+    vert.Position = mathutils.Vector(position)
+    vert.Bones = list(bones)
+    vert.Type = VERTEX_TYPES.get(len(vert.Bones), 0)
+    if weights is None:
+        weights = [] if len(vert.Bones) == 1 else [0.5]
+    vert.Weights = list(weights)
+    return _fill(vert, values)
+
+
+def make_bone(name='', position=(0, 0, 0), parent=-1, **values):
+    bone = pmx.PMBone()
+    bone.Name = name
+    bone.Position = mathutils.Vector(position)
+    bone.Parent = parent
+    return _fill(bone, values)
+
+
+def make_texture(path):
+    texture = pmx.PMTexture()
+    texture.Path = path
+    return texture
+
+
+def make_material(face_length, texture=-1, **values):
+    material = pmx.PMMaterial()
+    material.FaceLength = face_length
+    material.TextureIndex = texture
+    return _fill(material, values)
+
+
+def make_offset(index, **values):
+    offset = pmx.PMMorphOffset()
+    offset.Index = index
+    return _fill(offset, values)
+
+
+def make_morph(morph_type, offsets=(), name=''):
+    '''offsets are PMMorphOffset records or bare indices.'''
+    morph = pmx.PMMorph()
+    morph.Name = name
+    morph.Type = morph_type
+    morph.Offsets = [o if isinstance(o, pmx.PMMorphOffset) else make_offset(o) for o in offsets]
+    return morph
+
+
+def make_frame(name, members):
+    frame = pmx.PMDisplayFrame()
+    frame.Name = name
+    frame.Members = [list(m) for m in members]
+    return frame
+
+
+def make_rigid(bone=-1, **values):
+    rigid = pmx.PMRigid()
+    rigid.Bone = bone
+    return _fill(rigid, values)
+
+
+def make_model(vertices=(), faces=(), face_lengths=(), bones=0):
+    '''Model of the vertex records, faces, one material per face length and
+    bones default bones.'''
+    model = pmx.Model()
+    model.Vertices = list(vertices)
+    model.Faces = list(faces)
+    model.Materials = [make_material(length) for length in face_lengths]
+    model.Bones = [pmx.PMBone() for _ in range(bones)]
+    return model
+
+
+def reload(model):
+    '''model saved to memory and loaded back.'''
+    buffer = io.BytesIO()
+    model.Save(buffer)
+    buffer.seek(0)
+    loaded = pmx.Model()
+    loaded.Load(buffer)
+    return loaded
@@ -0,0 +1,85 @@
+import unittest
+
+import mathutils
+import numpy as np
+
+from pmx import bounds
+
+from builders import make_model as build_model
+from builders import make_vertex
+
+
+def make_model():
+    vertices = [
+        make_vertex((0, 0, 0), [0]),
+        make_vertex((2, 0, 0), [0, 1], [0.75]),
+        make_vertex((0, 2, 0), [0, 1], [0.25]),
+        make_vertex((2, 2, 2), [1]),
+        make_vertex((9, 9, 9), [1]),  # unused by any triangle
+    ]
+    return build_model(vertices, [0, 1, 2, 1, 3, 2], (3, 3, 0), bones=3)
+
+
+class TestBounds(unittest.TestCase):
+
+    def test_groups(self):
+        model = make_model()
+        result = model.bounds()
+        self.assertIs(result, model.bounds())
+
+        materials = result.materials
+        self.assertEqual(materials.counts().tolist(), [3, 3, 0])
+        np.testing.assert_allclose(materials.lo[:2], [[0, 0, 0], [0, 0, 0]])
+        np.testing.assert_allclose(materials.hi[:2], [[2, 2, 0], [2, 2, 2]])
+        np.testing.assert_allclose(materials.center[1], [1, 1, 1])
+        self.assertAlmostEqual(materials.radius[1], np.sqrt(3))
+        self.assertTrue(np.all(np.isinf(materials.lo[2])))
+        self.assertEqual(materials.radius[2], 0)
+
+        bones = result.bones
+        self.assertEqual(bones.members.tolist(), [0, 1, 2, 3, 4])
+        self.assertEqual(bones.counts().tolist(), [2, 3, 0])
+        np.testing.assert_allclose(bones.hi[1], [9, 9, 9])
+        np.testing.assert_allclose(result.model.lo[0], [0, 0, 0])
+        np.testing.assert_allclose(result.model.radius[0], np.linalg.norm([4.5, 4.5, 4.5]))
+
+    def test_update(self):
+        model = make_model()
+        result = model.bounds()
+        model.Vertices[3].Position = mathutils.Vector((1, 1, -4))
+        model.update_bounds(3, 4)
+        np.testing.assert_allclose(result.materials.lo[1], [0, 0, -4])
+        np.testing.assert_allclose(result.materials.hi[0], [2, 2, 0])
+        np.testing.assert_allclose(result.bones.lo[1], [0, 1, -4])
+
+        # a changed dominant bone moves the vertex between bone groups
+        model.Vertices[4].Bones = [2]
+        model.update_bounds(4, 5)
+        self.assertEqual(result.bones.counts().tolist(), [2, 2, 1])
+        np.testing.assert_allclose(result.bones.hi[1], [1, 2, 0])
+        np.testing.assert_allclose(result.bones.center[2], [9, 9, 9])
+
+        fresh = bounds.build_bounds(model)
+        for (a, b) in ((fresh.materials, result.materials), (fresh.bones, result.bones), (fresh.model, result.model)):
+            np.testing.assert_allclose(a.lo, b.lo)
+            np.testing.assert_allclose(a.radius, b.radius)
+
+    def test_grow(self):
+        # an interior vertex leaves the box: boxes grow, spheres widen instead of a new reduce
+        points = np.random.default_rng(1).random((200, 3))
+        model = build_model([make_vertex(p) for p in points], range(198), (198,), bones=1)
+        result = model.bounds()
+        inner = int(np.flatnonzero(np.all((points > points.min(axis=0)) & (points < points.max(axis=0)), axis=1))[0])
+
+        model.Vertices[inner].Position = mathutils.Vector((2, 0.5, 0.5))
+        model.update_bounds(inner, inner + 1)
+        fresh = bounds.build_bounds(model)
+        positions = np.array([tuple(v.Position) for v in model.Vertices])
+        for (a, b) in ((fresh.materials, result.materials), (fresh.bones, result.bones), (fresh.model, result.model)):
+            np.testing.assert_allclose(a.lo, b.lo)
+            np.testing.assert_allclose(a.hi, b.hi)
+            np.testing.assert_allclose(a.center, b.center)
+            self.assertTrue(np.all(b.radius >= a.radius))
+        self.assertGreater(result.model.radius[0], fresh.model.radius[0])
+        distance = np.linalg.norm(positions - result.model.center[0], axis=1)
+        self.assertTrue(np.all(distance <= result.model.radius[0]))
@@ -0,0 +1,72 @@
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from pmx import pmx
+from pmx import collision
+
+from builders import make_rigid as build_rigid
+
+
+def make_rigid(position, group=0, mask=0xFFFF, bound=0, size=(0.5, 0, 0), rotate=(0, 0, 0)):
+    return build_rigid(Position=tuple(position), Group=group, NoCollision=mask, BoundType=bound,
+                       Size=tuple(size), Rotate=tuple(rotate))
+
+
+class TestCollision(unittest.TestCase):
+
+    def test_relation(self):
+        model = pmx.Model()
+        model.Rigids = [
+            make_rigid((0, 0, 0), group=0),
+            make_rigid((0.8, 0, 0), group=1, mask=0xFFFF & ~(1 << 0)),  # ignores group 0
+            make_rigid((1.6, 0, 0), group=1),
+            make_rigid((5, 0, 0), group=2),
+        ]
+        table = model.collision_table()
+        self.assertIs(table, model.collision_table())
+        expected = np.ones((4, 4), dtype=bool)
+        expected[[0, 1], [1, 0]] = False
+        np.fill_diagonal(expected, False)
+        np.testing.assert_array_equal(table.matrix(), expected)
+        self.assertEqual(table.collides([0, 1, 2], [2, 2, 3]).tolist(), [True, True, True])
+
+        # 0-1 overlap but do not collide, 3 is far away
+        self.assertEqual(table.pairs.tolist(), [[1, 2]])
+        groups = table.group_matrix()
+        self.assertTrue(groups[0, 1] and groups[1, 1] and groups[2, 0])
+        self.assertFalse(groups[2, 2])
+
+        joint = pmx.PMJoint()
+        joint.Parent, joint.Child = 2, 1
+        self.assertEqual(table.jointed_pairs([joint]).tolist(), [[1, 2]])
+
+    def test_sample(self):
+        # body (group 0) collides with everything, each chain group with all but itself
+        model = pmx.Model()
+        with (Path(__file__).parent.parent / 'sample' / 'sample_finish.pmx').open(mode='rb') as f:
+            model.Load(f)
+        table = model.collision_table()
+        groups = table.group_matrix()
+        self.assertTrue(groups[0, 0] and groups[0, 4] and groups[3, 4])
+        self.assertFalse(groups[0, 2] or groups[2, 2] or groups[3, 3] or groups[4, 4])
+        self.assertEqual(int(table.matrix().sum()), 420)
+
+    def test_extents(self):
+        rigids = [
+            make_rigid((0, 0, 0), bound=1, size=(1, 2, 3), rotate=(0, np.pi / 2, 0)),
+            make_rigid((0, 0, 0), bound=2, size=(0.5, 4, 0), rotate=(0, 0, np.pi / 2)),
+        ]
+        lo, hi = collision.rigid_extents(rigids)
+        np.testing.assert_allclose(hi, [[3, 2, 1], [2.5, 0.5, 0.5]], atol=1e-6)
+        np.testing.assert_allclose(lo, -hi, atol=1e-6)
+
+    def test_sweep(self):
+        rng = np.random.default_rng(5)
+        lo = rng.random((300, 3)) * 10
+        hi = lo + rng.random((300, 3))
+        pairs = collision.overlapping_pairs(lo, hi)
+        overlap = np.all((lo[:, None] <= hi[None]) & (lo[None] <= hi[:, None]), axis=2)
+        expected = np.argwhere(np.triu(overlap, 1))
+        self.assertEqual(pairs.tolist(), expected.tolist())
@@ -0,0 +1,67 @@
+import unittest
+
+import numpy as np
+
+from pmx import pmx
+from pmx import compact
+
+from builders import make_morph
+from builders import make_offset
+
+
+def make_model():
+    model = pmx.Model()
+    model.Vertices = [pmx.PMVertex() for _ in range(4)]
+    model.Bones = [pmx.PMBone()]
+    model.Morphs = [
+        make_morph(1, [make_offset(0, Move=(1, 0, 0)), make_offset(1, Move=(0, 1e-7, 0)),
+                       make_offset(0, Move=(0, 2, 0)), make_offset(2, Move=(1, 0, 0)),
+                       make_offset(2, Move=(-1, 0, 0))]),
+        make_morph(1, [make_offset(0, Move=(0, 0, 0))]),
+        make_morph(3, [make_offset(3, UV=(0.5, 0, 0, 0)), make_offset(3, UV=(0.5, 0, 0, 0))]),
+        make_morph(1, [make_offset(0, Move=(1, 2, 0))]),
+        make_morph(2, [make_offset(0, Rotate=(0, 0, 0, -1)), make_offset(0, Move=(0, 1, 0), Rotate=(0, 0, 0, 1))]),
+        make_morph(0, [make_offset(0, Power=0.5), make_offset(3, Power=1.0), make_offset(0, Power=0.5),
+                       make_offset(2, Power=0.0)]),
+        make_morph(0, [make_offset(3, Power=1.0), make_offset(0, Power=1.0)]),
+    ]
+    return model
+
+
+class TestCompact(unittest.TestCase):
+
+    def test_compact(self):
+        model = make_model()
+        report = model.compact_morphs()
+        self.assertEqual(report.removed_offsets, [2, 1, 0, 0, 1, 1, 0])
+        self.assertEqual(report.merged_offsets, [2, 0, 1, 0, 0, 1, 0])
+
+        offsets = model.Morphs[0].Offsets
+        self.assertEqual([o.Index for o in offsets], [0])
+        self.assertEqual(tuple(offsets[0].Move), (1, 2, 0))
+        self.assertEqual(tuple(model.Morphs[2].Offsets[0].UV), (1, 0, 0, 0))
+        self.assertEqual(len(model.Morphs[4].Offsets), 1)
+        self.assertEqual([(o.Index, o.Power) for o in model.Morphs[5].Offsets], [(0, 1.0), (3, 1.0)])
+
+        self.assertEqual(report.empty, [1])
+        self.assertEqual(report.identical, [(3, 0), (6, 5)])
+
+        # vertex index: 1 byte, bone: 1 byte, morph: 1 byte
+        self.assertEqual(report.bytes_before[:3], [5 * 13, 13, 2 * 17])
+        self.assertEqual(report.bytes_after[:3], [13, 0, 17])
+        self.assertEqual(report.bytes_saved, 13 * 5 + 17 + 29 + 5 * 2)
+
+    def test_unchanged(self):
+        model = make_model()
+        model.Morphs = model.Morphs[3:4]
+        before = model.Morphs[0].Offsets
+        report = model.compact_morphs()
+        self.assertIs(model.Morphs[0].Offsets, before)
+        self.assertEqual(report.bytes_saved, 0)
+
+    def test_columns(self):
+        keep, merged, summed = compact.compact_offsets(
+            np.array([0, 0, 1, 1]), np.array([5, 5, 5, -1]), np.array([[1.0], [-1.0], [2.0], [3.0]]), 1e-6)
+        self.assertEqual(keep.tolist(), [False, False, True, True])
+        self.assertEqual(merged.tolist(), [False, True, False, False])
+        self.assertEqual(summed[:, 0].tolist(), [0.0, -1.0, 2.0, 3.0])
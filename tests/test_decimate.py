@@ -0,0 +1,111 @@
+import unittest
+
+import numpy as np
+
+from pmx import pmx
+from pmx import columns
+from pmx import decimate
+
+from builders import make_material
+from builders import make_morph
+from builders import make_offset
+from builders import make_pmx
+from builders import make_vertex
+from builders import reload
+
+
+def make_grid(size, height=None, split=None):
+    # size x size quads on z = height(x, y); the right half uses a second material
+    # when split is set, sharing the vertices of column split
+    model = make_pmx()
+    model.Bones = [pmx.PMBone(), pmx.PMBone()]
+    for y in range(size + 1):
+        for x in range(size + 1):
+            z = height(x, y) if height else 0.0
+            model.Vertices.append(make_vertex((x, y, z), [0, 1], [1.0 - x / size], Normal=(0, 0, 1), UV=(x, y)))
+
+    quads = [[], []]
+    for y in range(size):
+        for x in range(size):
+            a = y * (size + 1) + x
+            b, c, d = a + 1, a + size + 2, a + size + 1
+            quads[int(split is not None and x >= split)].extend([a, b, c, a, c, d])
+    model.Faces = quads[0] + quads[1]
+    model.Materials = [make_material(len(part)) for part in quads if part or part is quads[0]]
+    model.Morphs = [make_morph(1, [make_offset(i, Move=(0, 0, v.Position.x)) for (i, v) in enumerate(model.Vertices)])]
+    return model
+
+
+class TestDecimate(unittest.TestCase):
+
+    def test_plane(self):
+        model = make_grid(12)
+        border = {tuple(v.Position) for v in model.Vertices if v.Position.x in (0, 12) or v.Position.y in (0, 12)}
+        report = model.decimate(0.5)
+        self.assertEqual(report.triangles_before, 288)
+        self.assertLessEqual(report.triangles_after, 144)
+        self.assertEqual(report.triangles_after, len(model.Faces) // 3)
+        self.assertEqual(report.vertices_after, len(model.Vertices))
+
+        positions = columns.position_columns(model.Vertices)
+        np.testing.assert_allclose(positions[:, 2], 0.0)
+        self.assertTrue(border <= {tuple(p) for p in positions.tolist()})
+        faces = model.face_array()
+        corners = positions[faces]
+        normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+        self.assertTrue(np.all(normals[:, 2] > 0))
+        self.assertEqual(model.Materials[0].FaceLength, len(model.Faces))
+
+    def test_attributes(self):
+        model = make_grid(12)
+        model.decimate(0.3)
+        positions = columns.position_columns(model.Vertices)
+        np.testing.assert_allclose(columns.uv_columns(model.Vertices), positions[:, :2], atol=1e-6)
+
+        # weights were linear in x, so interpolation keeps them exact
+        types, bones, weights = columns.weight_columns(model.Vertices)
+        share = np.where(bones == 1, weights, 0.0).sum(axis=1)
+        np.testing.assert_allclose(share, positions[:, 0] / 12, atol=1e-6)
+        np.testing.assert_allclose(weights.sum(axis=1), 1.0, atol=1e-6)
+
+        # so were the morph deltas; every survivor keeps exactly one offset
+        offsets = model.Morphs[0].Offsets
+        index = [o.Index for o in offsets]
+        self.assertEqual(sorted(index), sorted(set(index)))
+        for o in offsets:
+            self.assertAlmostEqual(o.Move.z, model.Vertices[o.Index].Position.x, places=5)
+
+    def test_materials(self):
+        model = make_grid(12, split=6)
+        report = model.decimate(0.25)
+        self.assertLess(report.triangles_after, 288)
+        ranges = model.material_ranges()
+        positions = columns.position_columns(model.Vertices)
+        faces = model.face_array()
+        self.assertEqual(ranges.counts().sum(), len(faces))
+        # each material stays on its side of the shared column
+        for (material, side) in ((0, positions[:, 0] <= 6), (1, positions[:, 0] >= 6)):
+            self.assertTrue(np.all(side[ranges.faces(faces, material)]))
+        for y in range(13):
+            self.assertIn((6.0, float(y), 0.0), {tuple(p) for p in positions.tolist()})
+
+    def test_curved(self):
+        model = make_grid(30, height=lambda x, y: 3 * np.sin(x / 5.0) * np.cos(y / 7.0))
+        report = model.decimate(0.1)
+        self.assertLessEqual(report.triangles_after, 180)
+        self.assertGreater(report.passes, 1)
+        self.assertEqual(len(reload(model).Faces), len(model.Faces))
+
+    def test_ratio(self):
+        model = make_grid(2)
+        with self.assertRaises(ValueError):
+            model.decimate(0)
+        report = model.decimate(1.0)
+        self.assertEqual((report.passes, report.triangles_after), (0, 8))
+
+    def test_quadrics(self):
+        positions = np.array([[0, 0, 1.0], [1, 0, 1], [0, 1, 1]])
+        quadric = decimate.face_quadrics(positions, np.array([[0, 1, 2]]))
+        point = np.array([0.3, 0.3, 3.0, 1.0])
+        # area 0.5 times squared distance 2 ** 2
+        self.assertAlmostEqual(point @ quadric[0] @ point, 2.0)
@@ -0,0 +1,78 @@
+import json
+import unittest
+
+import mathutils
+
+from pmx import pmx
+
+from builders import make_bone
+from builders import make_material
+from builders import make_morph
+from builders import make_offset
+from builders import make_vertex
+
+
+def make_model():
+    model = pmx.Model()
+    model.Name = 'model'
+    model.Vertices = [make_vertex((x, 0, 0)) for x in range(4)]
+    model.Faces = [0, 1, 2, 1, 2, 3]
+    model.Bones = [make_bone('root'), make_bone('arm', (1, 0, 0), 0), make_bone('hand', (2, 0, 0), 1)]
+    model.Materials = [make_material(6, Name='skin')]
+    model.Morphs = [make_morph(1, [make_offset(i, Move=(0, 0.5, 0)) for i in (1, 3)], 'smile')]
+    return model
+
+
+class TestDiff(unittest.TestCase):
+
+    def test_identical(self):
+        report = pmx.diff(make_model(), make_model())
+        self.assertTrue(report.identical)
+        self.assertEqual(report.to_dict(), {'identical': True, 'header': [], 'sections': {}})
+
+    def test_changes(self):
+        a, b = make_model(), make_model()
+        b.Name = 'model2'
+        b.Vertices[2].Position.y = 0.5
+        b.Vertices[3].Position.y = 1e-7  # below tolerance
+        b.Vertices.append(make_vertex((9, 0, 0)))
+        b.Faces[5] = 4
+        b.Bones[1].Position = mathutils.Vector((1, 0.25, 0))
+        b.Bones.insert(0, b.Bones.pop(2))
+        b.Bones.append(make_bone('tail'))
+        b.Morphs[0].Offsets[1].Move = mathutils.Vector((0, 0.75, 0))
+        b.Materials[0].Deffuse = mathutils.Vector((1, 0, 0, 1))
+
+        report = pmx.diff(a, b)
+        self.assertFalse(report.identical)
+        self.assertEqual(report.header, ['Name'])
+
+        vertices = report.sections['Vertices']
+        self.assertEqual(vertices.added, [4])
+        self.assertEqual([(c.key, c.fields) for c in vertices.changed], [(2, ['Position'])])
+        self.assertAlmostEqual(vertices.changed[0].delta, 0.5)
+        self.assertEqual([c.key for c in report.sections['Faces'].changed], [1])
+
+        bones = report.sections['Bones']
+        self.assertEqual((bones.added, bones.removed, bones.reordered), (['tail'], [], True))
+        self.assertEqual({c.key: c.fields for c in bones.changed}, {'arm': ['Position']})
+
+        morph = report.sections['Morphs'].changed[0]
+        self.assertEqual((morph.key, morph.fields), ('smile', ['Offsets']))
+        self.assertAlmostEqual(morph.delta, 0.25, places=6)
+        self.assertEqual(report.sections['Materials'].changed[0].fields, ['Deffuse'])
+        self.assertTrue(report.sections['Rigids'].identical)
+
+        summary = json.loads(json.dumps(report.to_dict()))
+        self.assertEqual(sorted(summary['sections']), ['Bones', 'Faces', 'Materials', 'Morphs', 'Vertices'])
+        self.assertEqual(summary['sections']['Bones']['changed'][0][0], 'arm')
+
+    def test_tolerance(self):
+        a, b = make_model(), make_model()
+        b.Bones[2].Position = mathutils.Vector((2.001, 0, 0))
+        self.assertFalse(pmx.diff(a, b).identical)
+        self.assertTrue(pmx.diff(a, b, tolerance=0.01).identical)
+        b.Morphs[0].Offsets.pop()
+        change = pmx.diff(a, b, tolerance=0.01).sections['Morphs'].changed[0]
+        self.assertEqual(change.delta, float('inf'))
+        self.assertEqual(pmx.diff(a, b).to_dict()['sections']['Morphs']['changed'], [['smile', None, ['Offsets']]])
@@ -0,0 +1,93 @@
+import unittest
+
+import mathutils
+import numpy as np
+
+from pmx import pmx
+from pmx import ik
+from pmx import kinematics
+
+from builders import make_bone
+
+
+def make_link(index, lower=None, upper=None):
+    link = pmx.PMIKLink()
+    link.Index = index
+    if lower is not None:
+        link.UseLimit = 1
+        link.LowerLimit = mathutils.Vector(lower)
+        link.UpperLimit = mathutils.Vector(upper)
+    return link
+
+
+def make_leg(goal=(0, 0.5, 1), knee_limit=True):
+    # hip 0 -> knee 1 -> ankle 2, IK bone 3 pulls the ankle to goal
+    model = pmx.Model()
+    model.Bones = [make_bone('hip', (0, 2, 0)), make_bone('knee', (0, 1, 0), 0), make_bone('ankle', (0, 0, 0), 1),
+                   make_bone('leg IK', goal)]
+    leg_ik = model.Bones[3]
+    leg_ik.UseIK = 1
+    leg_ik.IK.TargetIndex = 2
+    leg_ik.IK.Loops = 40
+    leg_ik.IK.Limit = 0.5
+    if knee_limit:
+        knee = make_link(1, (-np.pi, 0, 0), (-0.01, 0, 0))
+    else:
+        knee = make_link(1)
+    leg_ik.IK.Member = [knee, make_link(0)]
+    return model
+
+
+class TestIK(unittest.TestCase):
+
+    def test_reach(self):
+        model = make_leg(knee_limit=False)
+        world = model.forward_kinematics()
+        np.testing.assert_allclose(world[0, 2, :3, 3], [0, 0.5, 1], atol=1e-3)
+        # bone lengths are kept
+        self.assertAlmostEqual(np.linalg.norm(world[0, 1, :3, 3] - world[0, 0, :3, 3]), 1.0)
+
+        rest = model.forward_kinematics(ik=False)
+        np.testing.assert_allclose(rest[0, 2, :3, 3], [0, 0, 0])
+
+    def test_knee_plane(self):
+        model = make_leg()
+        world = model.forward_kinematics()
+        np.testing.assert_allclose(world[0, 2, :3, 3], [0, 0.5, 1], atol=1e-3)
+
+        # the knee bends about its x axis only, inside its limits
+        knee_local = np.linalg.inv(world[0, 0]) @ world[0, 1]
+        euler = ik.matrix_to_euler_xyz(knee_local[:3, :3], np.zeros(3))
+        np.testing.assert_allclose(euler[1:], [0, 0], atol=1e-9)
+        self.assertTrue(-np.pi <= euler[0] <= -0.01)
+
+    def test_frames(self):
+        model = make_leg()
+        goals = np.array([[0, 0.5, 1], [0, 1, 0.8], [0, 0.2, 0.3], [0, -3, 0]])
+        translations = np.zeros((len(goals), 4, 3))
+        translations[:, 3] = goals - [0, 0.5, 1]
+        world = model.forward_kinematics(translations=translations)
+        self.assertEqual(world.shape, (4, 4, 4, 4))
+        np.testing.assert_allclose(world[:3, 2, :3, 3], goals[:3], atol=1e-3)
+        # out of reach: the leg stretches towards the goal
+        np.testing.assert_allclose(world[3, 2, :3, 3], [0, 0, 0], atol=1e-3)
+
+    def test_append_follows_ik(self):
+        model = make_leg(knee_limit=False)
+        follower = make_bone('follower', (2, 0, 0), AdditionalRotation=1, AdditionalBoneIndex=0, Level=1)
+        model.Bones.append(follower)
+        world = model.forward_kinematics()
+        np.testing.assert_allclose(world[0, 4, :3, :3], world[0, 0, :3, :3], atol=1e-9)
+
+    def test_euler(self):
+        angles = np.array([[0.3, -0.2, 1.1], [-2.0, 0.4, 0.1]])
+        mat = ik.euler_xyz_to_matrix(angles)
+        np.testing.assert_allclose(ik.matrix_to_euler_xyz(mat, angles), angles, atol=1e-12)
+        x = mathutils.Matrix.Rotation(0.3, 3, 'X')
+        y = mathutils.Matrix.Rotation(-0.2, 3, 'Y')
+        z = mathutils.Matrix.Rotation(1.1, 3, 'Z')
+        np.testing.assert_allclose(mat[0], np.array(x @ y @ z), atol=1e-6)
+
+        chain = kinematics.build_skeleton(make_leg()).chains[3]
+        self.assertEqual(chain.plane_axis.tolist(), [0, -1])
+        self.assertEqual(chain.links.tolist(), [1, 0])
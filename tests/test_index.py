@@ -0,0 +1,146 @@
+import unittest
+from pathlib import Path
+
+import mathutils
+
+from pmx import pmx
+from pmx.index import drop_vertex_offsets
+from pmx.index import region_vertex_delta
+
+from builders import make_material
+from builders import make_morph
+from builders import make_offset
+from builders import make_vertex
+
+
+def make_weighted_model():
+    model = pmx.Model()
+    model.Bones = [pmx.PMBone() for i in range(4)]
+    sdef = [0.25, mathutils.Vector((0, 0, 0)), mathutils.Vector((0, 0, 0)), mathutils.Vector((0, 0, 0))]
+    model.Vertices = [
+        make_vertex(bones=[0]),                                           # BDEF1
+        make_vertex(bones=[0, 1], weights=[0.75]),                        # BDEF2
+        make_vertex(bones=[1, 2, 3, 3], weights=[0.5, 0.25, 0.125, 0.125]),  # BDEF4, duplicate bone
+        make_vertex(bones=[2, 0], weights=sdef, Type=3),                  # SDEF
+        make_vertex(bones=[3, 1, 0, 2], weights=[0.5, 0.5, 0.0, 0.0], Type=4),  # QDEF, zero weights
+    ]
+    return model
+
+
+class TestBoneVertexIndex(unittest.TestCase):
+
+    def test_lookup(self):
+        index = make_weighted_model().bone_vertex_index()
+        self.assertEqual(len(index), 4)
+
+        verts, weights = index.lookup(0)
+        self.assertEqual(verts.tolist(), [0, 1, 3])
+        self.assertEqual(weights.tolist(), [1.0, 0.75, 0.75])
+
+        verts, weights = index.lookup(1)
+        self.assertEqual(verts.tolist(), [1, 2, 4])
+        self.assertEqual(weights.tolist(), [0.25, 0.5, 0.5])
+
+        verts, weights = index.lookup(3)
+        self.assertEqual(verts.tolist(), [2, 4])
+        self.assertEqual(weights.tolist(), [0.25, 0.5])
+
+    def test_vertices_of(self):
+        index = make_weighted_model().bone_vertex_index()
+        self.assertEqual(index.vertices_of([2, 3]).tolist(), [2, 3, 4])
+        self.assertEqual(index.vertices_of([]).tolist(), [])
+
+    def test_cache(self):
+        model = make_weighted_model()
+        index = model.bone_vertex_index()
+        self.assertIs(model.bone_vertex_index(), index)
+
+        model.Vertices.append(make_vertex(bones=[2]))
+        rebuilt = model.bone_vertex_index()
+        self.assertIsNot(rebuilt, index)
+        self.assertEqual(rebuilt.lookup(2)[0].tolist(), [2, 3, 5])
+
+        model.Vertices[5].Bones = [1]
+        model.invalidate('Vertices')
+        self.assertEqual(model.bone_vertex_index().lookup(1)[0].tolist(), [1, 2, 4, 5])
+
+    def test_load_model(self):
+        test_pmx = Path(__file__).parent / 'data' / 'test_01.pmx'
+
+        model = pmx.Model()
+        with test_pmx.open(mode="rb") as f:
+            model.Load(f)
+
+        index = model.bone_vertex_index()
+        self.assertEqual(index.counts().tolist(), [14])
+
+
+def make_morph_model():
+    model = make_weighted_model()
+    model.Morphs = [
+        make_morph(1, [make_offset(3, Move=(1, 0, 0)), make_offset(0, Move=(0, 2, 0))]),
+        make_morph(2, [0]),  # bone morph, not indexed
+        make_morph(3, [3, 4]),
+        make_morph(1, [make_offset(0, Move=(0, 0, 4))]),
+    ]
+    return model
+
+
+class TestVertexMorphIndex(unittest.TestCase):
+
+    def test_lookup(self):
+        index = make_morph_model().vertex_morph_index()
+        self.assertEqual(index.counts().tolist(), [2, 0, 0, 2, 1])
+
+        morphs, rows = index.lookup(0)
+        self.assertEqual(morphs.tolist(), [0, 3])
+        self.assertEqual(rows.tolist(), [1, 0])
+
+        self.assertEqual(index.morphs_of([3, 4]).tolist(), [0, 2])
+
+    def test_region_delta(self):
+        model = make_morph_model()
+        delta = region_vertex_delta(model, {0: 0.5, 2: 1.0, 3: 1.0}, [3, 1, 0])
+        self.assertEqual(delta.tolist(), [[0.5, 0, 0], [0, 0, 0], [0, 1.0, 4.0]])
+
+    def test_drop_vertex_offsets(self):
+        model = make_morph_model()
+        model.vertex_morph_index()
+
+        self.assertEqual(drop_vertex_offsets(model, [3]), 2)
+        self.assertEqual([o.Index for o in model.Morphs[0].Offsets], [0])
+        self.assertEqual([o.Index for o in model.Morphs[2].Offsets], [4])
+        self.assertEqual(model.vertex_morph_index().counts().tolist(), [2, 0, 0, 0, 1])
+
+
+class TestMaterialRanges(unittest.TestCase):
+
+    def make_model(self):
+        model = make_weighted_model()
+        model.Faces = [0, 1, 2, 1, 2, 3, 2, 3, 4, 0, 3, 4, 0, 1, 4]
+        model.Materials = [make_material(6), make_material(0), make_material(9)]
+        return model
+
+    def test_ranges(self):
+        ranges = self.make_model().material_ranges()
+        self.assertEqual(ranges.range(0), (0, 2))
+        self.assertEqual(ranges.range(1), (2, 2))
+        self.assertEqual(ranges.range(2), (2, 5))
+        self.assertEqual(ranges.material_of([0, 1, 2, 4]).tolist(), [0, 0, 2, 2])
+        self.assertEqual(ranges.triangle_materials().tolist(), [0, 0, 2, 2, 2])
+
+    def test_slices(self):
+        model = self.make_model()
+        ranges = model.material_ranges()
+        faces = model.face_array()
+        self.assertEqual(ranges.faces(faces, 0).tolist(), [[0, 1, 2], [1, 2, 3]])
+        self.assertEqual([len(f) for f in ranges.split(faces)], [2, 0, 3])
+        self.assertEqual(ranges.vertex_counts(faces).tolist(), [4, 0, 5])
+
+    def test_invalidate(self):
+        model = self.make_model()
+        model.material_ranges()
+        model.Materials[0].FaceLength = 3
+        model.Materials[2].FaceLength = 12
+        model.invalidate('Materials')
+        self.assertEqual(model.material_ranges().range(2), (1, 5))
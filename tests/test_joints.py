@@ -0,0 +1,76 @@
+import unittest
+
+import numpy as np
+
+from pmx import joints
+
+from builders import make_bone
+from builders import make_pmx
+from builders import make_rigid
+from builders import reload
+
+
+def make_skirt(chains=8, length=3):
+    # a static hip rigid and chains hanging on a circle, one rigid per bone
+    model = make_pmx()
+    model.Bones = [make_bone('hip', (0, 10, 0))]
+    model.Rigids = [make_rigid(0, Name='hip')]
+
+    for c in range(chains):
+        angle = 2 * np.pi * c / chains
+        for k in range(length):
+            position = (2 * np.cos(angle), 9 - k, 2 * np.sin(angle))
+            model.Bones.append(make_bone('c%d_%d' % (c, k), position, len(model.Bones) - 1 if k else 0))
+            model.Rigids.append(make_rigid(len(model.Bones) - 1, Name='c%d_%d' % (c, k), PhysicalType=1,
+                                           Position=(position[0], position[1] - 0.5, position[2])))
+    return model
+
+
+class TestJoints(unittest.TestCase):
+
+    def test_chains(self):
+        model = make_skirt()
+        result = model.generate_joints(preset='skirt')
+        self.assertEqual(len(result), 24)
+        pairs = sorted((j.Parent, j.Child) for j in result)
+        self.assertEqual(pairs[:8], [(0, 1 + 3 * c) for c in range(8)])
+        self.assertIn((1, 2), pairs)
+        self.assertIn((2, 3), pairs)
+        joint = next(j for j in result if j.Child == 2)
+        self.assertEqual((joint.Type, joint.Name), (0, 'c0_1'))
+        np.testing.assert_allclose(joint.Position, model.Bones[2].Position)
+        np.testing.assert_allclose(joint.RotUpperLimit, np.radians([45, 5, 15]), rtol=1e-6)
+        np.testing.assert_allclose(joint.RotSpring, [50, 0, 50], rtol=1e-6)
+
+    def test_springs(self):
+        # springs are stiffness, written unconverted and read back as given
+        model = make_skirt(chains=1, length=2)
+        limits = joints.JointLimits(rot_spring=(5.0, 0.0, 10.0), pos_spring=(0.0, 20.0, 0.0))
+        model.Joints = model.generate_joints(preset=limits)
+        loaded = reload(model)
+        np.testing.assert_allclose(loaded.Joints[0].RotSpring, [5, 0, 10], rtol=1e-6)
+        np.testing.assert_allclose(loaded.Joints[0].PosSpring, [0, 20, 0], rtol=1e-6)
+
+    def test_links(self):
+        model = make_skirt()
+        result = model.generate_joints(horizontal=True)
+        links = sorted((j.Parent, j.Child) for j in result[24:])
+        # every row closes into a ring of 8 links
+        self.assertEqual(len(links), 24)
+        rows = [(model.Rigids[a].Name[-1], model.Rigids[b].Name[-1]) for (a, b) in links]
+        self.assertTrue(all(x == y for (x, y) in rows))
+        self.assertIn((1, 22), links)
+        self.assertIn((1, 4), links)
+        np.testing.assert_allclose(result[-1].PosUpperLimit, [0.1] * 3, rtol=1e-6)
+
+    def test_hierarchy(self):
+        model = make_skirt(chains=1, length=3)
+        # a bone without a rigid is skipped over, a loop is cut
+        model.Rigids.pop(2)
+        self.assertEqual(joints.ancestor_rigids(model).tolist(), [-1, 0, 1, 1])
+        self.assertEqual([(j.Parent, j.Child) for j in model.generate_joints([1, 2])], [(0, 1), (1, 2)])
+        # the walk from bone 0 meets itself at bone 1
+        model.Bones[0].Parent = 3
+        self.assertEqual(joints.ancestor_rigids(model).tolist(), [2, -1, 1, 1])
+        with self.assertRaises(ValueError):
+            model.generate_joints(preset='cloth')
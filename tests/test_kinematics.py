@@ -0,0 +1,114 @@
+import unittest
+
+import mathutils
+import numpy as np
+
+from pmx import pmx
+from pmx import kinematics
+from pmx import skinning
+
+from builders import make_bone
+
+
+def make_append(position, source, power, rotate=1, move=0):
+    return make_bone('', position, AdditionalBoneIndex=source, AdditionalPower=power,
+                     AdditionalRotation=rotate, AdditionalMovement=move)
+
+
+def quat_z(angle):
+    angle = np.asarray(angle, dtype=np.float64)
+    zero = np.zeros_like(angle)
+    return np.stack((zero, zero, np.sin(angle / 2), np.cos(angle / 2)), axis=-1)
+
+
+def make_model():
+    model = pmx.Model()
+    model.Bones = [
+        make_bone('root', (0, 0, 0)),
+        make_bone('upper', (0, 1, 0), 0),
+        make_bone('head', (0, 2, 0), 1),
+        make_append((1, 0, 0), 1, 0.5),                 # half of bone 1
+        make_append((2, 0, 0), 3, 1.0),                 # chained from bone 3
+        make_append((3, 0, 0), 1, -1.0, rotate=0, move=1),
+    ]
+    return model
+
+
+def angle_of(world, bone):
+    # rotation about z of a world matrix
+    return np.arctan2(world[..., bone, 1, 0], world[..., bone, 0, 0])
+
+
+class TestForwardKinematics(unittest.TestCase):
+
+    def test_rest(self):
+        model = make_model()
+        world = model.forward_kinematics()
+        self.assertEqual(world.shape, (1, 6, 4, 4))
+        np.testing.assert_allclose(world[0], skinning.rest_matrices(model))
+
+    def test_hierarchy(self):
+        model = make_model()
+        rotations = np.tile(kinematics.IDENTITY_QUAT, (6, 1))
+        rotations[1] = quat_z(np.pi / 2)
+        world = model.forward_kinematics(rotations)
+        np.testing.assert_allclose(world[0, 2, :3, 3], [-1, 1, 0], atol=1e-12)
+        np.testing.assert_allclose(angle_of(world[0], 2), np.pi / 2)
+
+    def test_append(self):
+        model = make_model()
+        frames = np.array([0.0, np.pi / 2, -np.pi / 3])
+        rotations = np.tile(kinematics.IDENTITY_QUAT, (3, 6, 1))
+        rotations[:, 1] = quat_z(frames)
+        translations = np.zeros((3, 6, 3))
+        translations[:, 1] = [[0, 0, 1], [0, 0, 2], [0, 0, 3]]
+
+        world = model.forward_kinematics(rotations, translations)
+        self.assertEqual(world.shape, (3, 6, 4, 4))
+        np.testing.assert_allclose(angle_of(world, 3), frames / 2, atol=1e-12)
+        np.testing.assert_allclose(angle_of(world, 4), frames / 2, atol=1e-12)
+        # negative power on movement, position follows the source inverted
+        np.testing.assert_allclose(world[:, 5, :3, 3], [[3, 0, -1], [3, 0, -2], [3, 0, -3]])
+        np.testing.assert_allclose(angle_of(world, 5), 0.0)
+
+    def test_local_append(self):
+        model = make_model()
+        model.Bones[4].AdditionalLocal = 1
+        rotations = np.tile(kinematics.IDENTITY_QUAT, (6, 1))
+        rotations[1] = quat_z(np.pi / 2)
+        rotations[3] = quat_z(np.pi / 4)
+        model.invalidate('Bones')
+        world = model.forward_kinematics(rotations)
+        # local append reads bone 3's own rotation, not its grant
+        np.testing.assert_allclose(angle_of(world[0], 4), np.pi / 4)
+        np.testing.assert_allclose(angle_of(world[0], 3), np.pi / 2)
+
+    def test_level_order(self):
+        model = make_model()
+        # bone 3 now appends bone 4, which is deformed later unless levels say otherwise
+        model.Bones[3].AdditionalBoneIndex = 4
+        model.Bones[4].AdditionalBoneIndex = 1
+        rotations = np.tile(kinematics.IDENTITY_QUAT, (6, 1))
+        rotations[1] = quat_z(np.pi / 2)
+
+        world = model.forward_kinematics(rotations)
+        np.testing.assert_allclose(angle_of(world[0], 3), 0.0)
+
+        model.Bones[3].Level = 1
+        model.invalidate('Bones')
+        world = model.forward_kinematics(rotations)
+        np.testing.assert_allclose(angle_of(world[0], 3), np.pi / 4)
+
+    def test_fixed_axis(self):
+        model = make_model()
+        model.Bones[1].UseFixedAxis = 1
+        model.Bones[1].FixedAxis = mathutils.Vector((0, 0, 2))
+        rotations = np.tile(kinematics.IDENTITY_QUAT, (6, 1))
+        rotations[1] = [np.sin(0.3), 0, 0, np.cos(0.3)]
+        world = model.forward_kinematics(rotations)
+        np.testing.assert_allclose(world[0, 1, :3, :3], np.eye(3), atol=1e-12)
+
+        q = mathutils.Quaternion((1, 0, 0), 0.6) @ mathutils.Quaternion((0, 0, 1), 0.4)
+        rotations[1] = [q.x, q.y, q.z, q.w]
+        twisted = kinematics.twist(rotations[1], [0, 0, 1])
+        self.assertAlmostEqual(2 * np.arctan2(twisted[2], twisted[3]), 0.4, places=6)
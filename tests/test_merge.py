@@ -0,0 +1,135 @@
+import unittest
+
+from pmx import pmx
+
+from builders import make_bone
+from builders import make_frame
+from builders import make_material
+from builders import make_morph
+from builders import make_pmx
+from builders import make_rigid
+from builders import make_texture
+from builders import make_vertex
+from builders import reload
+
+
+def make_body():
+    model = make_pmx()
+    model.Name = 'body'
+    model.Bones = [make_bone('center'), make_bone('upper', parent=0), make_bone('head', parent=1)]
+    model.Vertices = [make_vertex(bones=[0]), make_vertex(bones=[1, 2]), make_vertex(bones=[2])]
+    model.Faces = [0, 1, 2]
+    model.Textures = [make_texture('skin.png')]
+    model.Materials = [make_material(3, 0)]
+    model.Morphs = [make_morph(1, [1, 2], 'smile')]
+    model.DisplayFrames = [make_frame('Root', [(0, 0)]), make_frame('face', [(1, 0)])]
+    model.Rigids = [make_rigid(2)]
+    return model
+
+
+def make_hair():
+    model = pmx.Model()
+    model.Name = 'hair'
+    model.Bones = [make_bone('head'), make_bone('hair1', parent=0), make_bone('hair2', parent=1)]
+    model.Bones[1].ToConnectType = 1
+    model.Bones[1].ChildIndex = 2
+    model.Bones[0].UseIK = 1
+    model.Bones[0].IK.TargetIndex = 2
+    link = pmx.PMIKLink()
+    link.Index = 1
+    model.Bones[0].IK.Member = [link]
+    model.Vertices = [make_vertex(bones=[0, 1]), make_vertex(bones=[1]), make_vertex(bones=[2]),
+                      make_vertex(bones=[2])]
+    model.Faces = [0, 1, 2, 1, 3, 2]
+    model.Textures = [make_texture('hair.png'), make_texture('skin.png')]
+    model.Materials = [make_material(3, 0), make_material(3, 1)]
+    model.Morphs = [make_morph(1, [3], 'sway'), make_morph(2, [1], 'bend'), make_morph(0, [0, 1], 'all'),
+                    make_morph(8, [-1, 1], 'tint'), make_morph(10, [1], 'push')]
+    model.DisplayFrames = [make_frame('Root', [(0, 0)]), make_frame('hair', [(0, 1), (0, 2)]),
+                           make_frame('face', [(1, 2)])]
+    model.Rigids = [make_rigid(0), make_rigid(1)]
+    joint = pmx.PMJoint()
+    joint.Parent, joint.Child = 0, 1
+    model.Joints = [joint]
+    soft = pmx.PMSoftBody()
+    soft.Material = 1
+    soft.Anchors = [[1, 3, 0]]
+    soft.Pins = [2]
+    model.SoftBodies = [soft]
+    return model
+
+
+class TestMerge(unittest.TestCase):
+
+    def test_by_name(self):
+        merged = pmx.merge([make_body(), make_hair()])
+        self.assertEqual(merged.Name, 'body')
+        self.assertEqual([b.Name for b in merged.Bones], ['center', 'upper', 'head', 'hair1', 'hair2'])
+        self.assertEqual(merged.Bones[3].Parent, 2)
+        self.assertEqual(merged.Bones[3].ChildIndex, 4)
+        self.assertEqual(merged.Bones[2].UseIK, 0)  # the body's head bone wins
+
+        self.assertEqual([v.Bones for v in merged.Vertices[3:]], [[2, 3], [3], [4], [4]])
+        self.assertEqual(merged.Faces, [0, 1, 2, 3, 4, 5, 4, 6, 5])
+        self.assertEqual([t.Path for t in merged.Textures], ['skin.png', 'hair.png'])
+        self.assertEqual([m.TextureIndex for m in merged.Materials], [0, 1, 0])
+
+        index = [[o.Index for o in m.Offsets] for m in merged.Morphs]
+        self.assertEqual(index, [[1, 2], [6], [3], [1, 2], [-1, 2], [2]])
+        self.assertEqual([r.Bone for r in merged.Rigids], [2, 2, 3])
+        self.assertEqual((merged.Joints[0].Parent, merged.Joints[0].Child), (1, 2))
+        soft = merged.SoftBodies[0]
+        self.assertEqual((soft.Material, soft.Anchors, soft.Pins), (2, [[2, 6, 0]], [5]))
+
+        frames = {f.Name: f.Members for f in merged.DisplayFrames}
+        self.assertEqual(list(frames), ['Root', 'face', 'hair'])
+        self.assertEqual(frames['Root'], [[0, 0], [0, 2]])
+        self.assertEqual(frames['face'], [[1, 0], [1, 3]])
+        self.assertEqual(frames['hair'], [[0, 3], [0, 4]])
+
+        # soft bodies are PMX 2.1
+        merged.SoftBodies = []
+        loaded = reload(merged)
+        self.assertEqual(len(loaded.Bones), 5)
+        self.assertEqual(len(loaded.Faces), 9)
+
+    def test_keep_bones(self):
+        merged = pmx.merge([make_body(), make_hair()], bone_match=None)
+        self.assertEqual(len(merged.Bones), 6)
+        self.assertEqual(merged.Bones[3].UseIK, 1)
+        self.assertEqual(merged.Bones[3].IK.TargetIndex, 5)
+        self.assertEqual(merged.Bones[3].IK.Member[0].Index, 4)
+        self.assertEqual([v.Bones for v in merged.Vertices[3:]], [[3, 4], [4], [5], [5]])
+        with self.assertRaises(ValueError):
+            pmx.merge([make_body()], bone_match='position')
+
+    def test_parts_unchanged(self):
+        body, hair = make_body(), make_hair()
+        pmx.merge([body, hair])
+        self.assertEqual([v.Bones for v in hair.Vertices], [[0, 1], [1], [2], [2]])
+        self.assertEqual([[o.Index for o in m.Offsets] for m in hair.Morphs], [[3], [1], [0, 1], [-1, 1], [1]])
+        self.assertEqual((hair.Joints[0].Parent, hair.Joints[0].Child), (0, 1))
+        self.assertEqual((hair.Materials[1].TextureIndex, hair.SoftBodies[0].Anchors), (1, [[1, 3, 0]]))
+        self.assertEqual(hair.DisplayFrames[1].Members, [[0, 1], [0, 2]])
+        self.assertEqual(len(reload(body).Vertices), 3)
+
+    def test_repeated_part(self):
+        hair = make_hair()
+        merged = pmx.merge([hair, hair])
+        self.assertEqual(len(merged.Bones), 3)
+        self.assertEqual(merged.Faces[6:], [4, 5, 6, 5, 7, 6])
+        index = [[o.Index for o in m.Offsets] for m in merged.Morphs[5:]]
+        self.assertEqual(index, [[7], [1], [5, 6], [-1, 3], [3]])
+        self.assertEqual((merged.Joints[1].Parent, merged.Joints[1].Child), (2, 3))
+        soft = merged.SoftBodies[1]
+        self.assertEqual((soft.Material, soft.Anchors, soft.Pins), (3, [[3, 7, 0]], [6]))
+        self.assertEqual((hair.Joints[0].Parent, hair.SoftBodies[0].Pins), (0, [2]))
+
+    def test_name_index(self):
+        model = make_body()
+        model.Bones.append(make_bone('upper'))
+        model.Bones.append(make_bone(''))
+        names = model.name_index()
+        self.assertEqual(names, {'center': 0, 'upper': 1, 'head': 2})
+        self.assertIs(names, model.name_index('Bones'))
+        self.assertEqual(model.name_index('Morphs'), {'smile': 0})
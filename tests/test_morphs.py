@@ -0,0 +1,141 @@
+import unittest
+import time
+
+import mathutils
+import numpy as np
+
+from pmx import pmx
+from pmx import morphs
+
+from builders import make_morph
+from builders import make_offset
+
+
+def make_model():
+    model = pmx.Model()
+    model.Vertices = [pmx.PMVertex() for _ in range(4)]
+    model.Bones = [pmx.PMBone(), pmx.PMBone()]
+    model.Materials = [pmx.PMMaterial(), pmx.PMMaterial()]
+    q = mathutils.Quaternion((0, 0, 1), np.pi / 2)
+    model.Morphs = [
+        make_morph(1, [make_offset(0, Move=(1, 0, 0)), make_offset(2, Move=(0, 2, 0))], 'a'),
+        make_morph(1, [make_offset(2, Move=(0, 0, 4))], 'b'),
+        make_morph(3, [make_offset(1, UV=(0.5, 0.25, 0, 0))], 'uv'),
+        make_morph(5, [make_offset(3, UV=(1, 1, 1, 1))], 'exuv2'),
+        make_morph(2, [make_offset(1, Move=(0, 1, 0), Rotate=(q.x, q.y, q.z, q.w))], 'bone'),
+        make_morph(8, [make_offset(-1, MatEffectType=0, MatDiffuse=(0, 0, 0, 0)),
+                       make_offset(1, MatEffectType=1, MatEdgeSize=2.0)], 'mat'),
+        make_morph(0, [make_offset(0, Power=0.5), make_offset(1, Power=1.0)], 'group'),
+        make_morph(0, [make_offset(6, Power=2.0), make_offset(0, Power=1.0)], 'nested'),
+        make_morph(9, [make_offset(0, Power=1.0), make_offset(1, Power=1.0), make_offset(6, Power=1.0)], 'flip'),
+    ]
+    return model
+
+
+class TestMorphs(unittest.TestCase):
+
+    def test_vertex_uv(self):
+        model = make_model()
+        result = model.evaluate_morphs({'a': 0.5, 1: 1.0, 'uv': 2.0, 'exuv2': 0.5})
+        np.testing.assert_allclose(result.vertex, [[0.5, 0, 0], [0, 0, 0], [0, 1, 4], [0, 0, 0]])
+        self.assertEqual(result.uv.shape, (5, 4, 4))
+        np.testing.assert_allclose(result.uv[0, 1], [1, 0.5, 0, 0])
+        np.testing.assert_allclose(result.uv[2, 3], [0.5] * 4)
+        self.assertEqual(np.count_nonzero(result.uv), 6)
+
+    def test_group(self):
+        model = make_model()
+        weights = np.zeros(len(model.Morphs))
+        weights[7] = 0.5
+        result = model.evaluate_morphs(weights)
+        # nested: 2 * (0.5 a + b) + a, scaled by 0.5
+        np.testing.assert_allclose(result.weights[:2], [1.0, 1.0])
+        np.testing.assert_allclose(result.vertex[2], [0, 2, 4])
+
+    def test_cycle(self):
+        model = make_model()
+        model.Morphs[6].Offsets.append(make_offset(7, Power=1.0))
+        result = model.evaluate_morphs({'group': 1.0})
+        # the back edge nested -> group is ignored: 0.5 a + b + a
+        np.testing.assert_allclose(result.weights[:2], [1.5, 1.0])
+
+    def test_flip(self):
+        model = make_model()
+        picks = []
+        for w in (0.0, 0.3, 0.6, 1.0):
+            picks.append(model.evaluate_morphs({'flip': w}).weights[:2].tolist())
+        self.assertEqual(picks, [[0, 0], [1, 0], [0, 1], [0.5, 1]])
+
+    def test_bone_material(self):
+        model = make_model()
+        result = model.evaluate_morphs({'bone': 0.5, 'mat': 0.25})
+        np.testing.assert_allclose(result.bone_move, [[0, 0, 0], [0, 0.5, 0]])
+        q = mathutils.Quaternion((0, 0, 1), np.pi / 4)
+        np.testing.assert_allclose(result.bone_rotate, [[0, 0, 0, 1], [q.x, q.y, q.z, q.w]], atol=1e-7)
+
+        self.assertEqual(result.material_mul.shape, (2, morphs.MATERIAL_WIDTH))
+        np.testing.assert_allclose(result.material_mul[:, :4], 0.75)
+        # a multiply offset carries every field; the default edge size 1 keeps it
+        np.testing.assert_allclose(result.material_mul[:, 7], 0.875)
+        np.testing.assert_allclose(result.material_mul[:, 15], 1.0)
+        np.testing.assert_allclose(result.material_add[1, 15], 0.5)
+        self.assertEqual(np.count_nonzero(result.material_add), 2)
+
+    def test_bone_compose(self):
+        model = make_model()
+        model.Morphs.append(make_morph(2, [make_offset(1, Rotate=tuple(model.Morphs[4].Offsets[0].Rotate))], 'bone2'))
+        result = model.evaluate_morphs({'bone': 1.0, 'bone2': 1.0})
+        q = mathutils.Quaternion((0, 0, 1), np.pi)
+        self.assertAlmostEqual(abs(np.dot(result.bone_rotate[1], [q.x, q.y, q.z, q.w])), 1.0, places=6)
+
+    def test_large(self):
+        rng = np.random.default_rng(3)
+        model = pmx.Model()
+        model.Vertices = [None] * 300000
+        for m in range(200):
+            idx = rng.choice(300000, 500, replace=False)
+            model.Morphs.append(make_morph(1, [make_offset(int(i), Move=(1, 0, 0)) for i in idx], str(m)))
+        weights = rng.random(200)
+        model.evaluate_morphs(weights)
+        start = time.perf_counter()
+        result = model.evaluate_morphs(weights)
+        self.assertLess(time.perf_counter() - start, 0.25)
+        self.assertAlmostEqual(result.vertex[:, 0].sum(), weights.sum() * 500, places=6)
+
+
+class TestMorphGraph(unittest.TestCase):
+
+    def test_flatten(self):
+        model = make_model()
+        graph = model.morph_graph()
+        self.assertIs(graph, model.morph_graph())
+        self.assertEqual(graph.cycles.shape, (0, 2))
+        position = {m: i for (i, m) in enumerate(graph.order.tolist())}
+        self.assertLess(position[6], position[7])
+        self.assertLess(position[6], position[8])
+
+        leaves, factors = graph.leaves(7)
+        self.assertEqual(leaves.tolist(), [0, 1])
+        np.testing.assert_allclose(factors, [2.0, 2.0])
+        self.assertEqual(graph.leaves(8)[0].tolist(), [8])
+        self.assertEqual(sorted(graph.depends_on(0).tolist()), [0, 6, 7])
+
+        weights = np.zeros(len(model.Morphs))
+        weights[[0, 6, 7]] = [1.0, 0.5, 0.25]
+        np.testing.assert_allclose(graph.apply(weights)[:2], [1.0 + 0.25 + 0.5, 0.5 + 0.5])
+
+    def test_cycles(self):
+        model = make_model()
+        model.Morphs[6].Offsets.append(make_offset(7, Power=1.0))
+        model.Morphs.append(make_morph(0, [make_offset(9, Power=1.0), make_offset(1, Power=3.0)], 'self'))
+        graph = model.morph_graph()
+        self.assertEqual(graph.cycles.tolist(), [[7, 6], [9, 9]])
+        self.assertEqual(sorted(graph.order.tolist()), list(range(10)))
+        # 7 -> 6 closed the loop, so 7 keeps only its own vertex morph
+        self.assertEqual(graph.leaves(7)[0].tolist(), [0])
+        np.testing.assert_allclose(graph.leaves(6)[1], [1.5, 1.0])
+        self.assertEqual(graph.leaves(9)[0].tolist(), [1])
+
+        model.Morphs[6].Offsets.pop()
+        model.invalidate('Morphs')
+        self.assertEqual(model.morph_graph().cycles.tolist(), [[9, 9]])
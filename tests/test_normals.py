@@ -0,0 +1,89 @@
+import unittest
+from pathlib import Path
+
+import mathutils
+import numpy as np
+
+from pmx import pmx
+from pmx import columns
+from pmx import normals
+
+from builders import make_model
+from builders import make_morph
+from builders import make_offset
+from builders import make_vertex
+
+
+def make_fold():
+    # floor (z = 0) and wall (x = 0) meeting along the y axis
+    positions = [(0, 0, 0), (0, 1, 0), (1, 0, 0), (1, 1, 0), (0, 0, 1), (0, 1, 1), (5, 5, 5)]
+    faces = [0, 3, 1, 0, 2, 3, 0, 1, 4, 1, 5, 4]
+    return make_model([make_vertex(p) for p in positions], faces, [6, 6])
+
+
+class TestNormals(unittest.TestCase):
+
+    def test_area(self):
+        model = make_fold()
+        model.Vertices[6].Normal = mathutils.Vector((1, 0, 0))
+        model.recompute_normals()
+        result = columns.normal_columns(model.Vertices)
+        np.testing.assert_allclose(result[3], [0, 0, 1], atol=1e-6)
+        np.testing.assert_allclose(result[5], [1, 0, 0], atol=1e-6)
+        # vertex 0: two floor triangles, one wall triangle of equal area
+        np.testing.assert_allclose(result[0], np.array([1, 0, 2]) / 5 ** 0.5, atol=1e-6)
+        np.testing.assert_allclose(result[1], np.array([2, 0, 1]) / 5 ** 0.5, atol=1e-6)
+        # unused vertex keeps its normal
+        np.testing.assert_allclose(result[6], [1, 0, 0])
+
+    def test_angle(self):
+        model = make_fold()
+        positions = columns.position_columns(model.Vertices)
+        faces = model.face_array()
+        angles = normals.corner_angles(positions, faces)
+        np.testing.assert_allclose(angles.sum(axis=1), np.pi)
+
+        # vertex 1: one 90 degree floor corner, two 45 degree wall corners
+        result = normals.vertex_normals(positions, faces, 'angle')
+        np.testing.assert_allclose(result[1], [0.5 ** 0.5, 0, 0.5 ** 0.5], atol=1e-12)
+
+        with self.assertRaises(ValueError):
+            model.recompute_normals(mode='weight')
+
+    def test_split_by_material(self):
+        model = make_fold()
+        model.Morphs = [make_morph(1, [make_offset(1, Move=(0, 2, 0))])]
+
+        # the wall soft body pins and anchors the shared edge
+        soft = pmx.PMSoftBody()
+        soft.Material = 1
+        soft.Anchors = [[0, 1, 0], [0, 4, 0]]
+        soft.Pins = [0, 5]
+        floor = pmx.PMSoftBody()
+        floor.Pins = [0, 1]
+        model.SoftBodies = [soft, floor]
+
+        self.assertEqual(model.recompute_normals(split_by_material=True), 2)
+        self.assertEqual(model.recompute_normals(split_by_material=True), 0)
+        self.assertEqual(len(model.Vertices), 9)
+        self.assertEqual((soft.Anchors, soft.Pins), ([[0, 8, 0], [0, 4, 0]], [7, 5]))
+        self.assertEqual(floor.Pins, [0, 1])
+        self.assertEqual(model.Faces[:6], [0, 3, 1, 0, 2, 3])
+        self.assertEqual(model.Faces[6:], [7, 8, 4, 8, 5, 4])
+        self.assertEqual([o.Index for o in model.Morphs[0].Offsets], [1, 8])
+
+        result = columns.normal_columns(model.Vertices)
+        np.testing.assert_allclose(result[[0, 1]], [[0, 0, 1]] * 2, atol=1e-6)
+        np.testing.assert_allclose(result[[7, 8]], [[1, 0, 0]] * 2, atol=1e-6)
+
+    def test_load_model(self):
+        test_pmx = Path(__file__).parent / 'data' / 'test_01.pmx'
+
+        model = pmx.Model()
+        with test_pmx.open(mode="rb") as f:
+            model.Load(f)
+
+        before = columns.normal_columns(model.Vertices)
+        model.recompute_normals('angle')
+        after = columns.normal_columns(model.Vertices)
+        self.assertTrue(np.all(np.einsum('ij,ij->i', before, after) > 0.5))
@@ -0,0 +1,101 @@
+import io
+import unittest
+from pathlib import Path
+
+from pmx import pmx
+
+from builders import make_bone
+from builders import make_frame
+from builders import make_material
+from builders import make_morph
+from builders import make_offset
+from builders import make_texture
+from builders import make_vertex
+
+
+def make_model():
+    model = pmx.Model()
+    model.Status.Magic = 1
+
+    # 0 root, 1 body (weights), 2 helper leaf, 3 append source of 4,
+    # 4 arm (weights), 5 unused child of 2, 6 morph target
+    model.Bones = [make_bone('root'), make_bone('body', parent=0), make_bone('helper', parent=0),
+                   make_bone('source', parent=0), make_bone('arm', parent=1), make_bone('tip', parent=2),
+                   make_bone('morphed', parent=0)]
+    model.Bones[4].AdditionalRotation = 1
+    model.Bones[4].AdditionalBoneIndex = 3
+    model.Bones[1].ChildIndex = 4
+
+    # vertex 2 is unreferenced, vertex 5 only weights bone 5
+    model.Vertices = [make_vertex((0, 0, 0), [1]), make_vertex((1, 0, 0), [1, 4]),
+                      make_vertex((9, 9, 9), [2]), make_vertex((0, 1, 0), [4]),
+                      make_vertex((1, 1, 0), [4]), make_vertex((8, 8, 8), [5])]
+    model.Faces = [0, 1, 3, 1, 4, 3]
+
+    model.Textures = [make_texture('unused.png'), make_texture('body.png'),
+                      make_texture('toon.bmp'), make_texture('sphere.spa')]
+    model.Materials = [make_material(6, 1, SphereIndex=3, UseSystemToon=0, ToonIndex=2)]
+    model.Morphs = [make_morph(1, [make_offset(i, Move=(i, 0, 0)) for i in (0, 2, 4)]), make_morph(2, [6])]
+    model.DisplayFrames = [make_frame('', [[0, 4], [1, 0]])]
+    return model
+
+
+class TestPrune(unittest.TestCase):
+
+    def test_masks(self):
+        from pmx import prune
+        model = make_model()
+        self.assertEqual(prune.used_vertices(model).tolist(), [True, True, False, True, True, False])
+        self.assertEqual(prune.used_textures(model).tolist(), [False, True, True, True])
+        # bone 2 only weights the unreferenced vertex 2, bone 5 the unreferenced vertex 5
+        used = prune.used_bones(model, prune.used_vertices(model))
+        self.assertEqual(used.tolist(), [True, True, False, True, True, False, True])
+
+    def test_prune(self):
+        model = make_model()
+        report = model.prune()
+        self.assertEqual((report.removed_vertices, report.removed_bones, report.removed_textures), (2, 2, 1))
+        self.assertGreater(report.bytes_saved, 0)
+
+        self.assertEqual([b.Name for b in model.Bones], ['root', 'body', 'source', 'arm', 'morphed'])
+        self.assertEqual([b.Parent for b in model.Bones], [-1, 0, 0, 1, 0])
+        self.assertEqual(model.Bones[1].ChildIndex, 3)
+        self.assertEqual(model.Bones[3].AdditionalBoneIndex, 2)
+        self.assertEqual([v.Bones for v in model.Vertices], [[1], [1, 3], [3], [3]])
+        self.assertEqual(model.Faces, [0, 1, 2, 1, 3, 2])
+
+        self.assertEqual([t.Path for t in model.Textures], ['body.png', 'toon.bmp', 'sphere.spa'])
+        material = model.Materials[0]
+        self.assertEqual((material.TextureIndex, material.ToonIndex, material.SphereIndex), (0, 1, 2))
+
+        self.assertEqual([(o.Index, o.Move.x) for o in model.Morphs[0].Offsets], [(0, 0.0), (3, 4.0)])
+        self.assertEqual(model.Morphs[1].Offsets[0].Index, 4)
+        self.assertEqual(model.DisplayFrames[0].Members, [[0, 3], [1, 0]])
+
+    def test_index_sizes(self):
+        model = make_model()
+        model.Bones += [make_bone('spare%d' % i, parent=0) for i in range(130)]
+        report = model.prune()
+        self.assertEqual(report.removed_bones, 132)
+        self.assertEqual(report.index_sizes_before['Bone'], 'h')
+        self.assertEqual(report.index_sizes_after['Bone'], 'b')
+
+    def test_load_model(self):
+        test_pmx = Path(__file__).parent / 'data' / 'test_01.pmx'
+
+        model = pmx.Model()
+        with test_pmx.open(mode="rb") as f:
+            model.Load(f)
+
+        report = model.prune()
+        self.assertEqual(report.removed_vertices, 0)
+        self.assertEqual(report.bytes_saved, 0)
+
+        buffer = io.BytesIO()
+        model.Save(buffer)
+        self.assertEqual(buffer.tell(), report.bytes_after)
+        buffer.seek(0)
+        reloaded = pmx.Model()
+        reloaded.Load(buffer)
+        self.assertEqual(len(reloaded.Vertices), 14)
+        self.assertEqual(len(reloaded.Bones), 1)
@@ -0,0 +1,85 @@
+import unittest
+import time
+
+import numpy as np
+
+from pmx import pmx
+from pmx import rotation
+
+from builders import make_bone
+from builders import make_vertex
+
+
+def make_chain(count, points=40, seed=0):
+    # a strand per bone along a random direction: rings of radius 0.1 over a length of 2
+    rng = np.random.default_rng(seed)
+    model = pmx.Model()
+    axes = []
+    for b in range(count):
+        position = rng.normal(size=3)
+        axis = rng.normal(size=3)
+        axis /= np.linalg.norm(axis)
+        bone = make_bone('bone%d' % b, position, ToConnectType=0, TailPosition=tuple(axis))
+        model.Bones.append(bone)
+        axes.append(axis)
+
+        side = np.cross(axis, [0.0, 0.0, 1.0] if abs(axis[2]) < 0.9 else [1.0, 0.0, 0.0])
+        side /= np.linalg.norm(side)
+        other = np.cross(axis, side)
+        t = np.repeat(np.linspace(0.0, 2.0, points // 8), 8)
+        angle = np.tile(np.arange(8) * np.pi / 4, points // 8)
+        ring = np.outer(np.cos(angle), side) + np.outer(np.sin(angle), other)
+        for p in (np.array(bone.Position) + np.outer(t, axis) + 0.1 * ring).tolist():
+            model.Vertices.append(make_vertex(p, [b]))
+    return model, np.array(axes)
+
+
+class TestRigidFit(unittest.TestCase):
+
+    def test_capsule(self):
+        model, axes = make_chain(5)
+        rigids = model.fit_rigids()
+        self.assertEqual([r.Bone for r in rigids], list(range(5)))
+        for (rigid, axis, bone) in zip(rigids, axes, model.Bones):
+            self.assertEqual((rigid.BoundType, rigid.Name, rigid.PhysicalType, rigid.NoCollision),
+                             (2, bone.Name, 1, 0xFFFF))
+            frame = rotation.euler_to_matrix(np.array(rigid.Rotate))
+            # local y runs down the bone
+            self.assertGreater(frame[:, 1] @ axis, 0.999)
+            self.assertAlmostEqual(rigid.Size[0], 0.1, places=3)
+            self.assertAlmostEqual(rigid.Size[1], 1.8, places=2)
+            np.testing.assert_allclose(rigid.Position, np.array(bone.Position) + axis, atol=0.02)
+
+    def test_box_sphere(self):
+        model, axes = make_chain(2)
+        box = model.fit_rigids([1], shape='box')[0]
+        self.assertEqual((box.Bone, box.BoundType), (1, 1))
+        np.testing.assert_allclose(sorted(box.Size), [0.1, 0.1, 1.0], atol=0.01)
+        self.assertAlmostEqual(box.Size[1], 1.0, places=5)
+
+        sphere = model.fit_rigids([0], shape='sphere')[0]
+        self.assertAlmostEqual(sphere.Size[0], np.hypot(1.0, 0.1), places=2)
+        self.assertEqual(tuple(sphere.Size[1:]), (0.0, 0.0))
+        with self.assertRaises(ValueError):
+            model.fit_rigids(shape='cone')
+
+    def test_min_weight(self):
+        model, _ = make_chain(3)
+        for vert in model.Vertices:
+            if vert.Bones[0] == 1:
+                vert.Type = 1
+                vert.Bones = [1, 2]
+                vert.Weights = [0.3]
+        model.invalidate('Vertices')
+        self.assertEqual([r.Bone for r in model.fit_rigids()], [0, 2])
+        self.assertEqual([r.Bone for r in model.fit_rigids(min_weight=0.2)], [0, 1, 2])
+
+    def test_many(self):
+        model, axes = make_chain(400, points=60)
+        model.bone_vertex_index()
+        start = time.perf_counter()
+        rigids = model.fit_rigids()
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(len(rigids), 400)
+        frames = rotation.euler_to_matrix(np.array([tuple(r.Rotate) for r in rigids]))
+        self.assertTrue(np.all(np.einsum('ni,ni->n', frames[:, :, 1], axes) > 0.999))
@@ -0,0 +1,55 @@
+import unittest
+
+from pmx import pmx
+from pmx import prune
+from pmx import saveplan
+
+from builders import make_model as build_model
+from builders import make_vertex
+
+
+def make_model(vertex_count, face_vertices=3):
+    vertices = [make_vertex((i, 0, 0)) for i in range(vertex_count)]
+    model = build_model(vertices, range(face_vertices), (face_vertices,), bones=1)
+    model.Status.Magic = 1
+    return model
+
+
+class TestSavePlan(unittest.TestCase):
+
+    def test_fields(self):
+        model = make_model(4)
+        morph = pmx.PMMorph()
+        morph.Type = 1
+        morph.Offsets = [pmx.PMMorphOffset() for i in range(2)]
+        model.Morphs = [morph]
+        fields = saveplan.index_fields(model)
+        self.assertEqual(fields['Vertex'], 5)
+        self.assertEqual(fields['Bone'], 4 + 2)     # weights, parent + child
+        self.assertEqual(fields['Texture'], 3)
+
+    def test_costs_match_save(self):
+        # growing past 255 vertices widens every vertex index by one byte
+        small = prune.saved_size(make_model(254, 255))
+        record = prune.saved_size(make_model(255, 255)) - small
+        model = make_model(256, 255)
+        cost = model.plan_save().costs['Vertex']
+        self.assertEqual((cost.size, cost.narrower, cost.excess), ('H', 'B', 1))
+        self.assertEqual(prune.saved_size(model) - small - 2 * record, cost.narrower_savings)
+        self.assertEqual(cost.narrower_savings, 255)
+
+    def test_shrink(self):
+        model = make_model(300, 30)
+        plan = model.plan_save()
+        self.assertIsNone(plan.pruned)
+        self.assertEqual(plan.costs['Vertex'].size, 'H')
+
+        plan = model.plan_save(shrink=True)
+        self.assertEqual(plan.pruned.removed_vertices, 270)
+        self.assertEqual(plan.costs['Vertex'].size, 'B')
+        self.assertEqual(plan.costs['Vertex'].widened_bytes, 0)
+
+    def test_shrink_not_needed(self):
+        model = make_model(200, 30)
+        self.assertIsNone(model.plan_save(shrink=True).pruned)
+        self.assertEqual(len(model.Vertices), 200)
@@ -0,0 +1,118 @@
+import unittest
+from pathlib import Path
+
+import mathutils
+import numpy as np
+
+from pmx import pmx
+from pmx import columns
+from pmx import skinning
+
+from builders import make_bone
+from builders import make_vertex
+
+
+def make_model(center=(0, 1, 0)):
+    # bone 0 at the origin, bone 1 at center; vertices around the joint
+    model = pmx.Model()
+    model.Bones = [make_bone(), make_bone(position=center)]
+    c = mathutils.Vector(center)
+    sdef = [0.5, c, c.copy(), c.copy()]
+    up = (0, 1, 0)
+    model.Vertices = [
+        make_vertex((1, 1, 0), [1], Normal=up),
+        make_vertex((1, 1, 0), [0, 1], [0.5], Normal=up),
+        make_vertex((1, 1, 0), [0, 1], sdef, Type=3, Normal=up),
+        make_vertex((1, 1, 0), [0, 1, 0, 0], [0.5, 0.5, 0.0, 0.0], Type=4, Normal=up),
+        make_vertex((0, 3, 0), [0, 1, 1, 0], [0.25, 0.25, 0.5, 0.0], Normal=up),
+    ]
+    return model
+
+
+def rotate_z(angle, center):
+    mat = np.eye(4)
+    mat[:3, :3] = np.array(mathutils.Matrix.Rotation(angle, 3, 'Z'))
+    mat[:3, 3] = np.array(center) - mat[:3, :3] @ np.array(center)
+    return mat
+
+
+def rotated(point, angle, center):
+    return rotate_z(angle, center)[:3, :3] @ (np.array(point) - center) + center
+
+
+class TestSkinning(unittest.TestCase):
+
+    def test_rest_pose(self):
+        model = make_model()
+        positions, normals = model.skin(skinning.rest_matrices(model))
+        np.testing.assert_allclose(positions, columns.position_columns(model.Vertices), atol=1e-12)
+        np.testing.assert_allclose(normals, columns.normal_columns(model.Vertices), atol=1e-12)
+
+    def test_pose(self):
+        center = np.array([0.0, 1.0, 0.0])
+        model = make_model(center)
+        world = skinning.rest_matrices(model)
+        # bone 1 turns 90 degrees about the joint
+        world[1] = rotate_z(np.pi / 2, center) @ world[1]
+        positions, normals = model.skin(world)
+
+        np.testing.assert_allclose(positions[0], rotated((1, 1, 0), np.pi / 2, center), atol=1e-6)
+        # linear blend collapses towards the joint
+        np.testing.assert_allclose(positions[1], [0.5, 1.5, 0], atol=1e-6)
+        # SDEF and QDEF rotate half way instead
+        half = rotated((1, 1, 0), np.pi / 4, center)
+        np.testing.assert_allclose(positions[2], half, atol=1e-6)
+        np.testing.assert_allclose(positions[3], half, atol=1e-6)
+        np.testing.assert_allclose(np.linalg.norm(positions[2] - center), 1.0, atol=1e-6)
+        np.testing.assert_allclose(normals[2], rotated((0, 1, 0), np.pi / 4, np.zeros(3)), atol=1e-6)
+
+        # BDEF4 with a repeated bone: 0.25 rest + 0.75 rotated
+        expected = 0.25 * np.array([0, 3, 0]) + 0.75 * rotated((0, 3, 0), np.pi / 2, center)
+        np.testing.assert_allclose(positions[4], expected, atol=1e-6)
+
+    def test_frames(self):
+        # forward kinematics output poses every frame in one call
+        center = np.array([0.0, 1.0, 0.0])
+        model = make_model(center)
+        rotations = np.tile([0, 0, 0, 1.0], (3, 2, 1))
+        rotations[1, 1] = [0, 0, np.sin(np.pi / 4), np.cos(np.pi / 4)]
+        rotations[2, :] = [0, 0, np.sin(np.pi / 8), np.cos(np.pi / 8)]
+        world = model.forward_kinematics(rotations)
+        positions, normals = model.skin(world)
+        self.assertEqual((positions.shape, normals.shape), ((3, 5, 3), (3, 5, 3)))
+        np.testing.assert_allclose(positions[0], columns.position_columns(model.Vertices), atol=1e-12)
+        np.testing.assert_allclose(positions[1, 0], rotated((1, 1, 0), np.pi / 2, center), atol=1e-6)
+        for frame in range(3):
+            single = model.skin(world[frame])
+            np.testing.assert_allclose(positions[frame], single[0], atol=1e-12)
+            np.testing.assert_allclose(normals[frame], single[1], atol=1e-12)
+
+    def test_translation(self):
+        model = make_model()
+        world = skinning.rest_matrices(model)
+        world[:, :3, 3] += [0, 0, 2]
+        world[1, :3, 3] += [1, 0, 0]
+        positions, _ = model.skin(world)
+        np.testing.assert_allclose(positions[:4, 2], [2, 2, 2, 2], atol=1e-6)
+        np.testing.assert_allclose(positions[:4, 0], [2, 1.5, 1.5, 1.5], atol=1e-6)
+
+    def test_slerp(self):
+        from pmx import rotation
+        a = np.array([0, 0, 0, 1.0])
+        b = np.array([0, 0, np.sin(np.pi / 4), np.cos(np.pi / 4)])
+        mid = rotation.quat_slerp(a, -b, 0.5)
+        np.testing.assert_allclose(mid, [0, 0, np.sin(np.pi / 8), np.cos(np.pi / 8)], atol=1e-12)
+        np.testing.assert_allclose(rotation.quat_slerp(a, a, 0.3), a)
+
+    def test_load_model(self):
+        test_pmx = Path(__file__).parent / 'data' / 'test_01.pmx'
+
+        model = pmx.Model()
+        with test_pmx.open(mode="rb") as f:
+            model.Load(f)
+
+        world = skinning.rest_matrices(model)
+        world[0, :3, 3] += [0, 1, 0]
+        positions, _ = model.skin(world)
+        np.testing.assert_allclose(positions - columns.position_columns(model.Vertices),
+                                   [[0, 1, 0]] * len(model.Vertices), atol=1e-6)
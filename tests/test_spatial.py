@@ -0,0 +1,65 @@
+import unittest
+
+import numpy as np
+
+from pmx.spatial import VertexGrid
+from pmx.spatial import mirror_pairs
+from pmx.spatial import transfer_weights
+
+from builders import make_model as build_model
+from builders import make_vertex
+
+
+def make_model(positions):
+    return build_model([make_vertex(p, [i % 2]) for (i, p) in enumerate(positions)], bones=2)
+
+
+class TestVertexGrid(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.points = rng.normal(size=(2000, 3)) * (4.0, 1.0, 0.01)
+        self.queries = rng.normal(size=(300, 3)) * 5.0
+
+    def test_knn(self):
+        grid = VertexGrid(self.points)
+        indices, distances = grid.knn(self.queries, 4)
+
+        brute = np.linalg.norm(self.queries[:, None] - self.points[None], axis=2)
+        expect = np.sort(brute, axis=1)[:, :4]
+        np.testing.assert_allclose(distances, expect)
+        np.testing.assert_allclose(brute[np.arange(300)[:, None], indices], expect)
+
+    def test_radius(self):
+        grid = VertexGrid(self.points)
+        offsets, indices, distances = grid.radius(self.queries, 0.75)
+
+        brute = np.linalg.norm(self.queries[:, None] - self.points[None], axis=2)
+        for q in range(len(self.queries)):
+            found = indices[offsets[q]:offsets[q + 1]]
+            self.assertEqual(sorted(found.tolist()), np.flatnonzero(brute[q] <= 0.75).tolist())
+            self.assertTrue(np.all(np.diff(distances[offsets[q]:offsets[q + 1]]) >= 0))
+
+    def test_small(self):
+        grid = VertexGrid(np.zeros((2, 3)))
+        indices, distances = grid.knn([[1, 0, 0]], 3)
+        self.assertEqual(sorted(indices[0, :2].tolist()), [0, 1])
+        self.assertEqual(indices[0, 2], -1)
+        self.assertEqual(distances[0].tolist(), [1.0, 1.0, np.inf])
+
+        indices, distances = VertexGrid(np.zeros((0, 3))).knn([[0, 0, 0]])
+        self.assertEqual(indices.tolist(), [[-1]])
+
+
+class TestModelQueries(unittest.TestCase):
+
+    def test_mirror_pairs(self):
+        model = make_model([(1, 0, 0), (-1, 0, 0), (0, 2, 0), (3, 1, 1), (-3, 1, 1.5)])
+        self.assertEqual(mirror_pairs(model).tolist(), [1, 0, 2, -1, -1])
+        self.assertIs(model.vertex_index(), model.vertex_index())
+
+    def test_transfer_weights(self):
+        model = make_model([(0, 0, 0), (10, 0, 0)])
+        types, bones, weights = transfer_weights(model, [(1, 0, 0), (9, 1, 0), (4, 0, 0)])
+        self.assertEqual(bones[:, 0].tolist(), [0, 1, 0])
+        self.assertEqual(weights[:, 0].tolist(), [1.0, 1.0, 1.0])
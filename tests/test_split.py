@@ -0,0 +1,98 @@
+import unittest
+
+import mathutils
+import numpy as np
+
+from pmx import pmx
+from pmx import split
+
+from builders import make_bone
+from builders import make_material
+from builders import make_morph
+from builders import make_pmx
+from builders import make_rigid
+from builders import make_texture
+from builders import make_vertex
+from builders import reload
+
+
+def make_model():
+    # body (bones 0-1, material 0) and hair (bones 2-3, material 1); triangle 1
+    # of material 0 is mostly skinned to the hair, triangle 3 partly
+    model = make_pmx()
+    model.Bones = [make_bone('root'), make_bone('body', parent=0), make_bone('hair', parent=1),
+                   make_bone('tip', parent=2)]
+    bones = [0, 1, 2, 2, 2, 3, 3, 1]
+    model.Vertices = [make_vertex((x, 0, 0), [b]) for (x, b) in enumerate(bones)]
+    model.Faces = [0, 1, 2, 1, 2, 3, 4, 5, 6, 3, 6, 7]
+    model.Materials = [make_material(6, 0, Name='skin'), make_material(6, 1, Name='hair')]
+    model.Textures = [make_texture('skin.png'), make_texture('hair.png')]
+    model.Morphs = [make_morph(1, [0, 5, 7]), make_morph(8, [-1, 1]), make_morph(2, [3])]
+    model.Rigids = [make_rigid(1), make_rigid(3)]
+    joint = pmx.PMJoint()
+    joint.Parent, joint.Child = 0, 1
+    model.Joints = [joint]
+    return model
+
+
+class TestSplit(unittest.TestCase):
+
+    def test_material(self):
+        model = make_model()
+        skin, hair = model.split()
+        self.assertEqual((skin.Name, hair.Name), ('skin', 'hair'))
+        self.assertEqual(len(skin.Bones), 4)
+        self.assertEqual([v.Position.x for v in skin.Vertices], [0, 1, 2, 3])
+        self.assertEqual(skin.Faces, [0, 1, 2, 1, 2, 3])
+        self.assertEqual([v.Position.x for v in hair.Vertices], [3, 4, 5, 6, 7])
+        self.assertEqual(hair.Faces, [1, 2, 3, 0, 3, 4])
+        self.assertEqual(([m.FaceLength for m in hair.Materials], hair.Materials[0].TextureIndex), ([6], 0))
+        self.assertEqual([t.Path for t in hair.Textures], ['hair.png'])
+
+        self.assertEqual([o.Index for o in skin.Morphs[0].Offsets], [0])
+        self.assertEqual([o.Index for o in hair.Morphs[0].Offsets], [2, 4])
+        self.assertEqual([o.Index for o in hair.Morphs[1].Offsets], [-1, 0])
+        self.assertEqual([o.Index for o in skin.Morphs[1].Offsets], [-1])
+        self.assertEqual([o.Index for o in hair.Morphs[2].Offsets], [3])
+        # the source keeps its records
+        self.assertEqual([o.Index for o in model.Morphs[0].Offsets], [0, 5, 7])
+        self.assertEqual(model.Materials[1].TextureIndex, 1)
+
+        # the body rigid is dragged along by the joint to the hair rigid
+        self.assertEqual(([r.Bone for r in skin.Rigids], skin.Joints), ([1], []))
+        self.assertEqual([r.Bone for r in hair.Rigids], [1, 3])
+        self.assertEqual((hair.Joints[0].Parent, hair.Joints[0].Child), (0, 1))
+
+        self.assertEqual(len(reload(hair).Vertices), 5)
+
+    def test_parts_copied(self):
+        model = make_model()
+        model.Morphs[0].Offsets[0].Move = mathutils.Vector((1, 0, 0))
+        skin, hair = model.split()
+        skin.transform(np.eye(3), 2.0)
+        skin.Morphs[0].Offsets[0].Move.x = 5
+        hair.Vertices[0].Bones[0] = 0
+        self.assertEqual([v.Position.x for v in model.Vertices], list(range(8)))
+        self.assertEqual(model.Morphs[0].Offsets[0].Move.x, 1)
+        self.assertEqual(model.Vertices[3].Bones, [2])
+        self.assertEqual(skin.Vertices[3].Bones, [2])
+
+    def test_subtree(self):
+        model = make_model()
+        body, hair = model.split('bone_subtree', roots=[0, 2])
+        self.assertEqual((body.Name, hair.Name), ('root', 'hair'))
+        self.assertEqual(body.Faces, [0, 1, 2])
+        self.assertEqual([v.Position.x for v in hair.Vertices], [1, 2, 3, 4, 5, 6, 7])
+        self.assertEqual([m.FaceLength for m in hair.Materials], [3, 6])
+        self.assertEqual([m.Name for m in body.Materials], ['skin'])
+        self.assertEqual(len(model.split('bone_subtree')), 1)
+        model.Textures = []
+        self.assertEqual([m.TextureIndex for m in model.split()[1].Materials], [-1])
+        with self.assertRaises(ValueError):
+            model.split('texture')
+
+    def test_subtree_parts(self):
+        model = make_model()
+        self.assertEqual(split.subtree_parts(model, [2]).tolist(), [1, 1, 0, 0])
+        model.Bones[0].Parent = 1
+        self.assertEqual(split.subtree_parts(model, [3]).tolist(), [1, 1, 1, 0])
@@ -0,0 +1,94 @@
+import math
+import unittest
+
+import mathutils
+import numpy as np
+
+from pmx import pmx
+from pmx import rotation
+from pmx import transform
+
+from builders import make_bone
+from builders import make_morph
+from builders import make_offset
+from builders import make_rigid
+from builders import make_vertex
+
+
+def make_model():
+    model = pmx.Model()
+
+    sdef = [0.5, mathutils.Vector((1, 0, 0)), mathutils.Vector((0, 1, 0)), mathutils.Vector((0, 0, 1))]
+    model.Vertices = [make_vertex((1, 2, 3), Normal=(0, 0, 1)), make_vertex(bones=[0, 0], weights=sdef, Type=3)]
+    model.Bones = [make_bone('', (0, 1, 0), ToConnectType=0, TailPosition=(0, 0, 2), UseFixedAxis=1,
+                             FixedAxis=(1, 0, 0))]
+    rotate = (math.sin(0.25), 0, 0, math.cos(0.25))
+    model.Morphs = [make_morph(2, [make_offset(0, Move=(1, 0, 0), Rotate=rotate)])]
+    model.Rigids = [make_rigid(Position=(0, 5, 0), Rotate=(0.1, 0.2, 0.3), Size=(1, 2, 3))]
+
+    joint = pmx.PMJoint()
+    joint.PosLowerLimit = mathutils.Vector((-1, 0, 0))
+    joint.PosUpperLimit = mathutils.Vector((2, 0, 0))
+    model.Joints = [joint]
+    return model
+
+
+class TestTransform(unittest.TestCase):
+
+    def test_blender_axes(self):
+        model = make_model()
+        model.transform(transform.BLENDER_MATRIX, transform.BLENDER_SCALE)
+
+        vert = model.Vertices[0]
+        np.testing.assert_allclose(vert.Position, (0.08, 0.24, 0.16))
+        np.testing.assert_allclose(vert.Normal, (0, 1, 0))
+        np.testing.assert_allclose(model.Vertices[1].Weights[2], (0, 0, 0.08))
+
+        bone = model.Bones[0]
+        np.testing.assert_allclose(bone.Position, (0, 0, 0.08))
+        np.testing.assert_allclose(bone.TailPosition, (0, 0.16, 0))
+        np.testing.assert_allclose(bone.FixedAxis, (1, 0, 0))
+
+        # xzy is a reflection: the frame is folded so the rigid stays a rotation
+        rigid = model.Rigids[0]
+        before = rotation.euler_to_matrix((0.1, 0.2, 0.3))
+        after = rotation.euler_to_matrix(tuple(rigid.Rotate))
+        np.testing.assert_allclose(after, -transform.BLENDER_MATRIX @ before, atol=1e-6)
+        np.testing.assert_allclose(rigid.Size, (0.08, 0.16, 0.24))
+
+        joint = model.Joints[0]
+        np.testing.assert_allclose(joint.PosLowerLimit, (-0.16, 0, 0))
+        np.testing.assert_allclose(joint.PosUpperLimit, (0.08, 0, 0))
+
+    def test_rotation(self):
+        model = make_model()
+        rot = rotation.euler_to_matrix((0.0, math.pi / 2, 0.0))
+        model.transform(np.block([[rot, np.array([[0], [0], [1]])], [np.zeros((1, 3)), np.ones((1, 1))]]))
+
+        np.testing.assert_allclose(model.Vertices[0].Position, (3, 2, 0), atol=1e-6)
+        np.testing.assert_allclose(model.Vertices[0].Normal, (1, 0, 0), atol=1e-6)
+
+        offset = model.Morphs[0].Offsets[0]
+        np.testing.assert_allclose(offset.Move, (0, 0, -1), atol=1e-6)
+        quat = rotation.quat_to_matrix(tuple(offset.Rotate))
+        base = rotation.quat_to_matrix((math.sin(0.25), 0, 0, math.cos(0.25)))
+        np.testing.assert_allclose(quat, rot @ base @ rot.T, atol=1e-6)
+
+        rigid = model.Rigids[0]
+        np.testing.assert_allclose(rigid.Position, (0, 5, 1), atol=1e-6)
+        np.testing.assert_allclose(rotation.euler_to_matrix(tuple(rigid.Rotate)),
+                                   rot @ rotation.euler_to_matrix((0.1, 0.2, 0.3)), atol=1e-6)
+
+    def test_round_trip(self):
+        model = make_model()
+        matrix = rotation.euler_to_matrix((0.3, -0.7, 1.1))
+        model.transform(matrix, 2.0)
+        model.transform(matrix.T, 0.5)
+
+        np.testing.assert_allclose(model.Vertices[0].Position, (1, 2, 3), atol=1e-6)
+        np.testing.assert_allclose(model.Rigids[0].Rotate, (0.1, 0.2, 0.3), atol=1e-6)
+        np.testing.assert_allclose(model.Rigids[0].Size, (1, 2, 3), atol=1e-6)
+
+    def test_bad_matrix(self):
+        with self.assertRaises(ValueError):
+            pmx.Model().transform(np.eye(2))
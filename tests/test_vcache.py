@@ -0,0 +1,98 @@
+import unittest
+
+import numpy as np
+
+from pmx import pmx
+from pmx import vcache
+
+from builders import make_material
+from builders import make_morph
+from builders import make_offset
+from builders import make_vertex
+
+
+def make_grid_model(size, seed=0):
+    model = pmx.Model()
+    model.Vertices = [make_vertex((x, y, 0)) for y in range(size + 1) for x in range(size + 1)]
+
+    faces = []
+    for y in range(size):
+        for x in range(size):
+            v = y * (size + 1) + x
+            faces.append((v, v + 1, v + size + 1))
+            faces.append((v + 1, v + size + 2, v + size + 1))
+    faces = np.array(faces)
+    if seed is not None:
+        faces = faces[np.random.default_rng(seed).permutation(len(faces))]
+    model.Faces = faces.ravel().tolist()
+
+    half = len(faces) // 2 * 3
+    model.Materials = [make_material(half), make_material(len(model.Faces) - half)]
+    model.Morphs = [make_morph(1, [make_offset(i, Move=(i, 0, 0)) for i in (0, 5, size)])]
+    return model
+
+
+def triangle_positions(model, faces):
+    return sorted(tuple(tuple(model.Vertices[v].Position) for v in tri) for tri in faces)
+
+
+class TestVertexCache(unittest.TestCase):
+
+    def test_acmr(self):
+        self.assertEqual(vcache.acmr(np.array([[0, 1, 2], [2, 1, 3]]), 4), 2.0)
+        self.assertEqual(vcache.acmr(np.zeros((0, 3))), 0.0)
+        # the hit on 0 in the third triangle keeps it cached (LRU, not FIFO)
+        self.assertEqual(vcache.acmr(np.array([[0, 1, 2], [3, 4, 5], [0, 6, 7], [0, 1, 8]]), 6), 2.5)
+
+    def test_optimize(self):
+        model = make_grid_model(24)
+        before = model.material_ranges().split(model.face_array())
+        before = [triangle_positions(model, part) for part in before]
+
+        report = model.optimize_vertex_cache(16)
+        self.assertLess(report.acmr_after, report.acmr_before)
+        self.assertLess(report.acmr_after, 0.5 * report.acmr_before)
+        self.assertEqual(len(report.material_acmr_after), 2)
+
+        # same triangles per material, vertices renumbered by first use
+        after = model.material_ranges().split(model.face_array())
+        self.assertEqual([triangle_positions(model, part) for part in after], before)
+        flat = model.face_array().ravel()
+        _, first = np.unique(flat, return_index=True)
+        self.assertEqual(flat[np.sort(first)].tolist(), list(range(len(model.Vertices))))
+
+        # morph offsets follow their vertex
+        for offset in model.Morphs[0].Offsets:
+            self.assertEqual(model.Vertices[offset.Index].Position.x, offset.Move.x)
+            self.assertEqual(model.Vertices[offset.Index].Position.y, 0)
+
+    def test_never_worse(self):
+        # rows in scanline order beat the optimiser's order and are kept
+        model = make_grid_model(8, seed=None)
+        before = [[tuple(model.Vertices[v].Position) for v in tri] for tri in model.face_array()]
+        report = model.optimize_vertex_cache()
+        self.assertEqual(report.acmr_after, report.acmr_before)
+        self.assertEqual(report.material_acmr_after, report.material_acmr_before)
+        after = [[tuple(model.Vertices[v].Position) for v in tri] for tri in model.face_array()]
+        self.assertEqual(after, before)
+
+        # a second pass never undoes the first
+        model = make_grid_model(24)
+        first = model.optimize_vertex_cache(16)
+        second = model.optimize_vertex_cache(16)
+        self.assertLessEqual(second.acmr_after, second.acmr_before)
+        self.assertAlmostEqual(second.acmr_before, first.acmr_after)
+
+    def test_repeated_offset(self):
+        # repeated offsets of one vertex add up and survive the reorder
+        model = make_grid_model(8)
+        model.Morphs[0].Offsets.append(make_offset(5, Move=(0, 2, 0)))
+
+        def morphed():
+            positions = np.array([tuple(v.Position) for v in model.Vertices])
+            return (positions + model.evaluate_morphs([1.0]).vertex)[np.lexsort(positions.T)]
+
+        before = morphed()
+        model.optimize_vertex_cache(16)
+        self.assertEqual(len(model.Morphs[0].Offsets), 4)
+        self.assertTrue(np.allclose(morphed(), before))
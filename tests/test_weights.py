@@ -0,0 +1,80 @@
+import unittest
+
+import mathutils
+import numpy as np
+
+from pmx import pmx
+from pmx import weights
+
+from builders import make_vertex
+
+
+def make_model():
+    model = pmx.Model()
+    model.Bones = [pmx.PMBone() for i in range(5)]
+    sdef = [0.75, mathutils.Vector((1, 2, 3)), mathutils.Vector((0, 0, 0)), mathutils.Vector((0, 0, 0))]
+    model.Vertices = [
+        make_vertex(bones=[1, 2, 3, 4], weights=[0.2, 0.2, 0.2, 0.2]),       # sums to 0.8
+        make_vertex(bones=[1, 2, 3, 4], weights=[0.6, 0.4, 0.0, 0.0]),       # really BDEF2
+        make_vertex(bones=[3, 3, 1, 0], weights=[0.5, 0.5, 0.00001, 0.0]),   # duplicate bone, tiny weight
+        make_vertex(bones=[2, 4], weights=[1.0]),                            # really BDEF1
+        make_vertex(bones=[2, 4], weights=sdef, Type=3),                     # SDEF stays SDEF
+        make_vertex(bones=[0, 1, 2, 3], weights=[0.1, 0.2, 0.3, 0.4], Type=4),  # QDEF
+        make_vertex(bones=[2]),
+    ]
+    return model
+
+
+class TestNormalizeWeights(unittest.TestCase):
+
+    def test_normalize(self):
+        model = make_model()
+        report = model.normalize_weights()
+        self.assertEqual(report.changed, 5)  # QDEF is reordered strongest first
+        self.assertEqual(report.types_before, [1, 1, 3, 1, 1])
+        self.assertEqual(report.types_after, [3, 1, 1, 1, 1])
+        # BDEF4 -> BDEF2 saves 2 bone bytes and 3 floats, BDEF4/BDEF2 -> BDEF1 more
+        self.assertEqual(report.bytes_saved, 14 + 19 + 5)
+
+        verts = model.Vertices
+        self.assertEqual((verts[0].Type, verts[0].Bones), (2, [1, 2, 3, 4]))
+        np.testing.assert_allclose(verts[0].Weights, [0.25] * 4)
+        self.assertEqual((verts[1].Type, verts[1].Bones), (1, [1, 2]))
+        self.assertAlmostEqual(verts[1].Weights[0], 0.6)
+        self.assertEqual((verts[2].Type, verts[2].Bones, verts[2].Weights), (0, [3], []))
+        self.assertEqual((verts[3].Type, verts[3].Bones, verts[3].Weights), (0, [2], []))
+        self.assertEqual((verts[4].Type, verts[4].Bones, verts[4].Weights[0]), (3, [2, 4], 0.75))
+        self.assertEqual(tuple(verts[4].Weights[1]), (1, 2, 3))
+        self.assertEqual((verts[5].Type, verts[5].Bones), (4, [3, 2, 1, 0]))
+
+    def test_max_influences(self):
+        model = make_model()
+        model.normalize_weights(max_influences=2)
+        qdef = model.Vertices[5]
+        self.assertEqual((qdef.Type, qdef.Bones[:2]), (4, [3, 2]))
+        np.testing.assert_allclose(qdef.Weights, [4 / 7, 3 / 7, 0, 0])
+        self.assertEqual(model.Vertices[0].Type, 1)
+
+        model.normalize_weights(max_influences=1)
+        self.assertEqual([v.Type for v in model.Vertices], [0] * 7)
+        self.assertEqual(model.Vertices[4].Bones, [2])
+
+        with self.assertRaises(ValueError):
+            model.normalize_weights(max_influences=5)
+
+    def test_columns(self):
+        types = np.array([2, 1])
+        bones = np.array([[0, 1, 2, 3], [0, 1, -1, -1]])
+        rows = np.array([[0.0, 0.0, 0.0, 0.0], [0.00001, 0.00002, 0.0, 0.0]])
+        new_types, new_bones, new_weights = weights.normalize_columns(types, bones, rows)
+        # everything pruned: the strongest original influence takes the vertex
+        self.assertEqual(new_types.tolist(), [0, 0])
+        self.assertEqual(new_bones[:, 0].tolist(), [0, 1])
+        self.assertEqual(new_weights[:, 0].tolist(), [1.0, 1.0])
+
+    def test_bone_vertex_index(self):
+        model = make_model()
+        model.bone_vertex_index()
+        model.normalize_weights()
+        verts, _ = model.bone_vertex_index().lookup(3)
+        self.assertEqual(verts.tolist(), [0, 2, 5])
@@ -0,0 +1,75 @@
+import unittest
+
+import mathutils
+import numpy as np
+
+from pmx import pmx
+from pmx import weld
+
+from builders import make_material
+from builders import make_morph
+from builders import make_offset
+from builders import make_vertex as build_vertex
+
+
+def make_vertex(position, uv=(0, 0), bone=0):
+    return build_vertex(position, [bone], Normal=(0, 0, 1), UV=tuple(uv))
+
+
+def make_model():
+    # two quads split along x = 1, the shared edge duplicated per material
+    model = pmx.Model()
+    model.Bones = [pmx.PMBone(), pmx.PMBone()]
+    model.Vertices = [
+        make_vertex((0, 0, 0)), make_vertex((1, 0, 0)), make_vertex((1, 1, 0)), make_vertex((0, 1, 0)),
+        make_vertex((1, 0, 1e-7)), make_vertex((2, 0, 0)), make_vertex((2, 1, 0)), make_vertex((1, 1, 0)),
+        make_vertex((0, 0, 0), uv=(0.5, 0)),  # UV seam, kept
+        make_vertex((0, 1, 0), bone=1),       # other bone, kept
+    ]
+    model.Faces = [0, 1, 2, 0, 2, 3, 4, 5, 6, 4, 6, 7, 8, 1, 9]
+    model.Materials = [make_material(6), make_material(9)]
+    model.Morphs = [make_morph(1, [make_offset(i, Move=(0, 0, 1)) for i in (2, 7)])]
+
+    soft = pmx.PMSoftBody()
+    soft.Pins = [1, 4, 5]
+    model.SoftBodies = [soft]
+    return model
+
+
+class TestWeld(unittest.TestCase):
+
+    def test_weld(self):
+        model = make_model()
+        report = model.weld()
+        self.assertEqual((report.vertices_before, report.vertices_after), (10, 8))
+        self.assertEqual(report.material_removed, [0, 1])
+
+        positions = [tuple(v.Position) for v in model.Vertices]
+        self.assertEqual(positions[:6], [(0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0), (2, 0, 0), (2, 1, 0)])
+        self.assertEqual(model.Faces, [0, 1, 2, 0, 2, 3, 1, 4, 5, 1, 5, 2, 6, 1, 7])
+        self.assertEqual([o.Index for o in model.Morphs[0].Offsets], [2])
+        self.assertEqual(model.SoftBodies[0].Pins, [1, 4])
+
+    def test_morph_keeps_vertex(self):
+        model = make_model()
+        model.Morphs[0].Offsets[1].Move = mathutils.Vector((0, 0, 2))
+        report = model.weld()
+        self.assertEqual(report.removed_vertices, 1)
+        self.assertEqual(sorted(o.Index for o in model.Morphs[0].Offsets), [2, 6])
+
+    def test_repeated_offsets(self):
+        # both copies of vertex 2 list their offset twice: summed once, not per copy
+        model = make_model()
+        model.Morphs[0].Offsets += [make_offset(i, Move=(0, 0, 1)) for i in (2, 7)]
+        model.weld()
+        self.assertEqual([(o.Index, tuple(o.Move)) for o in model.Morphs[0].Offsets], [(2, (0, 0, 2))])
+
+    def test_exact(self):
+        model = make_model()
+        # vertex 4 is 1e-7 away from vertex 1
+        self.assertEqual(model.weld(0.0).removed_vertices, 1)
+
+    def test_weld_map(self):
+        keys = np.array([[3, 1], [0, 0], [3, 1], [0, 0], [2, 2]])
+        self.assertEqual(weld.weld_map(keys).tolist(), [0, 1, 0, 1, 2])
+        self.assertEqual(weld.quantize([-0.0], 0).tolist(), weld.quantize([0.0], 0).tolist())